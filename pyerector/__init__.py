@@ -70,7 +70,8 @@ from .targets import Target, All, Build, Clean, Compile, Default, Dist, Help, \
                      Init, InitDirs, InitVCS, Packaging, Test, Testonly
 from .iterators import FileSet, StaticIterator, FileIterator, FileList, \
                        DirList, FileMapper, BasenameMapper, MergeMapper, \
-                       IdentityMapper, Uptodate
+                       IdentityMapper, Uptodate, Shard, ZipIterator, \
+                       TarIterator
 from .variables import FileVariable, V, Variable, VariableSet
 
 import pyerector.tasks
@@ -104,6 +105,7 @@ __all__ = [
     'Echo',
     'Egg',
     'EncodeVar',
+    'Filter',
     'HashGen',
     'Java',
     'Mkdir',
@@ -144,12 +146,20 @@ __all__ = [
     'FileIterator',
     'FileList',
     'DirList',
+    'Shard',
+    'ZipIterator',
+    'TarIterator',
     # mappers
     'FileMapper',
     'BasenameMapper',
     'IdentityMapper',
     'MergeMapper',
     'Uptodate',
+
+    # filters
+    'LineEndingFilter',
+    'ShebangFilter',
+    'TokenFilter',
 ]
 
 Initialization.start()
@@ -157,8 +167,10 @@ Initialization.start()
 # pylint: disable=wrong-import-position
 from .tasks import Task
 # pylint: disable=wrong-import-position
-from .tasks import Chmod, Copy, CopyTree, Echo, Egg, EncodeVar, HashGen, \
-                   Java, Mkdir, PyCompile, Remove, Scp, Shebang, Spawn, \
-                   SubPyErector, Ssh, Symlink, Tar, Tokenize, Touch, \
+from .tasks import Chmod, Copy, CopyTree, Echo, Egg, EncodeVar, Filter, \
+                   HashGen, Java, Mkdir, PyCompile, Remove, Scp, Shebang, \
+                   Spawn, SubPyErector, Ssh, Symlink, Tar, Tokenize, Touch, \
                    Unittest, Untar, Unzip, Zip
+# pylint: disable=wrong-import-position
+from .tasks.filter import LineEndingFilter, ShebangFilter, TokenFilter
 
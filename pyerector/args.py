@@ -87,9 +87,10 @@ the merge is performed based on the argument name."""
         # we take a copy of the other so self takes precedence
         dmap = other.map.copy()
         dmap.update(self.map)
-        # handle corner case
+        # handle corner case: only one List, ours (if the same name, the
+        # update above has already replaced the other's)
         if self.list is not None and other.list is not None and \
-           self.list != other.list:
+           self.list.name != other.list.name:
             del dmap[other.list.name]
         return self.__class__(*dmap.values())
 
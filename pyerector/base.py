@@ -323,19 +323,52 @@ Otherwise log an exception and raise Abort error.
 
 
 class Parallel(Sequential):
-    """Class to concurrently call Target or Task instances."""
+    """Class to concurrently call Target or Task instances.
+With files=<Iterator or sequence>, each task is instead called once per
+shard of the files, shards=<N> (default pyerector.pool.size) at a time,
+using strategy='hash' or 'size' (see iterators.Shard):
+    Parallel(PyCompile(), files=FileSet('build', pattern='*.py',
+                                        recurse=True), shards=4)"""
+    files = None
+    shards = None
+    strategy = 'hash'
+
+    def get_calls(self):
+        """Return the (name, object, args) to be called in threads."""
+        # import here to avoid recursive references
+        # pylint: disable=cyclic-import
+        from .iterators import Iterator, FileIterator, Shard
+        files = self.get_kwarg('files', (Iterator, tuple, list))
+        calls = []
+        for item in self:
+            obj = self.retrieve(item)
+            if obj is None:  # do not process Variable instances
+                continue
+            elif files is None:
+                calls.append((str(obj), obj, ()))
+                continue
+            if not isinstance(files, Iterator):
+                files = FileIterator(*files)
+            count = self.get_kwarg('shards', int) or \
+                int(V['pyerector.pool.size'])
+            strategy = self.get_kwarg('strategy', str)
+            for index in range(count):
+                shard = Shard(files, index, count, strategy=strategy)
+                calls.append(
+                    ('%s[%d/%d]' % (obj, index, count), obj, (shard,))
+                )
+        return calls
+
     def __call__(self, *args):
         """Call the items in the list, in separate threads."""
         parent = get_current_stack()[-1]
         bname = '%s.' % parent
         threads = []
-        for item in self:
-            obj = self.retrieve(item)
-            if obj is None:  # do not process Variable instances
-                continue
+        for name, obj, callargs in self.get_calls():
             thread = PyThread(
-                name=bname + str(obj),
+                name=bname + name,
                 target=obj,
+                args=callargs,
             )
             threads.append(thread)
         for thread in threads:
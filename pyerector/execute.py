@@ -10,16 +10,22 @@ thread which called this one.  Operations are based on that stack along
 with the ancesters'.
 
 Also defines a specialized version of threading.Thread which creates a
-new execution stack based on the parent's.
+new execution stack based on the parent's, and a pool of such threads for
+tasks to spread their work over.
 """
 
 import threading
+try:
+    from queue import Queue
+except ImportError:
+    from Queue import Queue
 from .exception import Abort, Error
 from .variables import V
 
 __all__ = [
     'get_current_stack',
     'PyThread',
+    'WorkerPool',
 ]
 
 
@@ -41,10 +47,16 @@ For example:
     s1[0], s1[-1] == 'a', 'd'
     tuple(s1) == ('a', 'b', 'c', 'd')
     s1.pop() == 'd'
+
+Each frame can be pushed with a context, the state of that invocation,
+which is found by context() from this stack or the callers' stacks:
+    s0.push(task, {'n': 1})
+    s1.context(task) == {'n': 1}
 """
     def __init__(self, parent=None):
         super(ExecStack, self).__init__()
         self.stack = []
+        self.contexts = []
         self.pos = None
         self.parent = parent
         self.lock = threading.RLock()
@@ -52,16 +64,29 @@ For example:
     def __repr__(self):
         return '%s(%s)' % (self.__class__.__name__, self.stack)
 
-    def push(self, frame):
-        """Add an item to the stack."""
+    def push(self, frame, context=None):
+        """Add an item to the stack, with the context of its invocation."""
         with self.lock:
             self.stack.append(frame)
+            self.contexts.append(context)
 
     def pop(self):
         """Remove an item from the stack and return it."""
         with self.lock:
+            self.contexts.pop()
             return self.stack.pop()
 
+    def context(self, frame):
+        """Return the context of the innermost invocation of frame,
+in this stack or the ancestors'.  Raise KeyError if it is not running."""
+        with self.lock:
+            for index in range(len(self.stack) - 1, -1, -1):
+                if self.stack[index] is frame:
+                    return self.contexts[index]
+        if isinstance(self.parent, ExecStack):
+            return self.parent.context(frame)
+        raise KeyError(frame)
+
     def __len__(self):
         with self.lock:
             if isinstance(self.parent, ExecStack):
@@ -152,6 +177,104 @@ are caught and displayed using getLogger('pyerector.execute').exception.
             logger.debug('PyThread.limiter.released')
 
 
+class WorkerPool(object):
+    """A fixed number of threads, with execution stacks based on the
+creating thread's, to call a function over many items.  The threads do not
+take from the PyThread limiter, so tasks already running in a PyThread can
+use them.  The size defaults to the "pyerector.pool.size" Variable.
+    with WorkerPool(4) as pool:
+        for result in pool.imap(function, items):
+            ...
+"""
+    def __init__(self, size=None):
+        if size is None:
+            size = int(V['pyerector.pool.size'])
+        self.size = max(1, int(size))
+        self.threads = []
+        self.jobs = Queue()
+
+    def __enter__(self):
+        parentstack = get_current_stack()
+        for count in range(self.size):
+            thread = threading.Thread(target=self.work,
+                                      name='WorkerPool-%d' % count)
+            thread.daemon = True
+            thread.stack = ExecStack(parentstack)
+            self.threads.append(thread)
+            thread.start()
+        return self
+
+    def __exit__(self, etype, evalue, etb):
+        for thread in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join()
+        del self.threads[:]
+
+    def work(self):
+        """Call the function on each job, and put the result (or the
+exception) on the job's queue."""
+        import sys
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            function, item, index, results = job
+            try:
+                results.put((index, True, function(item)))
+            except Exception:
+                results.put((index, False, sys.exc_info()[1]))
+
+    def submit(self, function, item):
+        """Queue function(item) and return a callable that waits for, and
+returns, the result (or raises the exception); call it once."""
+        if not self.threads:
+            raise RuntimeError('WorkerPool used outside of a "with" block')
+        results = Queue(1)
+        self.jobs.put((function, item, 0, results))
+
+        def result():
+            """Wait for the result."""
+            succeeded, value = results.get()[1:]
+            if not succeeded:
+                raise value
+            return value
+        return result
+
+    def imap(self, function, iterable, window=None):
+        """Yield function(item) for each item, in order.  At most window
+(default twice the size) items are queued at once.  An exception raised by
+the function is raised here, when its result is reached."""
+        if not self.threads:
+            raise RuntimeError('WorkerPool used outside of a "with" block')
+        if window is None:
+            window = self.size * 2
+        results = Queue()
+        done = {}
+        items = iter(iterable)
+        sent = received = 0
+        exhausted = False
+        while True:
+            while not exhausted and sent - received < window:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                self.jobs.put((function, item, sent, results))
+                sent += 1
+            if received == sent:
+                break
+            while received not in done:
+                index, succeeded, value = results.get()
+                done[index] = (succeeded, value)
+            succeeded, value = done.pop(received)
+            received += 1
+            if not succeeded:
+                raise value
+            yield value
+
+
 class Initialization(object):
     """Register initialization routines and ensure that they are only
 called once.  Otherwise, reimports of pyerector may result in overwriting
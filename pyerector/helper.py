@@ -8,23 +8,29 @@ certain file (like .svn, .hg, .git) or patterns (*.pyc, *~).
 normjoin runs os.path.normpath(os.path.join(*args), as a convenience
 routine.
 
-The Subcommand class handles spawning processes through subprocess.Popen,
-but with a bit more backend control (like terminating the process when
-the object is deleted).
+The Subcommand class handles spawning processes through os.posix_spawn or
+subprocess.Popen, but with a bit more backend control (like terminating the
+process when the object is deleted).
 
 Initialize the logging system, including setting up module specific
 formatters.  It does not change the root ('') logger.
 """
 
+from collections import deque
+import errno
+import io
 import logging
 import os
+import signal
 from sys import exc_info
+import threading
+import time
 import traceback
 import warnings
 
 from .exception import Error
 from .execute import get_current_stack, Initialization
-from .path import Path
+from .path import Path, modified
 
 __all__ = [
     'Exclusions',
@@ -46,7 +52,12 @@ def normjoin(*args):
 def newer(file1, file2, logger=None):
     """Return true if file2 is newer than file1.  Return True if
 file1 does not exist, return False is file2 does not exist."""
-    time1, time2 = Path(file1).mtime, Path(file2).mtime
+    # Paths are kept, as they may not be in the file system (ArchiveMember)
+    if not isinstance(file1, Path):
+        file1 = Path(file1)
+    if not isinstance(file2, Path):
+        file2 = Path(file2)
+    time1, time2 = file1.mtime, file2.mtime
     if logger:
         logger.debug('newer(%s, %s) => (%s, %s)', file1, file2, time1, time2)
     if time1 is None:
@@ -121,17 +132,38 @@ in the set."""
 
 # pylint: disable=too-many-instance-attributes
 class Subcommand(object):
-    """Handles some of the subprocess details."""
+    """Handles some of the subprocess details.  The process is started by
+os.posix_spawn where it can be (in the current directory, with files or
+pipes for the standard streams), otherwise by subprocess.Popen.  The
+pathnames of programs found in PATH, and the environments made from os.environ
+and env, are kept for the next process.  After it finishes, rusage holds the
+resources the process used (ru_utime, ru_stime, ru_maxrss), where
+os.wait4 is available.
+While waiting, the pipes (stdout or stderr of PIPE) are read at the same
+time, so the process cannot block writing to them; then stdout and stderr
+are file objects of what was read, only the last limit bytes of each if
+limit is given.  Either can instead be a callable, given each line (decoded,
+without its newline) as it is read, e.g. stderr=logger.warning.  With a
+timeout (in seconds), the process is started in a new process group, all
+of which is killed, and Error('ETIMEDOUT', ...) raised, if it has not
+finished, and closed its pipes, in that time."""
     try:
         import subprocess
     except ImportError:
         subprocess = None
         raise NotImplementedError("Earlier than Python 2.6 is unsupported")
     PIPE = subprocess.PIPE
+    # enough of the end of the errors for a message
+    ERRLIMIT = 1 << 16
+    # program pathnames, by (name, PATH)
+    programs = {}
+    # environments, by the overlay, with the os.environ they were made from
+    environments = {}
 
     # pylint: disable=too-many-arguments
     def __init__(self, cmd, wdir=os.curdir, env=None, wait=True,
-                 stdin=None, stdout=None, stderr=None):
+                 stdin=None, stdout=None, stderr=None, timeout=None,
+                 limit=None):
         if env is None:
             env = {}
         assert isinstance(cmd, tuple), "must supply tuple as command"
@@ -147,8 +179,19 @@ class Subcommand(object):
         self.outfile = stdout
         self.errfile = stderr
         self.stdin = self.stdout = self.stderr = None
+        self.timeout = timeout
+        self.limit = limit
+        self.callbacks = dict(
+            (name, afile) for name, afile in (('stdout', stdout),
+                                              ('stderr', stderr))
+            if callable(afile) and not hasattr(afile, 'write')
+        )
+        self.readers = {}
         self.returncode = None
+        self.rusage = None
         self.call_subprocess()
+        if self.callbacks:  # stream the lines from the start
+            self.drain(*self.callbacks)
         if wait:
             self.wait()
 
@@ -167,7 +210,7 @@ class Subcommand(object):
                 pass
             else:
                 self.proc.kill()
-            self.proc.wait()
+            self.reap()
             self.proc = None
 
     def close(self):
@@ -202,22 +245,127 @@ class Subcommand(object):
         """Return True if the process has finished, setting returncode
 if applicable."""
         assert self.proc is not None, 'subprocess not spawned'
-        returncode = self.proc.poll()
+        returncode = self.reap(block=False)
         if returncode is not None:
             self.returncode = returncode
         return self.returncode is not None
 
     def wait(self):
-        """Wait for the process to complete, and return the exit status."""
+        """Wait for the process to complete, reading its pipes, and return
+the exit status."""
         assert self.proc is not None, 'subprocess not spawned'
         if self.stdin:
             self.stdin.close()
-        self.returncode = self.proc.wait()
+        self.drain('stdout', 'stderr')
+        if self.timeout is None:
+            self.returncode = self.reap()
+            for reader in self.readers.values():
+                reader.join()
+        else:
+            deadline = time.time() + self.timeout
+            delay = 0.0005
+            while self.reap(block=False) is None or \
+                    not all(reader.join(0) for reader in self.readers.values()):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.killgroup()
+                    self.returncode = self.reap()
+                    for reader in self.readers.values():
+                        reader.join(1)  # the pipes close with the group
+                    self.collect()
+                    modified()
+                    raise Error('ETIMEDOUT', 'Program timed out after %s '
+                                'seconds: %s' % (self.timeout, self.cmd[0]))
+                delay = min(delay * 2, remaining, 0.05)
+                time.sleep(delay)
+            self.returncode = self.reap()
+        self.collect()
+        # the program could have changed anything
+        modified()
         return self.returncode
 
+    def drain(self, *names):
+        """Start reading the named pipes ('stdout', 'stderr') of the
+process, those not read already."""
+        for name in names:
+            pipe = getattr(self.proc, name, None)
+            if pipe is not None and name not in self.readers and \
+                    getattr(self, name) is pipe:
+                self.readers[name] = PipeReader(
+                    pipe, callback=self.callbacks.get(name), limit=self.limit
+                )
+
+    def collect(self):
+        """Replace the pipes that were read with what was read."""
+        readers, self.readers = self.readers, {}
+        error = None
+        for name in sorted(readers):
+            reader = readers[name]
+            if reader.join(0) and reader.error is not None:
+                error = error or reader.error
+            if reader.callback is not None:
+                setattr(self, name, None)
+            else:
+                setattr(self, name, io.BytesIO(reader.getvalue()))
+                if reader.discarded:
+                    logging.getLogger('pyerector.execute').debug(
+                        '%s: kept the last %d bytes of %s, of %d',
+                        self.cmd[0], self.limit, name,
+                        self.limit + reader.discarded
+                    )
+        if error is not None:
+            raise error
+
+    def killgroup(self):
+        """Kill the process, and the others of its process group."""
+        try:
+            if hasattr(os, 'killpg'):
+                os.killpg(self.proc.pid, signal.SIGKILL)
+            else:
+                self.proc.kill()
+        except OSError:  # gone already
+            pass
+
+    def reap(self, block=True):
+        """Return the exit status of the process, or None if it is still
+running (and not block), setting rusage where os.wait4 is available."""
+        proc = self.proc
+        if proc.returncode is not None:
+            return proc.returncode
+        elif not hasattr(os, 'wait4'):
+            return proc.wait() if block else proc.poll()
+        while True:
+            try:
+                pid, status, rusage = os.wait4(
+                    proc.pid, 0 if block else os.WNOHANG
+                )
+            except OSError:
+                exc = exc_info()[1]
+                if exc.errno == errno.EINTR:
+                    continue
+                elif exc.errno == errno.ECHILD:  # collected elsewhere
+                    return proc.wait() if block else proc.poll()
+                raise
+            break
+        if pid == 0:
+            return None
+        if os.WIFSIGNALED(status):
+            proc.returncode = -os.WTERMSIG(status)
+        else:
+            proc.returncode = os.WEXITSTATUS(status)
+        self.rusage = rusage
+        logger = logging.getLogger('pyerector.execute')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('%s: user %.3fs, sys %.3fs, maxrss %d',
+                         self.cmd[0], rusage.ru_utime, rusage.ru_stime,
+                         rusage.ru_maxrss)
+        return proc.returncode
+
     def handle_pipe(self, afile, methodname, mode, alt=None):
         """Return a file object based on what type the file argument is."""
-        if alt is not None and afile == alt:
+        if callable(afile) and not hasattr(afile, methodname):  # line callback
+            return self.PIPE
+        elif alt is not None and afile == alt:
             return alt
         elif hasattr(afile, methodname):  # file-line object
             return afile
@@ -230,32 +378,101 @@ if applicable."""
         else:
             return None
 
+    @classmethod
+    def which(cls, name, path):
+        """Return the pathname of the program found in the path (a PATH
+value), or the name if it has a directory, is not found there or the path
+has a relative directory (os.posix_spawn does not search the PATH, so only
+a name with a directory is spawned that way)."""
+        if os.name != 'posix' or os.sep in name:
+            return name
+        key = (name, path)
+        try:
+            return cls.programs[key]
+        except KeyError:
+            pass
+        for dirname in path.split(os.pathsep):
+            if not os.path.isabs(dirname):  # depends on the wdir
+                return name
+            pathname = os.path.join(dirname, name)
+            if os.path.isfile(pathname) and os.access(pathname, os.X_OK):
+                cls.programs[key] = pathname
+                return pathname
+        return name
+
+    @classmethod
+    def environment(cls, env):
+        """Return os.environ updated with env (the values as str), or None
+if there is nothing to add.  It is kept for the same env while os.environ
+has not changed."""
+        if not env:
+            return None
+        overlay = tuple(sorted((str(n), str(env[n])) for n in env))
+        # the mapping behind os.environ, cheap to compare
+        current = getattr(os.environ, '_data', None)
+        if current is None:
+            current = getattr(os.environ, 'data', None)
+        cached = cls.environments.get(overlay)
+        if cached is not None and current is not None and \
+                cached[0] == current:
+            return cached[1]
+        realenv = os.environ.copy()
+        realenv.update(overlay)
+        if current is not None:
+            cls.environments[overlay] = (dict(current), realenv)
+        return realenv
+
+    def can_spawn(self, *files):
+        """Return True if os.posix_spawn can start the process: in the
+current directory, with nothing, a pipe or a file for each of the files."""
+        if not hasattr(os, 'posix_spawn') or \
+                not isinstance(self.cmd, tuple):
+            return False
+        for afile in files:
+            if afile is not None and afile != self.PIPE and \
+                    not hasattr(afile, 'fileno'):
+                return False
+        return os.path.abspath(str(self.wdir)) == os.getcwd()
+
     def call_subprocess(self):
-        """Call subprocess.Popen and handle the I/O."""
+        """Start the process and handle the I/O."""
         from subprocess import Popen
-        realenv = os.environ.copy()
-        # convert env to strings
-        env = dict([(n, str(self.env[n])) for n in self.env])
-        realenv.update(env)
+        env = self.environment(self.env)
         ifile = self.handle_pipe(self.infile, 'read', 'r')
         ofile = self.handle_pipe(self.outfile, 'write', 'w')
         efile = self.handle_pipe(self.errfile, 'write', 'w', alt=self.outfile)
         (self.stdin, self.stdout, self.stderr) = (ifile, ofile, efile)
         shellval = not isinstance(self.cmd, tuple)
         cmd = tuple(str(c) for c in self.cmd)
-        logging.getLogger('pyerector.execute').debug(
-            'Popen(%s, shell=%s, cwd=%s, stdin=%s, stdout=%s,'
-            'stderr=%s, bufsize=0, env=%s)', cmd,
-            shellval, repr(self.wdir), ifile, ofile, efile, env
-        )
+        path = (os.environ if env is None else env).get('PATH', os.defpath)
+        program = self.which(cmd[0], path)
+        # posix_spawn would run a bare name from the current directory
+        spawn = os.sep in program and self.can_spawn(ifile, ofile, efile)
+        # a new process group, to kill all of it when out of time
+        group = self.timeout is not None and hasattr(os, 'setpgrp')
+        logger = logging.getLogger('pyerector.execute')
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                '%s(%s, shell=%s, cwd=%s, stdin=%s, stdout=%s,'
+                'stderr=%s, bufsize=0, env=%s)',
+                spawn and 'posix_spawn' or 'Popen', cmd,
+                shellval, repr(self.wdir), ifile, ofile, efile, self.env
+            )
         try:
-            proc = Popen(cmd,
-                         shell=shellval, cwd=str(self.wdir),
-                         stdin=ifile, stdout=ofile, stderr=efile,
-                         bufsize=0, env=realenv)
+            if spawn:
+                proc = SpawnedProcess(program, cmd, env,
+                                      stdin=ifile, stdout=ofile, stderr=efile,
+                                      group=group)
+            else:
+                proc = Popen(cmd, executable=program,
+                             shell=shellval, cwd=str(self.wdir),
+                             stdin=ifile, stdout=ofile, stderr=efile,
+                             bufsize=0, env=env,
+                             preexec_fn=group and os.setpgrp or None)
         except (IOError, OSError):
             exc = exc_info()[1]
-            if exc.args[0] == 2:  # ENOENT
+            if exc.args[0] == errno.ENOENT:
+                self.programs.pop((cmd[0], path), None)
                 raise Error('ENOENT', 'Program not found: %s' % self.cmd[0])
             else:
                 raise
@@ -268,6 +485,159 @@ if applicable."""
             self.stderr = proc.stderr
 
 
+class SpawnedProcess(object):
+    """A process started by os.posix_spawn, with the parts of
+subprocess.Popen that Subcommand uses; the pipes are unbuffered, as with
+bufsize=0."""
+    # pylint: disable=too-many-arguments
+    def __init__(self, program, args, env, stdin=None, stdout=None,
+                 stderr=None, group=False):
+        self.args = args
+        self.returncode = None
+        self.stdin = self.stdout = self.stderr = None
+        actions = []
+        theirs = []  # the child's ends of the pipes
+        try:
+            for fdnum, name, afile in ((0, 'stdin', stdin),
+                                       (1, 'stdout', stdout),
+                                       (2, 'stderr', stderr)):
+                if afile is None:
+                    continue
+                elif afile == Subcommand.PIPE:
+                    readfd, writefd = os.pipe()
+                    if fdnum == 0:
+                        theirs.append(readfd)
+                        setattr(self, name, os.fdopen(writefd, 'wb', 0))
+                    else:
+                        theirs.append(writefd)
+                        setattr(self, name, os.fdopen(readfd, 'rb', 0))
+                    actions.append((os.POSIX_SPAWN_DUP2, theirs[-1], fdnum))
+                else:
+                    actions.append((os.POSIX_SPAWN_DUP2, afile.fileno(), fdnum))
+            kwargs = {'file_actions': actions}
+            if group:
+                kwargs['setpgroup'] = 0
+            self.pid = os.posix_spawn(
+                program, args, os.environ if env is None else env, **kwargs
+            )
+        except:
+            for afile in (self.stdin, self.stdout, self.stderr):
+                if afile is not None:
+                    afile.close()
+            raise
+        finally:
+            for fdnum in theirs:
+                os.close(fdnum)
+
+    def poll(self):
+        """Return the exit status, or None if it is still running."""
+        return self.wait(os.WNOHANG)
+
+    def wait(self, options=0):
+        """Wait for the process to finish; return the exit status."""
+        if self.returncode is None:
+            pid, status = os.waitpid(self.pid, options)
+            if pid == 0:
+                return None
+            if os.WIFSIGNALED(status):
+                self.returncode = -os.WTERMSIG(status)
+            else:
+                self.returncode = os.WEXITSTATUS(status)
+        return self.returncode
+
+    def send_signal(self, signum):
+        """Send the signal to the process, unless it has been reaped."""
+        if self.returncode is None:
+            os.kill(self.pid, signum)
+
+    def terminate(self):
+        """Send a SIGTERM signal to the process."""
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        """Send a SIGKILL signal to the process."""
+        self.send_signal(signal.SIGKILL)
+
+
+class PipeReader(object):
+    """Read a pipe to its end on a thread.  Each line, decoded and without
+its newline, is given to the callback; or the data is kept, only the last
+limit bytes if limit is given (discarded counts the rest).  An exception
+from the callback stops the calls, not the reading, and is kept in error."""
+    blocksize = 1 << 16
+
+    def __init__(self, pipe, callback=None, limit=None, encoding='utf-8'):
+        self.pipe = pipe
+        self.callback = callback
+        self.limit = limit
+        self.encoding = encoding
+        self.chunks = deque()
+        self.size = 0
+        self.discarded = 0
+        self.partial = b''
+        self.error = None
+        self.thread = threading.Thread(target=self.run, name='PipeReader')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        """Read until the end of the pipe, then close it."""
+        fileno = self.pipe.fileno()
+        try:
+            while True:
+                try:
+                    data = os.read(fileno, self.blocksize)
+                except OSError:
+                    if exc_info()[1].errno == errno.EINTR:
+                        continue
+                    raise
+                if not data:
+                    break
+                elif self.callback is not None:
+                    self.lines(data)
+                else:
+                    self.keep(data)
+            if self.partial:
+                self.lines(b'\n')
+        finally:
+            self.pipe.close()
+
+    def keep(self, data):
+        """Add the data to the buffer, dropping the oldest beyond limit."""
+        self.chunks.append(data)
+        self.size += len(data)
+        while self.limit is not None and \
+                self.size - len(self.chunks[0]) >= self.limit:
+            self.size -= len(self.chunks[0])
+            self.discarded += len(self.chunks.popleft())
+
+    def lines(self, data):
+        """Give the callback each line that is complete."""
+        lines = (self.partial + data).split(b'\n')
+        self.partial = lines.pop()
+        for line in lines:
+            if self.error is not None:
+                break
+            try:
+                self.callback(line.rstrip(b'\r').decode(self.encoding,
+                                                         'replace'))
+            except Exception:  # pylint: disable=broad-except
+                self.error = exc_info()[1]
+
+    def getvalue(self):
+        """Return the data kept."""
+        data = b''.join(self.chunks)
+        if self.limit is not None and len(data) > self.limit:
+            self.discarded += len(data) - self.limit
+            data = data[len(data) - self.limit:]
+        return data
+
+    def join(self, timeout=None):
+        """Wait for the end of the pipe; return True if it was read."""
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+
 class Timer(object):
     """Keep track of how long a section of code takes."""
     def __init__(self):
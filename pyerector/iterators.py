@@ -25,11 +25,13 @@ item, accumulating the result."""
                 return initializer
             return accum
 
+import numbers
 import os
 import re
 import sys
+import threading
 
-from .path import Path
+from .path import Path, watchers
 from .variables import V
 from .helper import Exclusions
 from .base import Initer
@@ -37,7 +39,8 @@ from .base import Initer
 __all__ = [
     'FileSet', 'StaticIterator', 'FileIterator', 'FileList', 'DirList',
     'FileMapper', 'BasenameMapper', 'MergeMapper', 'IdentityMapper',
-    'Uptodate',
+    'Uptodate', 'Union', 'Intersection', 'Difference', 'Shard',
+    'ArchiveMember', 'ZipIterator', 'TarIterator',
 ]
 
 
@@ -55,8 +58,21 @@ Examples:
  i = Iterator('src', pattern='*.py', recurse=True)
  j = Iterator(i, pattern='test*')
  tuple(j) == ('src/test/testfoo.py',)
+
+Each iter() returns a new cursor with the state of that walk, so the same
+instance can be iterated by several threads at once.
+
+Iterators can be combined lazily with the set operators:
+ FileSet('src', recurse=True) - FileSet('src/vendor')
+ FileSet('src', recurse=True) | FileSet('test', recurse=True)
+ FileSet('src', recurse=True) & FileSet('src/pkg')
 """
     exclusion = Exclusions()
+    # a callable, if set, returns True for candidates that are to be skipped
+    # along with everything beneath them; set by the set operations
+    prune = None
+    # true for the copies returned by __iter__, which hold the walk state
+    iscursor = False
 
     def __init__(self, *path, **kwargs):
         super(Iterator, self).__init__(*path, **kwargs)
@@ -84,11 +100,40 @@ Examples:
 Sequentials."""
         raise NotImplementedError
 
+    def __or__(self, other):
+        return Union(self, other)
+
+    def __and__(self, other):
+        return Intersection(self, other)
+
+    def __sub__(self, other):
+        return Difference(self, other)
+
+    def _clone(self):
+        """Return a shallow copy, sharing the arguments."""
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        return clone
+
+    # pylint: disable=no-self-use
+    def subtree(self):
+        """Return the pathnames of the roots, if everything beneath them
+would be returned, otherwise None.  To be overridden."""
+        return None
+
     def __iter__(self):
+        if self.iscursor:
+            return self
+        cursor = self._clone()
+        cursor.iscursor = True
+        cursor.start()
+        return cursor
+
+    def start(self):
+        """Set the initial state of the walk, on the cursor."""
         # this is a list so we can modify it later, if necessary
         self.pool = list(self.get_args('path'))
         self.curset = iter([])
-        return self
 
     def __next__(self):
         return self.next()
@@ -116,6 +161,8 @@ then prepend the directory's contents to the pool (not the curset).
                 candidate = Path(candidate)
             if self.exclusion.match(candidate):
                 continue
+            if self.prune is not None and self.prune(candidate):
+                continue
             self.logger.debug('candidate = %s', repr(candidate))
             if self.check_candidate(candidate):
                 break
@@ -146,12 +193,11 @@ then prepend the directory's contents to the pool (not the curset).
     def append(self, item):
         """Add an item to the end of the pool."""
         path = list(self.get_args('path'))
-        if isinstance(item, Iterator):
-            path.extend(item)
+        if isinstance(item, (Iterator, MapperPair, Path)):
+            # iterators are expanded lazily, in getnextset()
+            path.append(item)
         elif isinstance(item, (tuple, list)):
             path.extend([Path(i) for i in item])
-        elif isinstance(item, (MapperPair, Path)):
-            path.append(item)
         else:
             path.append(Path(item))
         self.path = tuple(path)
@@ -233,18 +279,25 @@ This would map each py file in src to a pyc file in build:
 
     def next(self):
         """Return the next item, with its mapped destination."""
-        destdir = self.get_kwarg('destdir', (Path, str))
-        if destdir is None:
-            destdir = Path(os.curdir)
         # do _not_ catch StopIteration
         item = super(Mapper, self).next()
         #self.logger.debug('super.next() = %s', item)
         if isinstance(item, tuple) and len(item) == 2:
             item, temp = item
-            mapped = self.mapper_func(temp)
+            result = self.mapitem(temp)
             del temp
         else:
-            mapped = self.mapper_func(item)
+            result = self.mapitem(item)
+        self.logger.debug('mapper yields (%s, %s)', item, result)
+        return MapperPair(item, result)
+
+    def mapitem(self, item):
+        """Return the destination of an item, as next() would, without
+iterating.  Used to map the same sources to several destinations."""
+        destdir = self.get_kwarg('destdir', (Path, str))
+        if destdir is None:
+            destdir = Path(os.curdir)
+        mapped = self.mapper_func(item)
         assert isinstance(mapped, (Path, str)), "mapper must return a str"
         result = self.map(mapped)
         self.logger.debug(
@@ -253,9 +306,7 @@ This would map each py file in src to a pyc file in build:
         mapped = result
         assert isinstance(mapped, (Path, str)), \
             'map() must return a str or Path'
-        result = destdir + mapped #normjoin(destdir, mapped)
-        self.logger.debug('mapper yields (%s, %s)', item, result)
-        return MapperPair(item, result)
+        return destdir + mapped #normjoin(destdir, mapped)
 
     # pylint: disable=no-self-use
     def map(self, item):
@@ -293,11 +344,227 @@ dst is newer, then return True.
 
 
 
+class SharedWalk(object):
+    """The results of a single walk of a FileIterator, read by any number
+of consumers, possibly in different threads, while the walk is still in
+progress."""
+    def __init__(self, source):
+        self.source = source
+        self.items = []
+        self.done = False
+        self.failed = False
+        self.lock = threading.Lock()
+
+    def get(self, index):
+        """Return the index'th entry, walking further if necessary.
+Raise StopIteration when the walk is exhausted."""
+        with self.lock:
+            while index >= len(self.items):
+                if self.done:
+                    raise StopIteration
+                try:
+                    self.items.append(next(self.source))
+                except StopIteration:
+                    self.done = True
+                    self.source = None
+                except Exception:
+                    self.failed = True
+                    raise
+            return self.items[index]
+
+
+class WalkCache(object):
+    """Memoize the results of FileIterators for the duration of a run.
+Iterators with the same walk parameters (see FileIterator.cachekey) share
+one walk.  The cache is active only within a "with walkcache:" block
+(PyErector.run); it is emptied when the outermost block exits.
+Entries are dropped when a file beneath (or above) their roots is
+modified, see pyerector.path.modified(), and all of them after each call of
+a Task."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.depth = 0
+
+    def __enter__(self):
+        with self.lock:
+            self.depth += 1
+        return self
+
+    def __exit__(self, etype, evalue, etb):
+        with self.lock:
+            self.depth -= 1
+            if self.depth == 0:
+                self.entries.clear()
+
+    def get(self, iterator):
+        """Return the SharedWalk for the iterator, starting a new one if
+needed, or None if the cache is inactive or the iterator's results cannot
+be shared."""
+        if self.depth == 0:
+            return None
+        key, roots = iterator.cachekey()
+        if key is None:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0].failed:
+                source = iterator._clone()
+                source.shared = None
+                entry = (SharedWalk(source.walk()), roots)
+                self.entries[key] = entry
+            return entry[0]
+
+    def invalidate(self, path=None):
+        """Drop the entries affected by a change to path; all entries if
+path is None."""
+        if not self.entries:
+            return
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+                return
+            path = os.path.abspath(str(path))
+            for key, (_, roots) in list(self.entries.items()):
+                for root in roots:
+                    if root == path or \
+                            path.startswith(root + os.sep) or \
+                            root.startswith(path + os.sep):
+                        del self.entries[key]
+                        break
+
+walkcache = WalkCache()
+watchers.append(walkcache.invalidate)
+
+
 # pylint: disable=abstract-method
 class FileIterator(Iterator):
     """File-based subclass of Iterator.
 Default parameters: pattern=None, noglob=False, recurse=False,
-fileonly=True, exclude=()."""
+fileonly=True, exclude=().
+Predicates, evaluated during the walk with the stat data of each entry:
+  newer_than=<seconds or pathname> - modified after the time or file
+  min_size=<bytes>, max_size=<bytes> - size limits
+  types=('file', 'link', 'dir', ...) - one of the Path.TYPE values
+  max_depth=<int> - do not descend further than this many levels below
+the arguments
+  limit=<int> - return at most this many entries"""
+    newer_than = None
+    min_size = None
+    max_size = None
+    types = None
+    max_depth = None
+    limit = None
+    # the SharedWalk being read from, when in the walkcache
+    shared = None
+
+    def start(self):
+        self.shared = walkcache.get(self)
+        if self.shared is None:
+            self.walk()
+        else:
+            self.position = 0
+
+    def walk(self):
+        """Start walking the file system."""
+        super(FileIterator, self).start()
+        self.count = 0
+        self.depths = {}
+        self.newer_time = self.get_newer_time()
+        return self
+
+    def next(self):
+        """Stop after limit entries."""
+        if self.shared is not None:
+            candidate = self.shared.get(self.position)
+            self.position += 1
+            return candidate
+        limit = self.get_kwarg('limit', int)
+        if limit is not None and self.count >= limit:
+            raise StopIteration
+        candidate = super(FileIterator, self).next()
+        self.count += 1
+        return candidate
+
+    def cachekey(self):
+        """Return a key of the normalized walk parameters and the absolute
+pathnames of the roots being walked, or (None, None) if the results cannot
+be shared with other iterators."""
+        if isinstance(self, Mapper) or self.prune is not None:
+            return None, None
+        basedir = V['basedir']
+        if not isinstance(basedir, Path):
+            basedir = Path(basedir)
+        noglob = self.get_kwarg('noglob', bool)
+        args = []
+        roots = []
+        for item in self.get_args('path'):
+            if isinstance(item, FileIterator):
+                key, subroots = item.cachekey()
+                if key is None:
+                    return None, None
+                args.append(key)
+                roots.extend(subroots)
+            elif isinstance(item, (Path, str)):
+                root = str(item)
+                args.append(root)
+                if not noglob:
+                    while root and self.checkglobpatt(root):
+                        root = os.path.dirname(root)
+                roots.append(
+                    os.path.abspath(os.path.join(str(basedir), root))
+                )
+            else:
+                return None, None
+        types = self.get_kwarg('types', (tuple, list, str))
+        if isinstance(types, list):
+            types = tuple(types)
+        key = (
+            self.__class__, str(basedir), tuple(args),
+            self.get_kwarg('pattern', str), noglob,
+            self.get_kwarg('recurse', bool),
+            self.get_kwarg('fileonly', bool),
+            frozenset(self.exclusion), self.exclusion.usedefaults,
+            types, self.get_kwarg('min_size', int),
+            self.get_kwarg('max_size', int), self.get_newer_time(),
+            self.get_kwarg('max_depth', int), self.get_kwarg('limit', int),
+        )
+        return key, roots
+
+    def get_newer_time(self):
+        """Return the modification time from the newer_than parameter,
+which is either a time or a file to take it from."""
+        newer_than = self.get_kwarg('newer_than', (int, float, Path, str))
+        if newer_than is None or isinstance(newer_than, (int, float)):
+            return newer_than
+        mtime = self.join(newer_than).mtime
+        return mtime is None and 0 or mtime
+
+    def check_stat(self, stat, ftype):
+        """Return True if the entry matches the predicates."""
+        types = self.get_kwarg('types', (tuple, list, str))
+        if types:
+            if isinstance(types, str):
+                types = (types,)
+            if ftype not in types:
+                return False
+        min_size = self.get_kwarg('min_size', int)
+        max_size = self.get_kwarg('max_size', int)
+        newer_time = getattr(self, 'newer_time', None)
+        if min_size is None and max_size is None and newer_time is None:
+            return True
+        elif stat is None:
+            return False
+        size = stat[os.path.stat.ST_SIZE]
+        if min_size is not None and size < min_size:
+            return False
+        elif max_size is not None and size > max_size:
+            return False
+        elif newer_time is not None and \
+                stat[os.path.stat.ST_MTIME] <= newer_time:
+            return False
+        return True
+
     def adjust(self, candidate):
         basedir = V['basedir']
         if isinstance(basedir, str):
@@ -317,37 +584,64 @@ fileonly=True, exclude=()."""
             return [(c - basedir) for c in glist]
 
     def post_process_candidate(self, candidate):
+        """Descend into directories (to max_depth) when recursing;
+directories are returned if not fileonly and match the predicates."""
+        if isinstance(candidate, tuple):  # for a Mapper
+            return candidate
         basedir = V['basedir']
         if not isinstance(basedir, Path):
             basedir = Path(basedir)
         recurse = self.get_kwarg('recurse', bool)
-        fileonly = self.get_kwarg('fileonly', bool)
-        if isinstance(candidate, tuple):  # for a Mapper
-            # pylint: disable=redefined-variable-type
-            cand = (basedir + candidate[0], basedir + candidate[1])
-        else:
-            # pylint: disable=redefined-variable-type
-            cand = basedir + candidate
-        #print 'candidate', repr(c)
-        if recurse and cand.isdir:
-            self._prepend([(i - basedir) for i in cand])
-            if fileonly:
-                candidate = FileIterator.next(self)
+        cand = basedir + candidate
+        if recurse and Path.stat_type(cand.stat) == Path.TYPE.DIR:
+            max_depth = self.get_kwarg('max_depth', int)
+            depth = self.depths.pop(candidate.value, 0)
+            if max_depth is None or depth < max_depth:
+                children = []
+                for entry in cand:
+                    child = entry - basedir
+                    if max_depth is not None and \
+                            Path.stat_type(entry.stat) == Path.TYPE.DIR:
+                        self.depths[child.value] = depth + 1
+                    children.append(child)
+                self._prepend(children)
+            if self.get_kwarg('fileonly', bool) or \
+                    not self.check_stat(cand.stat, Path.TYPE.DIR):
+                candidate = Iterator.next(self)
         return candidate
 
-
     def check_candidate(self, candidate):
-        candidate = candidate
         basedir = V['basedir']
         recurse = self.get_kwarg('recurse', bool)
         pattern = self.get_kwarg('pattern', str)
         cand = basedir + candidate
-        if recurse and cand.isdir:
-            return True
-        elif not pattern or cand.match(pattern):
+        ftype = Path.stat_type(cand.stat)
+        if recurse and ftype == Path.TYPE.DIR:
             return True
-        else:
+        elif pattern and not cand.match(pattern):
             return False
+        else:
+            return self.check_stat(cand.stat, ftype)
+
+    def subtree(self):
+        """Without a pattern, globbing or nested iterators, all that
+is beneath the arguments is returned, so the arguments are the roots."""
+        if self.get_kwarg('pattern', str) or self.prune is not None:
+            return None
+        for name in ('newer_than', 'min_size', 'max_size', 'types',
+                     'max_depth', 'limit'):
+            if getattr(self, name) is not None:
+                return None
+        noglob = self.get_kwarg('noglob', bool)
+        roots = []
+        for item in self.get_args('path'):
+            if not isinstance(item, (Path, str)):
+                return None
+            elif not noglob and self.checkglobpatt(item):
+                return None
+            elif not self.exclusion.match(item):
+                roots.append(item)
+        return roots
 
     @staticmethod
     def checkglobpatt(string):
@@ -373,11 +667,237 @@ FileSet = FileIterator
 # pylint: disable=abstract-method
 class DirList(FileIterator):
     """By default, recurse and return both directory and file pathnames.
-Default params: recurse=True, fileonly=False."""
+Default params: recurse=True, fileonly=False.
+The FileIterator predicates apply, for example:
+    DirList('src', types=('dir',), max_depth=1)"""
     recurse = True
     fileonly = False
 
 
+class ArchiveMember(Path):
+    """A regular file in an archive, as a Path that is not in the file
+system: the stat data is that recorded in the archive, and open() reads the
+data from the archive.  The pathname is the member's name."""
+    virtual = True
+
+    def __init__(self, *components, **kwargs):
+        # set before Path.__init__ calls refresh()
+        self.memberstat = kwargs.pop('stat', None)
+        self.opener = kwargs.pop('opener', None)
+        self.archive = kwargs.pop('archive', None)
+        # sorts the members of archives in the order they are stored
+        self.order = (str(self.archive), kwargs.pop('position', 0))
+        super(ArchiveMember, self).__init__(*components)
+
+    def __repr__(self):
+        return '<ArchiveMember %s in %s>' % (self.value, self.archive)
+
+    def refresh(self):
+        """The stat data does not change."""
+        # pylint: disable=attribute-defined-outside-init
+        self.stat = self.memberstat
+
+    def open(self, mode=None):
+        """Return a file object reading the member's data, as text with
+mode 'r' or 'rt', as bytes with 'rb'."""
+        if mode is not None and (not mode.startswith('r') or '+' in mode):
+            raise TypeError('archive members are read-only')
+        elif self.opener is None:
+            raise TypeError('expecting file')
+        fileobj = self.opener()
+        if not isinstance(fileobj, MemberFile):
+            fileobj = MemberFile(fileobj)
+        if 'b' not in (mode or 'r') and sys.version_info[0] >= 3:
+            import io
+            return io.TextIOWrapper(fileobj)
+        return fileobj
+
+
+class MemberFile(object):
+    """The file object of an archive member, which may not be a context
+manager or have all the methods of io.BufferedIOBase (as in Python 2);
+onclose is called once it is closed."""
+    def __init__(self, fileobj, onclose=None):
+        self.fileobj = fileobj
+        self.onclose = onclose
+        self.closed = False
+
+    def __getattr__(self, name):
+        return getattr(self.fileobj, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, evalue, etb):
+        self.close()
+
+    def __iter__(self):
+        return iter(self.fileobj)
+
+    def close(self):
+        """Close the member's file object."""
+        if self.closed:
+            return
+        self.closed = True
+        self.fileobj.close()
+        if self.onclose is not None:
+            self.onclose()
+
+    # for io.TextIOWrapper
+    def readable(self):
+        """The data is only read."""
+        return True
+
+    def writable(self):
+        """The data is only read."""
+        return False
+
+    def seekable(self):
+        """Not relied upon."""
+        return False
+
+    def read1(self, size=-1):
+        """Read, with at most one call to the underlying file."""
+        return self.fileobj.read(size)
+
+    @property
+    def closefd(self):
+        """Not a file descriptor."""
+        return False
+
+
+class ArchiveHandle(object):
+    """The open archive that the members of one iteration are read from.
+It is opened (by the opener) when the first is, and kept open while they
+are read in turn, so a compressed archive is read once; it is closed when
+the file of the last member (at position last) is closed, or when no
+member refers to it any more."""
+    def __init__(self, opener):
+        self.opener = opener
+        self.archive = None
+        self.last = None
+        self.users = 0
+
+    def __del__(self):
+        self.close()
+
+    def open(self, position, getfile):
+        """Return a MemberFile of what getfile(archive) returns."""
+        if self.archive is None:
+            self.archive = self.opener()
+        fileobj = getfile(self.archive)
+        self.users += 1
+        return MemberFile(fileobj,
+                          onclose=lambda: self.release(position))
+
+    def release(self, position):
+        """A member's file was closed; close the archive after the last."""
+        self.users -= 1
+        if self.users == 0 and position == self.last:
+            self.close()
+
+    def close(self):
+        """Close the archive, if it is open."""
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+
+class ArchiveIterator(Iterator):
+    """The base class of ZipIterator and TarIterator: the regular files in
+each archive given, as ArchiveMember entries, without extracting them.
+The pattern and exclusions apply to the members' basenames.  Only what is
+iterated is read from an archive, and the members' data is read when they
+are opened, so reading each in turn as it is found reads the archive once."""
+    def adjust(self, candidate):
+        if isinstance(candidate, Iterator):
+            return iter(candidate)
+        return self.members(self.join(candidate))
+
+    def members(self, archive):
+        """Yield the archive's members.  To be overridden."""
+        raise NotImplementedError
+
+
+class ZipIterator(ArchiveIterator):
+    """The regular files in zip archives (including eggs and wheels).
+ZipIterator('dist/pyerector.egg', pattern='*.py')"""
+    def members(self, archive):
+        import stat
+        import time
+        import zipfile
+        zfile = zipfile.ZipFile(archive.value)
+        try:
+            infolist = zfile.infolist()
+        finally:
+            zfile.close()
+        handle = ArchiveHandle(lambda: zipfile.ZipFile(archive.value))
+        members = []
+        for position, info in enumerate(infolist):
+            mode = info.external_attr >> 16
+            if not stat.S_IFMT(mode):  # not written on posix
+                mode |= stat.S_IFREG | (stat.S_IMODE(mode) or 0o644)
+            if not info.filename.endswith('/') and stat.S_ISREG(mode):
+                members.append((position, info, mode))
+        if members:
+            handle.last = members[-1][0]
+        for position, info, mode in members:
+            mtime = int(time.mktime(info.date_time + (0, 0, -1)))
+            yield ArchiveMember(
+                info.filename, archive=archive, position=position,
+                stat=os.stat_result((mode, 0, 0, 1, 0, 0, info.file_size,
+                                     mtime, mtime, mtime)),
+                opener=lambda position=position, info=info: handle.open(
+                    position, lambda zfile: zfile.open(info)
+                ),
+            )
+
+
+class TarIterator(ArchiveIterator):
+    """The regular files in tar archives, compressed or not; a hard link is
+the file it links to, under its own name.  The headers are read as the
+members are iterated, and until the end the members' data is read through
+the same handle, so reading each as it is found reads a compressed archive
+once.
+TarIterator('dist/pyerector-1.3.1.tgz', pattern='*.py')"""
+    def members(self, archive):
+        import tarfile
+        handle = ArchiveHandle(lambda: tarfile.open(archive.value, 'r:*'))
+        tfile = handle.archive = handle.opener()
+        found = {}  # the names to the TarInfo with their data
+        last = None
+        try:
+            for position, info in enumerate(tfile):
+                if info.islnk():
+                    data = found.get(info.linkname)
+                    if data is None:
+                        raise ValueError('%s: link target %s not found in %s'
+                                         % (info.name, info.linkname,
+                                            archive))
+                elif info.isreg():
+                    data = info
+                else:
+                    continue
+                found[info.name] = data
+                last = position
+                yield ArchiveMember(
+                    info.name, archive=archive, position=position,
+                    stat=os.stat_result((
+                        os.path.stat.S_IFREG | data.mode, 0, 0, 1, data.uid,
+                        data.gid, data.size, data.mtime, data.mtime,
+                        data.mtime
+                    )),
+                    opener=lambda position=position, data=data: handle.open(
+                        position, lambda tfile: tfile.extractfile(data)
+                    ),
+                )
+        finally:
+            # close the archive now, or after the last member's file
+            handle.last = last
+            if not handle.users:
+                handle.close()
+
+
 class FileMapper(Mapper, FileIterator):
     """Maps source files to destination files, using a base path, destdir.
 The mapper member is either a string or callable that will adjust the
@@ -484,3 +1004,263 @@ subclasses."""
             return result
         else:
             raise RuntimeError('call uptodate()')
+
+
+class PathSet(object):
+    """A set of normalized pathnames, where a member also contains everything
+beneath it.  Used by the set operations to prune walks."""
+    def __init__(self, items=()):
+        self.members = set()
+        self.parents = set()
+        for item in items:
+            self.add(item)
+
+    def __len__(self):
+        return len(self.members)
+
+    @staticmethod
+    def key(item):
+        """Return the normalized pathname string of a Path, str or the
+source of a mapper pair."""
+        if isinstance(item, tuple):
+            item = item[0]
+        if isinstance(item, Path):
+            return item.value
+        return os.path.normpath(str(item))
+
+    @staticmethod
+    def ancestry(key):
+        """Yield the pathname and each of its parent directories."""
+        while True:
+            yield key
+            parent = os.path.dirname(key)
+            if not parent or parent == key:
+                break
+            key = parent
+
+    def add(self, item):
+        """Add the item, and record its parents."""
+        key = self.key(item)
+        self.members.add(key)
+        for parent in self.ancestry(os.path.dirname(key) or key):
+            if parent == key or parent in self.parents:
+                break
+            self.parents.add(parent)
+
+    def update(self, other):
+        """Add the members of another PathSet."""
+        self.members |= other.members
+        self.parents |= other.parents
+
+    def __contains__(self, item):
+        """True if the item or one of its parents is a member."""
+        members = self.members
+        for key in self.ancestry(self.key(item)):
+            if key in members:
+                return True
+        return False
+
+    def leadsto(self, item):
+        """True if the item is a parent directory of a member."""
+        return self.key(item) in self.parents
+
+
+class SetIterator(Iterator):
+    """Base class for the lazy set operations on iterators.  The operands
+are only walked when this is iterated.  Results are returned once, by
+normalized pathname, in the order that they are first found.  Exclusions
+given here are pushed down into the operands' walks, along with any
+pathnames that can be pruned from the walks."""
+
+    def operand(self, item, prune=None, inherit=True):
+        """Return the operand as an Iterator, with the exclusions and the
+prune predicates added to its walk.  The operand itself is not changed.
+If inherit is false, the prune predicate of this iterator is not added."""
+        if not isinstance(item, Iterator):
+            if isinstance(item, (tuple, list)):
+                item = Iterator(*item)
+            else:
+                item = Iterator(item)
+        prunes = [p for p in (inherit and self.prune or None, prune)
+                  if p is not None]
+        if not self.exclusion and not prunes:
+            return item
+        view = item._clone()
+        if self.exclusion:
+            view.exclusion = Exclusions(
+                set(item.exclusion) | set(self.exclusion),
+                usedefaults=item.exclusion.usedefaults,
+            )
+        if item.prune is not None:
+            prunes.insert(0, item.prune)
+        if len(prunes) == 1:
+            view.prune = prunes[0]
+        elif prunes:
+            view.prune = lambda c, prunes=prunes: any(p(c) for p in prunes)
+        return view
+
+    def members(self, item, like=None):
+        """Return a PathSet of what the operand would return.  When the
+operand would return everything beneath its roots, and with the same
+exclusions as like, the walk is skipped and just the roots are used."""
+        item = self.operand(item, inherit=False)
+        roots = item.subtree()
+        if roots is not None and (
+                like is None or
+                (set(like.exclusion) == set(item.exclusion) and
+                 like.exclusion.usedefaults == item.exclusion.usedefaults)):
+            return PathSet(roots)
+        return PathSet(item)
+
+    def unique(self, sequence, keep=None):
+        """Yield items from the sequence that have not been seen and,
+if given, where keep(item) is true."""
+        seen = set()
+        for item in sequence:
+            key = PathSet.key(item)
+            if key in seen:
+                continue
+            seen.add(key)
+            if keep is not None and not keep(item):
+                continue
+            if isinstance(item, tuple) or self.check_candidate(item):
+                yield item
+
+
+class Union(SetIterator):
+    """All that is returned by any of the operands.
+Union(FileSet('src'), FileSet('test')) == FileSet('src') | FileSet('test')"""
+    def __iter__(self):
+        from itertools import chain
+        operands = (self.operand(item) for item in self.get_args('path'))
+        return self.unique(chain.from_iterable(operands))
+
+
+class Intersection(SetIterator):
+    """What is returned by the first operand that is also returned by
+(or beneath what is returned by) all of the other operands.  The other
+operands are gathered first; the walk of the first operand does not
+descend into directories that cannot lead to them.
+Intersection(FileSet('src'), FileSet('src/pkg')) ==
+    FileSet('src') & FileSet('src/pkg')"""
+    def __iter__(self):
+        operands = tuple(self.get_args('path'))
+        if not operands:
+            return iter(())
+        first = self.operand(operands[0])
+        others = [self.members(item) for item in operands[1:]]
+        if not others:
+            return self.unique(first)
+
+        def prune(item):
+            """Skip what is not in, or leading to, each of the others."""
+            for other in others:
+                if item not in other and not other.leadsto(item):
+                    return True
+            return False
+
+        def keep(item):
+            """Return only what is in each of the others."""
+            for other in others:
+                if item not in other:
+                    return False
+            return True
+        return self.unique(self.operand(first, prune=prune), keep=keep)
+
+
+class Difference(SetIterator):
+    """What is returned by the first operand that is not returned by (or
+beneath what is returned by) any of the other operands.  The walk of the
+first operand does not descend into what is removed.  When another operand
+would return everything beneath its arguments, it is not walked at all.
+Difference(FileSet('src'), FileSet('src/vendor')) ==
+    FileSet('src') - FileSet('src/vendor')"""
+    def __iter__(self):
+        operands = tuple(self.get_args('path'))
+        if not operands:
+            return iter(())
+        first = self.operand(operands[0])
+        removed = PathSet()
+        for item in operands[1:]:
+            removed.update(self.members(item, like=first))
+        if not removed:
+            return self.unique(first)
+
+        def keep(item):
+            """Return only what was not removed."""
+            return item not in removed
+        return self.unique(
+            self.operand(first, prune=removed.__contains__), keep=keep
+        )
+
+
+class Shard(SetIterator):
+    """One of count stable subsets of what the iterator returns, for
+spreading work over threads, processes or machines.  The same file is
+put in the same shard on every run.  Exclusions given here are pushed
+down into the walks, and a pattern applies, as for the set operations;
+what they leave out is not counted in any shard.
+Strategies:
+  'hash' - by the md5 of the relative pathname; adding or removing files
+does not move the others
+  'size' - size-balanced bins: largest first, each into the bin with the
+smallest total so far (ties by pathname); a file changing size can move
+others
+Shard(FileSet('src', recurse=True), 0, 4, strategy='size')"""
+    strategies = ('hash', 'size')
+    strategy = 'hash'
+
+    def __init__(self, iterator, index, count, **kwargs):
+        super(Shard, self).__init__(iterator, **kwargs)
+        if not isinstance(index, numbers.Integral) or \
+                not isinstance(count, numbers.Integral):
+            raise TypeError('index and count must be int')
+        elif count < 1 or not 0 <= index < count:
+            raise ValueError('expecting 0 <= index < count', index, count)
+        strategy = self.get_kwarg('strategy', str)
+        if strategy not in self.strategies:
+            raise ValueError('unknown strategy', strategy)
+        self.index = index
+        self.shards = count
+
+    def __repr__(self):
+        return '<%s %d/%d %s>' % (self.__class__.__name__, self.index,
+                                  self.shards, self.get_args('path'))
+
+    @staticmethod
+    def hashkey(item):
+        """Return a stable integer from the item's pathname."""
+        from hashlib import md5
+        key = PathSet.key(item)
+        if not isinstance(key, bytes):
+            key = key.encode('utf-8')
+        return int(md5(key).hexdigest(), 16)
+
+    def size(self, item):
+        """Return the size of the item's file, or 0."""
+        if isinstance(item, tuple):
+            item = item[0]
+        stat = self.join(item).stat
+        return stat is None and 0 or stat[os.path.stat.ST_SIZE]
+
+    def binned(self, items):
+        """Return the items in this shard, by size-balanced bins."""
+        items = sorted(((self.size(item), PathSet.key(item), item)
+                        for item in items),
+                       key=lambda entry: (-entry[0], entry[1]))
+        totals = [0] * self.shards
+        for size, _, item in items:
+            shard = totals.index(min(totals))
+            totals[shard] += size
+            if shard == self.index:
+                yield item
+
+    def __iter__(self):
+        from itertools import chain
+        items = self.unique(chain.from_iterable(
+            self.operand(item) for item in self.get_args('path')
+        ))
+        if self.get_kwarg('strategy', str) == 'size':
+            return self.binned(items)
+        return (item for item in items
+                if self.hashkey(item) % self.shards == self.index)
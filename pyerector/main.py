@@ -13,6 +13,7 @@ import sys
 from .exception import Abort, Error
 from .path import Path
 from .helper import Timer
+from .iterators import walkcache
 from .execute import PyThread, Initialization
 from .register import registry
 from .targets import Target
@@ -180,8 +181,10 @@ Target, validate all Uptodate values and all Task values.
         failed = True
         with timer:
             try:
-                for target in self.targets:
-                    target()()
+                # the same file sets are walked only once during the run
+                with walkcache:
+                    for target in self.targets:
+                        target()()
             except Abort:
                 pass
             except ValueError:
@@ -5,14 +5,127 @@ to avoid having to stringify values being passed to explicit calls
 to os.* and os.path.* functions."""
 
 from logging import getLogger
+import errno
 import os
 
 __all__ = [
     'Path',
     'homedir',
+    'modified',
     'rootdir',
 ]
 
+# callables to be told of changes to the file system, see modified()
+watchers = []
+
+
+def modified(path=None):
+    """Tell the watchers that the path was changed, or if None, that
+anything may have changed (e.g. after running an external program)."""
+    for watcher in watchers:
+        watcher(path)
+
+
+# the most copied by one system call
+COPYCHUNK = 1 << 30
+# the ioctl to clone the data of one file into another (Linux)
+FICLONE = 0x40049409
+# errors meaning that a copy method does not work for these files
+_COPYFALLBACK = frozenset(
+    getattr(errno, name) for name in
+    ('EXDEV', 'ENOSYS', 'EINVAL', 'EOPNOTSUPP', 'ENOTSUP', 'EBADF', 'EIO')
+    if hasattr(errno, name)
+)
+
+
+def _copy_file_range(infd, outfd, offset, count):
+    """Copy in the kernel, sharing extents (reflink) where the file system
+allows."""
+    return os.copy_file_range(infd, outfd, count, offset, offset)
+
+
+def _sendfile(infd, outfd, offset, count):
+    """Copy in the kernel, through the page cache."""
+    os.lseek(outfd, offset, os.SEEK_SET)
+    return os.sendfile(outfd, infd, offset, count)
+
+
+def _readwrite(infd, outfd, offset, count):
+    """Copy through a user space buffer."""
+    os.lseek(infd, offset, os.SEEK_SET)
+    os.lseek(outfd, offset, os.SEEK_SET)
+    data = os.read(infd, min(count, 1 << 20))
+    written = 0
+    while written < len(data):
+        written += os.write(outfd, data[written:])
+    return len(data)
+
+_copymethods = tuple(
+    method for (name, method) in (('copy_file_range', _copy_file_range),
+                                  ('sendfile', _sendfile))
+    if hasattr(os, name)
+) + (_readwrite,)
+
+
+def copyrange(infd, outfd, offset, length):
+    """Copy length bytes from the offset of one file descriptor to the same
+offset of another, with the fastest method that works for them.
+Return the number of bytes copied, less if the source is shorter."""
+    import sys
+    methods = list(_copymethods)
+    copied = 0
+    while copied < length:
+        count = min(length - copied, COPYCHUNK)
+        try:
+            count = methods[0](infd, outfd, offset + copied, count)
+        except OSError:
+            exc = sys.exc_info()[1]
+            if len(methods) == 1 or exc.errno not in _COPYFALLBACK:
+                raise
+            del methods[0]
+            continue
+        if count == 0:
+            if len(methods) == 1:  # end of file
+                break
+            # some file systems report nothing copied, check by reading
+            del methods[0]
+            continue
+        copied += count
+    return copied
+
+
+def copydata(infile, outfile, stat=None):
+    """Copy the contents of one open file to another (from the start),
+without passing through Python where possible.  Holes of sparse files are
+kept, when the system can find them.  Return the number of bytes copied."""
+    import sys
+    infd, outfd = infile.fileno(), outfile.fileno()
+    if stat is None:
+        stat = os.fstat(infd)
+    size = stat.st_size
+    blocks = getattr(stat, 'st_blocks', None)
+    if not hasattr(os, 'SEEK_DATA') or blocks is None or \
+            blocks * 512 >= size:
+        return copyrange(infd, outfd, 0, size)
+    copied = offset = 0
+    try:
+        while offset < size:
+            try:
+                start = os.lseek(infd, offset, os.SEEK_DATA)
+            except OSError:
+                if sys.exc_info()[1].errno == errno.ENXIO:  # only a hole
+                    break
+                raise
+            end = os.lseek(infd, start, os.SEEK_HOLE)
+            copied += copyrange(infd, outfd, start, end - start)
+            offset = end
+    except OSError:
+        if sys.exc_info()[1].errno not in _COPYFALLBACK or offset:
+            raise
+        return copyrange(infd, outfd, 0, size)  # no SEEK_DATA here
+    os.ftruncate(outfd, size)  # for a hole at the end
+    return copied
+
 
 # pylint: disable=too-many-public-methods
 class Path(object):
@@ -31,6 +144,8 @@ and operations."""
         PIPE = 'pipe'
 
     sep = os.sep
+    # true for entries that are not in the file system, like ArchiveMember
+    virtual = False
 
     def __init__(self, *components):
         from .variables import Variable
@@ -165,41 +280,47 @@ evaluating variables and joining subpaths."""
     @property
     def type(self):
         """File type, one of Path.TYPE enum values."""
-        self.__getstat(self._join())
-        if self.stat is None:
-            return self.TYPE.NOENT
-        ftype = os.path.stat.S_IFMT(self.stat[os.path.stat.ST_MODE])
+        self.refresh()
+        return self.stat_type(self.stat)
+
+    @classmethod
+    def stat_type(cls, stat):
+        """File type of a stat result (or None), one of Path.TYPE enum
+values; does not access the file system."""
+        if stat is None:
+            return cls.TYPE.NOENT
+        ftype = os.path.stat.S_IFMT(stat[os.path.stat.ST_MODE])
         if os.path.stat.S_ISLNK(ftype):
-            return self.TYPE.LINK
+            return cls.TYPE.LINK
         elif os.path.stat.S_ISDIR(ftype):
-            return self.TYPE.DIR
+            return cls.TYPE.DIR
         elif os.path.stat.S_ISREG(ftype):
-            return self.TYPE.FILE
+            return cls.TYPE.FILE
         elif os.path.stat.S_ISFIFO(ftype):
-            return self.TYPE.PIPE
+            return cls.TYPE.PIPE
         else:
-            return self.TYPE.OTHER
+            return cls.TYPE.OTHER
 
     @property
     def mtime(self):
         """Float of the file's modification time, or None if no entry."""
-        self.__getstat(self._join())
+        self.refresh()
         return self.stat and self.stat[os.path.stat.ST_MTIME] or None
     @property
     def atime(self):
         """Float of the file's access time, or None if no entry."""
-        self.__getstat(self._join())
+        self.refresh()
         return self.stat and self.stat[os.path.stat.ST_ATIME] or None
     @property
     def ctime(self):
         """Float of the file's change time or None if no entry."""
-        self.__getstat(self._join())
+        self.refresh()
         return self.stat and self.stat[os.path.stat.ST_CTIME] or None
 
     @property
     def mode(self):
         """Return permission bits or None if no entry."""
-        self.__getstat(self._join())
+        self.refresh()
         if self.stat:
             return os.path.stat.S_IMODE(self.stat[os.path.stat.ST_MODE])
         else:
@@ -305,10 +426,13 @@ create it, if it is not a file, return an exception."""
                 raise TypeError('expecting file')
             thisfile = open(self.value, mode)
             self.refresh()
+            modified(self)
             return thisfile
         elif self.isfile:
             if mode is None:
                 mode = 'r'
+            elif not mode.startswith('r') or '+' in mode:
+                modified(self)
             return open(self.value, mode)
         else:
             raise TypeError('expecting file or no entry')
@@ -349,6 +473,7 @@ create it, if it is not a file, return an exception."""
         else:
             os.remove(self.value)
         self.refresh()
+        modified(self)
 
     def rename(self, other):
         """Rename the file. Return other as a Path."""
@@ -359,6 +484,8 @@ create it, if it is not a file, return an exception."""
         os.rename(self.value, other.value)
         self.refresh()
         other.refresh()
+        modified(self)
+        modified(other)
         return other
 
     def utime(self, atime, mtime):
@@ -367,15 +494,129 @@ create it, if it is not a file, return an exception."""
             raise TypeError('expecting file')
         os.utime(self.value, (atime, mtime))
         self.refresh()
+        modified(self)
 
     # file operations
 
-    def copy(self, dest):
-        """Copy contents of a file."""
-        from shutil import copy2
-        getLogger('pyerector.execute').debug('%s.copy(%s)',
-                                             repr(self), repr(dest))
-        copy2(self.value, dest.value)
+    LINKMODES = ('copy', 'hard', 'reflink', 'symlink', 'auto')
+
+    def copy(self, dest, link='copy'):
+        """Copy contents of a file, with its permissions and times
+(as shutil.copy2), see copydata().  Return the number of bytes copied.
+The link argument can share the data instead; if that is not possible,
+the file is copied:
+  'hard' - a hard link
+  'reflink' - a copy-on-write clone, if the file system supports it
+  'symlink' - a symbolic link to the absolute pathname
+  'auto' - a reflink, else a hard link
+A destination that is a link is replaced, not written through."""
+        from shutil import copystat
+        getLogger('pyerector.execute').debug('%s.copy(%s, link=%s)',
+                                             repr(self), repr(dest), link)
+        if link not in self.LINKMODES:
+            raise ValueError('unknown link mode', link)
+        if dest.isdir:
+            dest = dest + self.basename
+        if link in ('reflink', 'auto') and self._reflink(dest):
+            copystat(self.value, dest.value)
+        elif link in ('hard', 'symlink', 'auto') and \
+                self._link(dest, symbolic=(link == 'symlink')):
+            pass
+        else:
+            return self.copyto((dest,))
+        dest.refresh()
+        modified(dest)
+        return 0
+
+    def copyto(self, dests):
+        """Copy the file to each of the destinations, opening and reading
+it once; the kernel copies from the same page cache.  Return the total
+number of bytes copied."""
+        from shutil import copystat
+        total = 0
+        with open(self.value, 'rb') as infile:
+            stat = os.fstat(infile.fileno())
+            for dest in dests:
+                if dest.isdir:
+                    dest = dest + self.basename
+                if dest.stat is not None and (
+                        self.stat_type(dest.stat) == self.TYPE.LINK or
+                        dest.stat.st_nlink > 1):
+                    os.remove(dest.value)  # do not write through a link
+                with open(dest.value, 'wb') as outfile:
+                    total += copydata(infile, outfile, stat)
+                copystat(self.value, dest.value)
+                dest.refresh()
+                modified(dest)
+        return total
+
+    def samecontent(self, other, blocksize=1 << 16):
+        """Return True if both are files with the same contents; compares
+the sizes first, then reads both until the first difference."""
+        if not self.isfile or not other.isfile:
+            return False
+        elif self.stat.st_size != other.stat.st_size:
+            return False
+        elif (self.stat.st_dev, self.stat.st_ino) == \
+                (other.stat.st_dev, other.stat.st_ino):
+            return True  # hard links
+        with open(self.value, 'rb') as file1:
+            with open(other.value, 'rb') as file2:
+                while True:
+                    block = file1.read(blocksize)
+                    if block != file2.read(blocksize):
+                        return False
+                    elif not block:
+                        return True
+
+    def _reflink(self, dest):
+        """Clone the file's data into dest; return False if not possible."""
+        try:
+            from fcntl import ioctl
+        except ImportError:
+            return False
+        if os.path.lexists(dest.value):
+            os.remove(dest.value)
+        with open(self.value, 'rb') as infile:
+            with open(dest.value, 'wb') as outfile:
+                try:
+                    ioctl(outfile.fileno(), FICLONE, infile.fileno())
+                except (IOError, OSError):
+                    return False
+        return True
+
+    def _link(self, dest, symbolic=False):
+        """Make dest a hard (or symbolic) link to the file; return False
+if not possible."""
+        if os.path.lexists(dest.value):
+            os.remove(dest.value)
+        try:
+            if symbolic:
+                os.symlink(os.path.abspath(self.value), dest.value)
+            else:
+                os.link(self.value, dest.value)
+        except (AttributeError, OSError):  # no links on this system
+            return False
+        return True
+
+    def breaklink(self):
+        """If a symbolic link to a file or a file with other hard links,
+replace it with a copy of the file, so that it can be changed in place
+without changing the others.  Return True if it was replaced."""
+        ftype = self.type
+        if ftype == self.TYPE.LINK:
+            source = self.real
+            if not source.isfile:
+                return False
+        elif ftype == self.TYPE.FILE and self.stat.st_nlink > 1:
+            source = self
+        else:
+            return False
+        getLogger('pyerector.execute').debug('%s.breaklink()', repr(self))
+        temp = self.dirname + ('.%s.%d' % (self.basename, os.getpid()))
+        source.copy(temp)
+        temp.rename(self)
+        return True
 
     # directory operations
 
@@ -406,6 +647,7 @@ create it, if it is not a file, return an exception."""
                 os.mkdir(self.value)
             except OSError:
                 pass
+            modified(self)
         elif self.isdir:
             return
         else:
@@ -433,6 +675,7 @@ create it, if it is not a file, return an exception."""
         else:
             raise TypeError('entry exists')
         self.refresh()
+        modified(self)
 
     # fifo/pipe operations
     def makepipe(self, mode=None):
@@ -444,6 +687,7 @@ create it, if it is not a file, return an exception."""
         else:
             raise TypeError('entry exists')
         self.refresh()
+        modified(self)
 
 # pylint: disable=invalid-name
 homedir = Path(os.environ['HOME'])
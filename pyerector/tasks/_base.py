@@ -3,20 +3,33 @@
 """Base class for registering tasks."""
 
 import logging
+import threading
 
 from ..execute import get_current_stack
 from ..args import Arguments
 from ..exception import Abort, Error
-from ..path import Path
+from ..path import Path, modified
 from ..register import Register
 from ..variables import V
 from ..base import Initer
 from ..iterators import FileMapper, Iterator
 
+class Invocation(object):
+    """The state of one call of a Task: its args and kwargs."""
+
+
 class Task(Initer):
     """A representation of a unit of work.  Generally performs Python code
 directly, either as one of the standard tasks or through the API.  The
 run() method is meant to be overridden.
+The args and kwargs of a call are kept in an Invocation on the execution
+stack, not in the instance, so the same instance can be called from
+several threads at once.  After the call, they remain available in the
+calling thread.
+The results of FileIterators are shared during a build (see WalkCache);
+the Path methods and pyerector.path.modified(path) drop those a change
+affects.  As run() may write files with plain open() or a library, every
+call ends by dropping them all.
 """
     _register = Register()
 
@@ -30,7 +43,39 @@ run() method is meant to be overridden.
         return sorted([cls._register[name] for name in cls._register],
                       key=lambda x: x.__name__)
 
-    args = []
+    def invocation(self):
+        """Return the Invocation of the running call, from this thread
+or a calling thread, else the last one made in this thread, or None."""
+        try:
+            return get_current_stack().context(self)
+        except (AttributeError, KeyError):
+            local = self.__dict__.setdefault('invocations', threading.local())
+            return getattr(local, 'last', None)
+
+    def _get_state(self, name, default):
+        invocation = self.invocation()
+        if invocation is not None and name in invocation.__dict__:
+            return invocation.__dict__[name]
+        return self.__dict__.get(name, default)
+
+    def _set_state(self, name, value):
+        try:
+            invocation = get_current_stack().context(self)
+        except (AttributeError, KeyError):  # not running, set the default
+            self.__dict__[name] = value
+        else:
+            setattr(invocation, name, value)
+
+    args = property(
+        lambda self: self._get_state('args', []),
+        lambda self, value: self._set_state('args', value),
+        doc='The arguments of the current call.'
+    )
+    kwargs = property(
+        lambda self: self._get_state('kwargs', {}),
+        lambda self, value: self._set_state('kwargs', value),
+        doc='The keyword arguments of the current call (old scheme).'
+    )
 
     def __str__(self):
         return self.__class__.__name__
@@ -39,7 +84,11 @@ run() method is meant to be overridden.
         myname = self.__class__.__name__
         self.logger.debug('%s.__call__(*%s, **%s)', myname, args, kwargs)
         stack = get_current_stack()
-        stack.push(self)  # push me onto the execution stack
+        invocation = Invocation()
+        # push me onto the execution stack, with the state of this call
+        stack.push(self, invocation)
+        self.__dict__.setdefault('invocations', threading.local()).last = \
+            invocation
         try:
             if self.has_arguments:
                 self.args = self.arguments.process(
@@ -66,6 +115,8 @@ run() method is meant to be overridden.
                 raise Abort
         finally:
             stack.pop()
+            # whatever run() wrote, FileIterators must see it
+            modified()
         if returncode:
             raise Error(str(self), 'return error = %s' % returncode)
         else:
@@ -109,10 +160,14 @@ before the iterator is called."""
         for name in files:
             self.logger.debug('%s: calling dojob with %s', self.__class__.__name__, name)
             self.dojob(name, context)
+        self.teardown(context)
 
     def dojob(self, name, context=None):
         """To be overridden."""
 
+    def teardown(self, context):
+        """Called with the context after all the jobs.  To be overridden."""
+
 
 class MapperTask(Task):
     """Perform operations on a mapper of files."""
@@ -129,21 +184,30 @@ class MapperTask(Task):
 before the iterator is called."""
         return {}
 
+    def mapper(self):
+        """Return the class of the mapper: mapperclass, default
+FileMapper."""
+        mapcls = self.mapperclass
+        if mapcls is None:
+            return FileMapper
+        elif isinstance(mapcls, Iterator) or \
+                (isinstance(mapcls, type) and issubclass(mapcls, Iterator)):
+            return mapcls
+        raise Error('expecting Iterator or Mapper for mapperclass')
+
     def run(self):
         """Call the job for each file and dest in the arguments."""
-        # we need to include inside the function since iterators wouldn't have loaded yet
-        if self.mapperclass is None:
-            mapcls = FileMapper
-        elif isinstance(self.mapperclass, Iterator):
-            mapcls = self.mapperclass
-        else:
-            raise Error('expecting Iterator or Mapper for mapperclass')
+        mapcls = self.mapper()
         context = self.setup()
         # pylint: disable=no-member
         fmap = mapcls(self.get_files(), destdir=self.args.dest)
         for (sname, dname) in fmap:
             self.dojob(sname, dname, context)
+        self.teardown(context)
 
     def dojob(self, sname, dname, context):
         """To be overridden."""
 
+    def teardown(self, context):
+        """Called with the context after all the jobs.  To be overridden."""
+
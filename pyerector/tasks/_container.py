@@ -2,21 +2,132 @@
 # Copyright @ 2017 Michael P. Reilly. All rights reserved.
 """Superclasses for Tar/Untar, Zip/Unzip and Egg tasks."""
 
+import heapq
 import os
 
 from ..args import Arguments
-from ..path import Path
+from ..path import Path, modified
 from ..base import Initer
 from ..iterators import Iterator, FileIterator
 from ._base import Task
+from ._streams import Channel, DigestWriter
+
+def digestnames(value):
+    """Cast a digest name, or a sequence of them, to a tuple."""
+    if isinstance(value, (list, tuple, set)):
+        return tuple(value)
+    return (str(value),)
+
+
+def gather(files, root):
+    """Return the set of Paths given by files, expanding Iterators and
+glob patterns, but not directories."""
+    roots = set()
+    queue = list(files)
+    while queue:
+        entry = queue.pop()
+        try:
+            if isinstance(entry, Path):
+                roots.add(entry)
+            elif isinstance(entry, str):
+                roots.add(Path(entry))
+            else:
+                if isinstance(entry, Iterator):
+                    sequence = iter(entry)
+                else:
+                    sequence = root.glob(entry)
+                for fname in sequence:
+                    if not isinstance(fname, Path):
+                        fname = Path(fname)
+                    roots.add(fname)
+        except TypeError:
+            pass
+    return roots
+
+
+class Members(object):
+    """The files to put into a container, in sorted order.  They are walked
+afresh each time they are iterated, one directory at a time, so memory does
+not grow with their number; excluded directories are not descended, and the
+files that skip(fname) is true for are left out.  Appended Paths (generated
+files) are merged in.  Members of other archives (virtual Paths, from a
+ZipIterator or TarIterator) follow, in the order of their archives, so that
+each archive is read through once."""
+    def __init__(self, roots, excludes, skip=None):
+        roots = set(roots)
+        self.roots = sorted(fname for fname in roots if not fname.virtual)
+        self.virtual = sorted(
+            (fname for fname in roots if fname.virtual),
+            key=lambda fname: fname.order
+        )
+        self.excludes = excludes
+        self.skip = skip
+        self.extra = []
+
+    def __iter__(self):
+        previous = None
+        walks = [self.walk(fname) for fname in self.roots]
+        for fname in self.extra:
+            fname.refresh()  # generated after they were added
+        walks.append(iter(sorted(self.extra)))
+        for fname in heapq.merge(*walks):
+            if fname.value != previous:  # given more than once
+                previous = fname.value
+                yield fname
+        for fname in self.virtual:
+            if not self.excludes.match(fname):
+                yield fname
+
+    def append(self, fname):
+        """Add a file, which need not be under the roots."""
+        if not isinstance(fname, Path):
+            fname = Path(fname)
+        if fname not in self.extra:
+            self.extra.append(fname)
+
+    def walk(self, fname):
+        """Yield the files at or under fname, in sorted order of their
+names; the stat data already on the Paths is used."""
+        ftype = Path.stat_type(fname.stat)
+        if self.excludes.match(fname):  # if true, ignore
+            pass
+        elif ftype in (Path.TYPE.LINK, Path.TYPE.FILE):
+            if self.skip is None or not self.skip(fname):
+                yield fname
+        elif ftype == Path.TYPE.DIR:
+            # a directory sorts as its name with a trailing separator, so
+            # the order is that of the whole pathnames
+            entries = sorted(
+                (entry.components[-1] + os.sep
+                 if Path.stat_type(entry.stat) == Path.TYPE.DIR
+                 else entry.components[-1], entry)
+                for entry in fname
+            )
+            for _, entry in entries:
+                for member in self.walk(entry):
+                    yield member
+
 
 class Container(Task):
-    """An internal task for subclassing standard classes Tar and Zip."""
+    """An internal task for subclassing standard classes Tar and Zip.
+The members are passed to manifest() and contain() as a Members instance,
+which walks the files each time it is iterated, in sorted order.
+A hidden manifest, ".<name>.manifest" beside the archive, records the
+options, the archive's own size and time, and a fingerprint of each member;
+when none of these have changed, the archive is not rebuilt.  Subclasses
+list the keywords that change the archive's format in 'options'.
+With digests=('sha256', ...), the archive is hashed as it is written, and
+"<name>.<digest>" files written as HashGen would, without reading it back."""
+    options = ()
     arguments = Arguments(
         Arguments.List('files', types=(Iterator, Path, str), cast=FileIterator),
         Arguments.Keyword('name', types=(Path, str), noNone=True),
         Arguments.Keyword('root', types=(Path, str), default=os.curdir,
                           cast=Path),
+        Arguments.Keyword('digests', types=(tuple, list, str), default=(),
+                          cast=digestnames),
+        # the Channel of a MultiArchive
+        Arguments.Keyword('source', types=Channel),
     ) + Initer.basearguments
 
     def run(self):
@@ -31,39 +142,205 @@ class Container(Task):
         self.logger.debug('Container.run(name=%s, root=%s, excludes=%s)',
                           repr(name), repr(root), repr(excludes))
         self.preop(name, root, excludes)
-        toadd = set()
-        queue = list(files)
-        self.logger.debug('Container.run: files=%s', queue)
-        while queue:
-            entry = queue[0]
-            del queue[0]
-            try:
-                if isinstance(entry, (Path, str)):
-                    self._check_path(Path(entry), toadd, excludes, queue)
-                else:
-                    if isinstance(entry, Iterator):
-                        sequence = iter(entry)
-                    else:
-                        sequence = root.glob(entry)
-                    for fname in sequence:
-                        self._check_path(Path(fname), toadd, excludes, queue)
-            except TypeError:
-                pass
-        toadd = sorted(toadd)  # covert set to a list and sort
+        roots = gather(files, root)
+        self.logger.debug('Container.run: roots=%s', sorted(roots))
+        toadd = Members(roots, excludes, self.ownfiles(name))
         self.manifest(name, root, toadd)
-        self.contain(name, root, toadd)
+        newmanifest = self.sidecar(name).value + '.new'
+        try:
+            if self.uptodate(name, root, toadd, newmanifest):
+                self.logger.info('%s: %s is uptodate',
+                                 self.__class__.__name__, name)
+                self.write_digests(name)
+                return
+            try:
+                self.contain(name, root, toadd)
+            except Exception:
+                # do not leave digests of a partial archive
+                for digest in self.args.digests:
+                    self.join('%s.%s' % (name, digest)).remove()
+                raise
+            modified(self.join(name))
+            self.write_manifest(name, newmanifest)
+        finally:
+            if os.path.exists(newmanifest):
+                os.remove(newmanifest)
         self.postop(name, root, toadd)
 
     @staticmethod
-    def _check_path(fname, toadd, excludes, queue):
-        """Ignore excluded files, add directories to the queue, or to the
-toadd."""
-        if excludes.match(fname):  # if true, ignore
-            pass
-        elif fname.islink or fname.isfile:
-            toadd.add(fname)
-        elif fname.isdir:
-            queue.extend(fname)  # expand directory listing
+    def arcname(fname, root):
+        """Return the name of the member in the archive, as a str."""
+        return os.path.relpath(str(fname), str(root))
+
+    def output(self, filename, target=None):
+        """Open the file to write the archive to, through a DigestWriter
+if there are digests (of target, default filename)."""
+        outfile = open(filename, 'wb')
+        # pylint: disable=no-member
+        if self.args.digests:
+            return DigestWriter(outfile, self.args.digests, target or filename)
+        return outfile
+
+    def write_digests(self, name):
+        """Write the digest files of the archive that are missing, reading
+it once for all of them."""
+        archive = self.join(name)
+        # pylint: disable=no-member
+        missing = [digest for digest in self.args.digests
+                   if not self.join('%s.%s' % (name, digest)).exists]
+        if not missing:
+            return
+        self.logger.debug('writing digests %s of %s', missing, archive)
+        outfile = DigestWriter(open(os.devnull, 'wb'), missing, archive.value)
+        try:
+            with archive.open('rb') as infile:
+                for block in iter(lambda: infile.read(1 << 20), b''):
+                    outfile.write(block)
+        except Exception:
+            outfile.hashes = []  # not of the whole archive
+            raise
+        finally:
+            outfile.close()
+
+    def source(self, fname):
+        """Return an open file to read the member from: the data read by a
+MultiArchive if there is one, else the file itself (or the member of the
+other archive)."""
+        # pylint: disable=no-member
+        channel = self.args.source
+        if channel is not None:
+            data = channel.get(fname)
+            if data is not None:
+                return data
+        if fname.virtual:
+            return fname.open('rb')
+        return open(str(self.join(fname)), 'rb')
+
+    def sidecar(self, name):
+        """Return the Path of the archive's manifest."""
+        archive = self.join(name)
+        return archive.dirname + ('.%s.manifest' % archive.components[-1])
+
+    def ownfiles(self, name):
+        """Return a function that is true for the archive and for the
+files written beside it (".<name>.*" and "<name>.<digest>"), which are
+never members."""
+        archive = self.join(name)
+        dirname = self.directory(archive)
+        basename = archive.components[-1]
+        prefix = '.%s.' % basename
+        # pylint: disable=no-member
+        names = set([basename] + ['%s.%s' % (basename, digest)
+                                  for digest in self.args.digests])
+
+        def isown(fname):
+            """Check the basename first, as that needs no Path."""
+            last = fname.components[-1]
+            return (last in names or last.startswith(prefix)) and \
+                self.directory(self.join(fname)) == dirname
+        return isown
+
+    @staticmethod
+    def directory(fname):
+        """Return the normalized directory name of the Path."""
+        return os.path.normpath(os.path.dirname(fname.value) or os.curdir)
+
+    def signature(self):
+        """Return a string of the class and the options of the archive."""
+        # pylint: disable=no-member
+        return ' '.join(
+            [self.__class__.__name__] +
+            ['%s=%r' % (key, getattr(self.args, key)) for key in self.options]
+        )
+
+    def fingerprint(self, fname, root):
+        """Return the manifest line of a file, from its stat data (symbolic
+links include their target's), or None if it is gone."""
+        stat = fname.stat
+        if stat is None:
+            stat = self.join(fname).stat
+        if stat is None:
+            return None  # gone; contain() will report it
+        fingerprint = '%d %d %o' % (stat.st_size, int(stat.st_mtime),
+                                    stat.st_mode)
+        if Path.stat_type(stat) == Path.TYPE.LINK:
+            fullname = self.join(fname).value
+            try:
+                target = os.stat(fullname)
+            except OSError:
+                target = stat
+            fingerprint += ' %s %d %d' % (os.readlink(fullname),
+                                          target.st_size,
+                                          int(target.st_mtime))
+        return '%s\t%s\n' % (fingerprint, self.arcname(fname, root))
+
+    def open_manifest(self, name):
+        """Return the manifest opened at its first member's line, if it is
+of the current archive with the current options, otherwise None."""
+        archive = self.join(name)
+        if archive.stat is None:
+            return None
+        try:
+            infile = open(self.sidecar(name).value, 'r')
+        except (IOError, OSError):
+            return None
+        if infile.readline() != self.signature() + '\n' or \
+                infile.readline() != '%d %d\n' % (
+                    archive.stat.st_size, int(archive.stat.st_mtime)):
+            infile.close()
+            return None
+        return infile
+
+    def uptodate(self, name, root, toadd, newmanifest):
+        """Write the fingerprints of the members to newmanifest, comparing
+them, in order, with the archive's manifest; return True if the archive
+has the members as they are now."""
+        previous = self.open_manifest(name)
+        same = previous is not None
+        with open(newmanifest, 'w') as outfile:
+            for fname in toadd:
+                line = self.fingerprint(fname, root)
+                if line is not None:
+                    outfile.write(line)
+                    if same and previous.readline() != line:
+                        same = False
+        if previous is not None:
+            if same and previous.readline():
+                same = False  # members were removed
+            previous.close()
+        return same
+
+    def write_manifest(self, name, newmanifest):
+        """Record the archive as just built, with the fingerprints taken
+before it was."""
+        import shutil
+        archive = self.join(name)
+        if archive.stat is None:
+            return
+        with open(newmanifest, 'r') as infile:
+            with self.sidecar(name).open('w') as outfile:
+                outfile.write('%s\n%d %d\n' % (
+                    self.signature(), archive.stat.st_size,
+                    int(archive.stat.st_mtime)
+                ))
+                shutil.copyfileobj(infile, outfile)
+
+    def unchanged(self, name, root, toadd):
+        """Yield (fname, arcname, unchanged) for each member, unchanged
+being True if its fingerprint is that in the archive's manifest."""
+        previous = self.open_manifest(name)
+        try:
+            old = previous.readline() if previous is not None else ''
+            for fname in toadd:
+                arcname = self.arcname(fname, root)
+                line = self.fingerprint(fname, root)
+                # both are in the same order; catch up to this member
+                while old and old.rstrip('\n').partition('\t')[2] < arcname:
+                    old = previous.readline()
+                yield fname, arcname, line is not None and old == line
+        finally:
+            if previous is not None:
+                previous.close()
 
     def preop(self, name, root, excludes):
         """To be overridden."""
@@ -79,13 +356,43 @@ toadd."""
 
 
 class Uncontainer(Task):
-    """Super-class for Untar and Unzip."""
+    """Super-class for Untar and Unzip.
+The files are the names of members, or glob patterns matching them (default
+all); they are not looked for in the file system."""
     arguments = Arguments(
-        Arguments.List('files', types=(Iterator, Path, str), cast=FileIterator),
+        Arguments.List('files', types=(Iterator, Path, str)),
         Arguments.Keyword('name', types=(Path, str), noNone=True),
         Arguments.Keyword('root', types=(Path, str)),
     )
 
+    def get_files(self, files=None, arg='files'):
+        """Return the member names and patterns as given."""
+        # pylint: disable=no-member
+        return self.args[arg] if files is None else files
+
+    @staticmethod
+    def matcher(files):
+        """Return a function that is true for the member names to extract:
+those given, those matching a pattern, but none outside the root."""
+        from fnmatch import fnmatchcase
+        names = set()
+        patterns = []
+        for fname in files:
+            fname = str(fname)
+            if any(char in fname for char in '*?['):
+                patterns.append(fname)
+            else:
+                names.add(fname)
+
+        def match(member):
+            """Check the set before the patterns."""
+            if member.startswith(os.sep) or member.startswith(os.pardir) or \
+                    os.path.normpath(member).startswith(os.pardir):
+                return False
+            return (not names and not patterns) or member in names or \
+                any(fnmatchcase(member, patt) for patt in patterns)
+        return match
+
     def run(self):
         """Extract members from the container."""
         files = self.get_files()
@@ -103,6 +410,7 @@ class Uncontainer(Task):
             fileset = self.retrieve_members(contfile, files)
             self.extract_members(contfile, fileset, root)
             contfile.close()
+            modified(self.join(os.curdir if root is None else root))
 
     def get_file(self, name):
         """To be overridden."""
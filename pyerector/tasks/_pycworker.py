@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# Copyright @ 2017 Michael P. Reilly. All rights reserved.
+"""Check and compile Python source files for PyCompile.  Used in the
+running interpreter, or run as a script by another Python, when it reads
+pathnames, a line each, from its standard input, and writes a line for each:
+"fresh", "compiled" or "error", a tab and the pathname (and for errors, a
+tab and the message).  It imports nothing from pyerector, so that any
+version of Python can run it."""
+
+import os
+import sys
+
+if __name__ == '__main__' and sys.path and \
+        os.path.abspath(sys.path[0]) == os.path.dirname(
+            os.path.abspath(__file__)):
+    # the modules beside this one (like tokenize) would hide the standard
+    # library's
+    del sys.path[0]
+
+# pylint: disable=wrong-import-position
+import py_compile
+import struct
+
+try:
+    from importlib.util import cache_from_source, MAGIC_NUMBER
+except ImportError:
+    import imp
+    cache_from_source = getattr(imp, 'cache_from_source', None)
+    MAGIC_NUMBER = imp.get_magic()
+try:
+    from importlib.util import source_hash
+except ImportError:
+    source_hash = None
+
+
+def cachefile(source):
+    """Return the pathname of the compiled file of the source."""
+    if cache_from_source is None:
+        return source + (__debug__ and 'c' or 'o')
+    return cache_from_source(source)
+
+
+def fresh(source):
+    """Return True if the compiled file is of the source as it is: the
+header has the same magic number and the source's time and size or, for
+PEP 552 hash-based files, its hash."""
+    try:
+        stat = os.stat(source)
+        with open(cachefile(source), 'rb') as infile:
+            header = infile.read(16)
+    except (IOError, OSError):
+        return False
+    if header[:4] != MAGIC_NUMBER:
+        return False
+    if sys.version_info >= (3, 7):
+        flags = struct.unpack('<I', header[4:8])[0]
+        if flags & 1:  # hash-based
+            with open(source, 'rb') as infile:
+                return header[8:16] == source_hash(infile.read())
+        fields = header[8:16]
+    elif sys.version_info >= (3, 3):
+        fields = header[4:12]
+    else:  # no size
+        fields = header[4:8]
+    expected = struct.pack('<II', int(stat.st_mtime) & 0xFFFFFFFF,
+                           stat.st_size & 0xFFFFFFFF)
+    return fields == expected[:len(fields)]
+
+
+def compile_source(source):
+    """Compile the source unless it is fresh; return a (status, message)
+pair."""
+    if fresh(source):
+        return 'fresh', ''
+    try:
+        py_compile.compile(source, doraise=True)
+    except py_compile.PyCompileError:
+        return 'error', str(sys.exc_info()[1].msg).replace('\n', ' ')
+    except (IOError, OSError):
+        return 'error', str(sys.exc_info()[1])
+    return 'compiled', ''
+
+
+def main():
+    """Serve the requests on the standard input, until it is closed."""
+    stdin = getattr(sys.stdin, 'buffer', sys.stdin)
+    stdout = getattr(sys.stdout, 'buffer', sys.stdout)
+    for line in iter(stdin.readline, b''):
+        source = line.rstrip(b'\n')
+        if sys.version_info[0] >= 3:
+            source = source.decode('utf-8')
+        status, message = compile_source(source)
+        reply = '%s\t%s\t%s\n' % (status, source, message)
+        if sys.version_info[0] >= 3:
+            reply = reply.encode('utf-8')
+        stdout.write(reply)
+        stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,585 @@
+#!/usr/bin/python
+# Copyright @ 2017 Michael P. Reilly. All rights reserved.
+"""File-like objects used by the archive tasks."""
+
+import hashlib
+import io
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+from ..execute import WorkerPool
+try:
+    from queue import Queue, Full
+except ImportError:
+    from Queue import Queue, Full
+
+__all__ = [
+    'Channel',
+    'DigestWriter',
+    'GzipReader',
+    'ParallelGzipWriter',
+    'TarIndex',
+    'ZipMember',
+    'ZipWriter',
+]
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP64_LIMIT = (1 << 31) - 1
+# compressed members larger than this are spooled to disk
+SPOOLSIZE = 1 << 20
+
+
+class Channel(object):
+    """The files read once by a MultiArchive, as one archive sees them: in
+sorted order of their pathnames, each as (pathname, data), with data None
+if the file was too large to pass around.  The queue is bounded, so the
+reader waits for the slowest archive; an archive that closes its channel
+(when it is done, even if it read nothing) no longer holds it back."""
+    ended = object()
+
+    def __init__(self, size=8):
+        self.queue = Queue(size)
+        self.closed = False
+        self.pending = None
+
+    def put(self, item):
+        """Send (pathname, data), or None at the end; waits while the queue
+is full, unless the channel is closed."""
+        while not self.closed:
+            try:
+                self.queue.put(item, timeout=0.1)
+            except Full:
+                continue
+            return
+
+    def close(self):
+        """Stop receiving files."""
+        self.closed = True
+
+    def get(self, fname):
+        """Return a file object of the data of fname (a Path) if it is the
+next file read, otherwise None; the files before it are passed over."""
+        while self.pending is not self.ended:
+            if self.pending is None:
+                self.pending = self.queue.get()
+                if self.pending is None:
+                    self.pending = self.ended
+                    break
+            value, data = self.pending
+            if value < fname.value:
+                self.pending = None
+            elif value == fname.value:
+                self.pending = None
+                return None if data is None else io.BytesIO(data)
+            else:
+                return None  # not read for us, keep it for later
+        return None
+
+
+class DigestWriter(object):
+    """A write-only file object that hashes the data on its way to the
+file; when closed, each digest is written, as HashGen does, to
+"<filename>.<digest>".
+    out = DigestWriter(open('dist.zip', 'wb'), ('sha256',), 'dist.zip')
+"""
+    def __init__(self, fileobj, digests, filename):
+        self.hashes = [(digest, hashlib.new(digest)) for digest in digests]
+        self.fileobj = fileobj
+        self.name = filename
+        self.offset = 0
+        self.closed = False
+
+    def write(self, data):
+        """Hash and write the data."""
+        for _, hashval in self.hashes:
+            hashval.update(data)
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def tell(self):
+        """Return the number of bytes written."""
+        return self.offset
+
+    def flush(self):
+        """Flush the file."""
+        self.fileobj.flush()
+
+    def close(self):
+        """Close the file, then write the digest files."""
+        from ..path import Path
+        if self.closed:
+            return
+        self.closed = True
+        self.fileobj.close()
+        for digest, hashval in self.hashes:
+            with Path('%s.%s' % (self.name, digest)).open('wt') as outfile:
+                outfile.write(hashval.hexdigest() + '\n')
+
+
+def gzip_member(data, level=9):
+    """Return the data as a complete gzip member (RFC 1952), with no
+name and a zero time, so the output depends only on the data."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = compressor.compress(data) + compressor.flush()
+    header = b'\x1f\x8b\x08\x00' + struct.pack('<I', 0) + b'\x00\xff'
+    trailer = struct.pack('<II', zlib.crc32(data) & 0xffffffff,
+                          len(data) & 0xffffffff)
+    return header + body + trailer
+
+
+class ParallelGzipWriter(object):
+    """A write-only file object that compresses blocks of the data on
+worker threads (zlib releases the GIL) and writes them, in order, as
+concatenated gzip members; gzip, gunzip and tarfile read these as one
+stream.  The output depends on the blocksize, not on the threads.  Where each
+member starts is kept in points, as (compressed, uncompressed) offsets.
+    with ParallelGzipWriter(open('dist.tgz', 'wb'), threads=4) as out:
+        out.write(data)
+"""
+    def __init__(self, fileobj, level=9, threads=None, blocksize=1 << 20):
+        self.fileobj = fileobj
+        self.level = level
+        self.blocksize = blocksize
+        self.pool = WorkerPool(threads)
+        self.pool.__enter__()
+        # (uncompressed offset, result) of the blocks being compressed,
+        # oldest first
+        self.pending = []
+        self.buffer = []
+        self.buffered = 0
+        self.offset = 0
+        self.written = 0
+        self.points = []
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, evalue, etb):
+        self.close()
+
+    def write(self, data):
+        """Buffer the data, sending each full block to be compressed."""
+        if self.closed:
+            raise ValueError('write to closed file')
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= self.blocksize:
+            data = b''.join(self.buffer)
+            whole = len(data) - len(data) % self.blocksize
+            for start in range(0, whole, self.blocksize):
+                self.send(data[start:start + self.blocksize])
+            self.buffer = [data[whole:]]
+            self.buffered = len(data) - whole
+
+    def send(self, block):
+        """Compress the block on a worker; write what is done so far,
+waiting if too many blocks are outstanding."""
+        self.pending.append((self.offset, self.pool.submit(
+            lambda b, l=self.level: gzip_member(b, l), block
+        )))
+        self.offset += len(block)
+        while len(self.pending) > self.pool.size * 2:
+            self.writeone()
+
+    def writeone(self):
+        """Wait for the oldest block and write it."""
+        offset, result = self.pending.pop(0)
+        member = result()
+        self.points.append((self.written, offset))
+        self.fileobj.write(member)
+        self.written += len(member)
+
+    def flush(self):
+        """Only the underlying file is flushed; blocks are written as they
+are completed."""
+        self.fileobj.flush()
+
+    def close(self):
+        """Compress the rest, write everything and close the file."""
+        if self.closed:
+            return
+        try:
+            if self.buffered or not self.pending:
+                self.send(b''.join(self.buffer))
+            while self.pending:
+                self.writeone()
+        finally:
+            self.closed = True
+            self.pool.__exit__(None, None, None)
+            self.fileobj.close()
+
+
+class GzipReader(object):
+    """A read-only file object of the data of a gzip file of one or more
+members, which seeks forward by reading, or from the nearest of the seek
+points, (compressed, uncompressed) offsets where members start.  Those
+found while reading are added to found.
+    reader = GzipReader('dist.tgz', [(0, 0), (81920, 1048576)])
+    reader.seek(2000000)
+"""
+    def __init__(self, filename, points=((0, 0),), blocksize=1 << 16):
+        self.fileobj = open(filename, 'rb')
+        self.points = sorted(set(points) | set([(0, 0)]))
+        self.blocksize = blocksize
+        self.found = []
+        self.restart(0, 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, evalue, etb):
+        self.close()
+
+    def restart(self, coffset, offset):
+        """Start decompressing at a seek point."""
+        self.fileobj.seek(coffset)
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.buffer = b''
+        self.position = offset
+
+    def fill(self):
+        """Decompress another block; return False at the end."""
+        data = self.fileobj.read(self.blocksize)
+        if not data:
+            return False
+        end = self.fileobj.tell()
+        out = []
+        while data:
+            out.append(self.decompressor.decompress(data))
+            data = self.decompressor.unused_data
+            if data:  # the member ended, another starts
+                self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+                self.found.append((
+                    end - len(data),
+                    self.position + len(self.buffer) + sum(map(len, out))
+                ))
+        self.buffer += b''.join(out)
+        return True
+
+    def read(self, size=-1):
+        """Read up to size bytes (all if negative)."""
+        while (size < 0 or len(self.buffer) < size) and self.fill():
+            pass
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        self.position += len(data)
+        return data
+
+    def tell(self):
+        """Return the uncompressed offset."""
+        return self.position
+
+    def seek(self, offset, whence=0):
+        """Move to the uncompressed offset, from the nearest seek point if
+that is closer than reading on."""
+        if whence == 1:
+            offset += self.position
+        elif whence != 0:
+            raise ValueError('cannot seek from the end')
+        coffset, start = [point for point in self.points
+                          if point[1] <= offset][-1]
+        if offset < self.position or start > self.position:
+            self.restart(coffset, start)
+        while self.position < offset:
+            if not self.read(min(offset - self.position, 1 << 20)):
+                break
+        return self.position
+
+    def close(self):
+        """Close the file."""
+        self.fileobj.close()
+
+
+class TarIndex(object):
+    """An index of a gzipped tar archive: the gzip seek points and the
+offsets of the members' headers, kept in ".<name>.index" beside it, with
+the archive's size and time.  Members are listed without decompressing, and
+extracted by seeking to them.
+    index = TarIndex.load('dist.tgz') or TarIndex.build('dist.tgz')
+    index.extract([name for _, name in index.members], 'build')
+"""
+    def __init__(self, filename, points=(), members=()):
+        self.filename = filename
+        self.points = list(points)
+        # (header offset, name)
+        self.members = list(members)
+
+    @staticmethod
+    def sidecar(filename):
+        """Return the pathname of the index of the archive."""
+        dirname, basename = os.path.split(filename)
+        return os.path.join(dirname, '.%s.index' % basename)
+
+    @staticmethod
+    def stamp(filename):
+        """Return the line identifying the archive as it is."""
+        stat = os.stat(filename)
+        return '%d %d\n' % (stat.st_size, int(stat.st_mtime))
+
+    @classmethod
+    def load(cls, filename):
+        """Return the archive's index, or None if it has none that is
+current."""
+        try:
+            infile = open(cls.sidecar(filename), 'r')
+        except (IOError, OSError):
+            return None
+        with infile:
+            if infile.readline() != cls.stamp(filename):
+                return None
+            index = cls(filename)
+            for line in infile:
+                kind, _, rest = line.rstrip('\n').partition(' ')
+                if kind == 'P':
+                    index.points.append(tuple(map(int, rest.split())))
+                elif kind == 'M':
+                    offset, _, name = rest.partition('\t')
+                    index.members.append((int(offset), name))
+        return index
+
+    @classmethod
+    def build(cls, filename):
+        """Read the archive once to index it, and save the index."""
+        import tarfile
+        index = cls(filename)
+        with GzipReader(filename) as reader:
+            tfile = tarfile.open(fileobj=reader, mode='r|')
+            for info in tfile:
+                index.members.append((info.offset, info.name))
+            tfile.close()
+            index.points = [(0, 0)] + reader.found
+        index.save()
+        return index
+
+    def save(self):
+        """Write the index beside the archive."""
+        with open(self.sidecar(self.filename), 'w') as outfile:
+            outfile.write(self.stamp(self.filename))
+            for coffset, offset in self.points:
+                outfile.write('P %d %d\n' % (coffset, offset))
+            for offset, name in self.members:
+                outfile.write('M %d\t%s\n' % (offset, name))
+
+    def extract(self, names, path):
+        """Extract the named members under path, in the archive's order,
+seeking to each."""
+        import tarfile
+        names = set(names)
+        seen = {}  # the offset of the latest member of each name
+        with GzipReader(self.filename, self.points) as reader:
+            for offset, name in self.members:
+                seen[name] = offset
+                if name not in names:
+                    continue
+                reader.seek(offset)
+                tfile = tarfile.open(fileobj=reader, mode='r|')
+                info = tfile.next()
+                if info.islnk():
+                    # a hard link has no data of its own; extract the
+                    # target's data as this member
+                    if info.linkname not in seen:
+                        raise ValueError('linkname %r not found in %s' %
+                                         (info.linkname, self.filename))
+                    reader.seek(seen[info.linkname])
+                    tfile = tarfile.open(fileobj=reader, mode='r|')
+                    target = tfile.next()
+                    target.name = info.name
+                    info = target
+                tfile.extract(info, path=path)
+
+    def close(self):
+        """Nothing is kept open between extractions."""
+
+
+class ZipMember(object):
+    """A file compressed, ready to be written to a ZipWriter.  The data is
+read (from a file name or an open file, which is closed) and compressed when
+created, so this can be done on worker threads."""
+    # pylint: disable=too-many-arguments
+    def __init__(self, filename, arcname, stat, method=ZIP_DEFLATED,
+                 level=-1, blocksize=1 << 16):
+        self.arcname = arcname
+        self.mode = stat.st_mode
+        self.mtime = stat.st_mtime
+        self.method = method
+        self.data = tempfile.SpooledTemporaryFile(max_size=SPOOLSIZE)
+        if method == ZIP_DEFLATED:
+            compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                          -zlib.MAX_WBITS)
+        elif method == ZIP_STORED:
+            compressor = None
+        else:
+            raise ValueError('unsupported zip method: %s' % method)
+        crc = size = 0
+        if not hasattr(filename, 'read'):
+            filename = open(filename, 'rb')
+        with filename as infile:
+            for block in iter(lambda: infile.read(blocksize), b''):
+                crc = zlib.crc32(block, crc)
+                size += len(block)
+                if compressor is not None:
+                    block = compressor.compress(block)
+                self.data.write(block)
+        if compressor is not None:
+            self.data.write(compressor.flush())
+        self.crc = crc & 0xffffffff
+        self.size = size
+        self.csize = self.data.tell()
+
+    @classmethod
+    def fromzip(cls, filename, info, blocksize=1 << 16):
+        """Return the member as stored in an existing archive (a ZipInfo),
+with its compressed data copied as it is."""
+        member = cls.__new__(cls)
+        member.arcname = info.filename
+        member.mode = info.external_attr >> 16
+        member.mtime = time.mktime(info.date_time + (0, 0, -1))
+        member.method = info.compress_type
+        member.crc = info.CRC
+        member.size = info.file_size
+        member.csize = info.compress_size
+        member.data = tempfile.SpooledTemporaryFile(max_size=SPOOLSIZE)
+        if not hasattr(filename, 'read'):
+            filename = open(filename, 'rb')
+        with filename as infile:
+            infile.seek(info.header_offset)
+            header = infile.read(30)
+            if len(header) < 30 or header[:4] != b'PK\x03\x04':
+                raise ValueError('bad zip member: %s' % info.filename)
+            infile.seek(sum(struct.unpack('<HH', header[26:30])), 1)
+            remaining = info.compress_size
+            while remaining:
+                block = infile.read(min(remaining, blocksize))
+                if not block:
+                    raise ValueError('truncated zip member: %s' %
+                                     info.filename)
+                member.data.write(block)
+                remaining -= len(block)
+        return member
+
+    def dostime(self):
+        """Return the (time, date) fields of the modification time."""
+        mtime = time.localtime(self.mtime)
+        if mtime.tm_year < 1980:
+            return 0, (1 << 5) | 1
+        return ((mtime.tm_hour << 11) | (mtime.tm_min << 5) |
+                (mtime.tm_sec // 2),
+                ((mtime.tm_year - 1980) << 9) | (mtime.tm_mon << 5) |
+                mtime.tm_mday)
+
+
+class ZipWriter(object):
+    """A zip archive written from ZipMembers, in the order they are added.
+Zip64 records are used only when they are needed; with zip64=False, an
+archive needing them raises ValueError.
+    with ZipWriter(open('dist.zip', 'wb')) as zfile:
+        zfile.add(ZipMember('setup.py', 'setup.py', os.stat('setup.py')))
+"""
+    def __init__(self, fileobj, zip64=True):
+        self.fileobj = fileobj
+        self.zip64 = zip64
+        self.offset = 0
+        self.central = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, etype, evalue, etb):
+        if etype is None:
+            self.close()
+        else:
+            self.fileobj.close()
+
+    def need64(self, what):
+        """Raise ValueError unless zip64 records may be written."""
+        if not self.zip64:
+            raise ValueError('zip64 is needed for %s' % what)
+
+    def write(self, data):
+        """Write the data, keeping track of the offset."""
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def add(self, member):
+        """Write the member's local header and data."""
+        name = member.arcname
+        if not isinstance(name, bytes):
+            name = name.encode('utf-8')
+        try:
+            name.decode('ascii')
+            flags = 0
+        except UnicodeError:
+            flags = 0x800  # the name is utf-8
+        large = member.size > ZIP64_LIMIT or member.csize > ZIP64_LIMIT
+        if large:
+            self.need64(member.arcname)
+            extra = struct.pack('<HHQQ', 1, 16, member.size, member.csize)
+            sizes = (0xffffffff, 0xffffffff)
+        else:
+            extra = b''
+            sizes = (member.csize, member.size)
+        dostime, dosdate = member.dostime()
+        version = 45 if large else 20
+        offset = self.offset
+        self.write(struct.pack(
+            '<IHHHHHIIIHH', 0x04034b50, version, flags, member.method,
+            dostime, dosdate, member.crc, sizes[0], sizes[1], len(name),
+            len(extra)) + name + extra)
+        member.data.seek(0)
+        for block in iter(lambda: member.data.read(1 << 16), b''):
+            self.write(block)
+        member.data.close()
+        self.central.append((member, name, flags, offset))
+
+    def close(self):
+        """Write the central directory and close the file."""
+        start = self.offset
+        for member, name, flags, offset in self.central:
+            self.write(self.directory_entry(member, name, flags, offset))
+        count = len(self.central)
+        size = self.offset - start
+        if count >= 0xffff or start > ZIP64_LIMIT or size > ZIP64_LIMIT:
+            self.need64('the central directory')
+            end64 = self.offset
+            self.write(struct.pack(
+                '<IQHHIIQQQQ', 0x06064b50, 44, (3 << 8) | 45, 45, 0, 0,
+                count, count, size, start))
+            self.write(struct.pack('<IIQI', 0x07064b50, 0, end64, 1))
+        self.write(struct.pack(
+            '<IHHHHIIH', 0x06054b50, 0, 0, min(count, 0xffff),
+            min(count, 0xffff), min(size, 0xffffffff),
+            min(start, 0xffffffff), 0))
+        self.fileobj.close()
+
+    def directory_entry(self, member, name, flags, offset):
+        """Return the central directory record of a member."""
+        fields = []
+        sizes = [member.csize, member.size]
+        if member.size > ZIP64_LIMIT:
+            fields.append(member.size)
+            sizes[1] = 0xffffffff
+        if member.csize > ZIP64_LIMIT:
+            fields.append(member.csize)
+            sizes[0] = 0xffffffff
+        if offset > ZIP64_LIMIT:
+            self.need64(member.arcname)
+            fields.append(offset)
+            offset = 0xffffffff
+        if fields:
+            extra = struct.pack('<HH%dQ' % len(fields), 1, 8 * len(fields),
+                                *fields)
+        else:
+            extra = b''
+        version = 45 if fields else 20
+        dostime, dosdate = member.dostime()
+        return struct.pack(
+            '<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | version, version,
+            flags, member.method, dostime, dosdate, member.crc, sizes[0],
+            sizes[1], len(name), len(extra), 0, 0, 0,
+            (member.mode & 0xffff) << 16, offset) + name + extra
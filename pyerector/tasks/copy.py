@@ -2,33 +2,131 @@
 # Copyright @ 2017 Michael P. Reilly. All rights reserved.
 """Tasks plugin for Copy."""
 
-from ..helper import newer
+import os
+
+from ..args import Arguments
+from ..path import Path
 from ._base import MapperTask
 
+def destinations(value):
+    """Cast the dest argument to a Path, or a tuple of Paths."""
+    if isinstance(value, (tuple, list)):
+        return tuple(Path(item) for item in value)
+    return Path(value)
+
+
 class Copy(MapperTask):
     """Copy files to a destination directory, Exclude standard
-hidden files.
+hidden files.  The data is copied by the kernel where possible, see
+Path.copy(); the total bytes copied is logged at the end.
+With link='hard', 'reflink', 'symlink' or 'auto', the files are linked
+instead of copied where possible, e.g. for staging files that will only
+be read.  A hard link ('hard', or 'auto' without reflinks) is the source
+file itself: Chmod, or a Tokenize or Filter writing it in place, changes
+the source too, unless Path.breaklink() is called first.  A symbolic link
+is archived by Tar as a link to the absolute pathname on this host, not
+as the file's data.
+With if_changed=True, a destination with the same contents as its source
+is left untouched (not even its modification time), so that what depends
+on it is not rebuilt.
+The dest can be a sequence of directories: each source file is read once
+and written to each destination that is not up to date.
 constructor arguments:
-Copy(*files, dest=<destdir>, exclude=<defaults>)"""
+Copy(*files, dest=<destdir or sequence>, exclude=<defaults>, link='copy',
+     if_changed=False)"""
+    arguments = Arguments(
+        Arguments.Keyword('dest', types=(Path, str, tuple, list),
+                          cast=destinations),
+        Arguments.Keyword('link', default='copy'),
+        Arguments.Keyword('if_changed', types=bool, default=False),
+    ) + MapperTask.arguments
+
+    def run(self):
+        """Copy to one destination, or to several."""
+        # pylint: disable=no-member
+        dests = self.args.dest
+        if not isinstance(dests, tuple):
+            return super(Copy, self).run()
+        mapcls = self.mapper()
+        mappers = [mapcls(destdir=destdir) for destdir in dests]
+        context = self.setup()
+        for sname in self.get_files():
+            self.dojob(sname, [mapper.mapitem(sname) for mapper in mappers],
+                       context)
+        self.teardown(context)
+
+    def setup(self):
+        """Keep the directories known to exist, and the totals."""
+        # pylint: disable=no-member
+        if self.args.link not in Path.LINKMODES:
+            raise ValueError('link must be one of %s' % (Path.LINKMODES,))
+        return {'dirs': set(), 'files': 0, 'bytes': 0}
+
+    @staticmethod
+    def makedirs(dirname, context):
+        """Create the directory and its parents, unless already seen."""
+        if dirname.value in context['dirs']:
+            return
+        dirname.mkdir()
+        while dirname.value not in context['dirs']:
+            context['dirs'].add(dirname.value)
+            parent = dirname.dirname
+            if parent.value == dirname.value:
+                break
+            dirname = parent
 
-    # pylint: disable=unused-argument
     def dojob(self, sname, dname, context):
+        """Copy sname to dname, or to each of a list of dnames."""
         self.logger.debug('sname = %s; dname = %s', sname, dname)
         srcfile = self.join(sname)
-        dstfile = self.join(dname)
-        if srcfile.isdir:
+        # use the stat data from creating the Path instances
+        srctype = Path.stat_type(srcfile.stat)
+        targets = []
+        for dstfile in isinstance(dname, list) and dname or [dname]:
+            dstfile = self.join(dstfile)
+            if self.needcopy(srcfile, srctype, dstfile, context):
+                self.makedirs(dstfile.dirname, context)
+                self.logger.info('copy2(%s,%s)', sname, dstfile)
+                targets.append(dstfile)
+        if not targets:
+            return
+        # pylint: disable=no-member
+        link = self.args.link
+        if link == 'copy':
+            context['bytes'] += srcfile.copyto(targets)
+        else:
+            for dstfile in targets:
+                context['bytes'] += srcfile.copy(dstfile, link=link)
+        context['files'] += len(targets)
+
+    def needcopy(self, srcfile, srctype, dstfile, context):
+        """Return True if the file needs to be copied to dstfile;
+directories are created here."""
+        dsttype = Path.stat_type(dstfile.stat)
+        if srctype == Path.TYPE.DIR:
             # remove whatever is there
-            if dstfile.exists and not dstfile.isdir:
+            if dsttype not in (Path.TYPE.NOENT, Path.TYPE.DIR):
                 dstfile.remove()
             # create the directory
-            if not dstfile.exists:
-                dstfile.mkdir()
-        elif srcfile.isfile and newer(srcfile, dstfile, logger=self.logger):
+            if dsttype != Path.TYPE.DIR:
+                self.makedirs(dstfile, context)
+            return False
+        elif srctype == Path.TYPE.FILE and dsttype != Path.TYPE.NOENT and \
+                srcfile.stat[os.path.stat.ST_MTIME] <= \
+                dstfile.stat[os.path.stat.ST_MTIME]:
             self.logger.debug('uptodate: %s', dstfile)
-        else:
-            if not dstfile.dirname.isdir:
-                dstfile.dirname.mkdir()
-            self.logger.info('copy2(%s,%s)', sname, dname)
-            srcfile.copy(dstfile)
+            return False
+        # pylint: disable=no-member
+        elif self.args.if_changed and dsttype == Path.TYPE.FILE and \
+                srcfile.samecontent(dstfile):
+            self.logger.debug('unchanged: %s', dstfile)
+            return False
+        return True
+
+    def teardown(self, context):
+        if context['files']:
+            self.logger.info('%s: copied %d files, %d bytes',
+                             self.__class__.__name__, context['files'],
+                             context['bytes'])
 
 Copy.register()
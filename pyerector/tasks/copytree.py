@@ -2,20 +2,38 @@
 # Copyright @ 2017 Michael P. Reilly. All rights reserved.
 """Tasks plugin for CopyTree."""
 
+import os
+
 from ..args import Arguments
+from ..execute import WorkerPool
 from ..path import Path
 from ._base import Task
 from .copy import Copy
 
 class CopyTree(Task):
     """Copy directory truee. Exclude standard hidden files.
+With mirror=True, make the destination the same as the source: the two
+trees are compared in one pass, then only the changed files are copied,
+and whatever is not in the source is removed (except what is excluded).
+Files are compared by size and modification time (compare='mtime') or by
+size and contents (compare='checksum'); parallel=<N> copies with N threads.
 constructor arguments:
-CopyTree(srcdir=<DIR>, dstdir=<DIR>, exclude=<defaults>)"""
+CopyTree(srcdir=<DIR>, dstdir=<DIR>, exclude=<defaults>, link='copy',
+         mirror=False, compare='mtime', parallel=1, if_changed=False)
+See Copy for the link and if_changed values; a tree staged with hard or
+symbolic links is for reading (changing a file in place changes its source,
+and Tar keeps the symbolic links, not the data)."""
     arguments = Arguments(
         Arguments.Keyword('srcdir', types=(Path, str), noNone=True, cast=Path),
         Arguments.Keyword('dstdir', types=(Path, str), noNone=True, cast=Path),
         Arguments.Exclusions('exclude'),
+        Arguments.Keyword('link', default='copy'),
+        Arguments.Keyword('mirror', types=bool, default=False),
+        Arguments.Keyword('compare', default='mtime'),
+        Arguments.Keyword('parallel', types=int, default=1),
+        Arguments.Keyword('if_changed', types=bool, default=False),
     )
+    comparisons = ('mtime', 'checksum')
 
     def run(self):
         """Copy a tree to a destination."""
@@ -24,11 +42,129 @@ CopyTree(srcdir=<DIR>, dstdir=<DIR>, exclude=<defaults>)"""
         # pylint: disable=no-member
         dstdir = self.args.dstdir
         excludes = self.args.exclude
-        if not srcdir.exists:
+        if not self.join(srcdir).exists:
             raise OSError(2, "No such file or directory: " + srcdir)
-        elif not srcdir.isdir:
+        elif not self.join(srcdir).isdir:
             raise OSError(20, "Not a directory: " + srcdir)
-        Copy(srcdir, dest=dstdir, noglob=True, exclude=excludes,
-             fileonly=True, recurse=True)()
+        # pylint: disable=no-member
+        if self.args.mirror:
+            # the same destination as Copy would use
+            self.mirror(self.join(srcdir), self.join(dstdir + srcdir),
+                        excludes)
+        else:
+            Copy(srcdir, dest=dstdir, noglob=True, exclude=excludes,
+                 fileonly=True, recurse=True, link=self.args.link,
+                 if_changed=self.args.if_changed)()
+
+    def mirror(self, srcdir, dstdir, excludes):
+        """Apply the differences between the trees to the destination."""
+        # pylint: disable=no-member
+        compare = self.args.compare
+        if compare not in self.comparisons:
+            raise ValueError('compare must be one of %s' % (self.comparisons,))
+        elif self.args.link not in Path.LINKMODES:
+            raise ValueError('link must be one of %s' % (Path.LINKMODES,))
+        copies, mkdirs, removes = self.diff(srcdir, dstdir, excludes, compare)
+        for entry in removes:
+            self.logger.info('remove(%s)', entry)
+            entry.remove()
+        for entry in mkdirs:
+            entry.mkdir()
+        # pylint: disable=no-member
+        parallel = self.args.parallel
+        if parallel > 1 and len(copies) > 1:
+            with WorkerPool(parallel) as pool:
+                total = sum(pool.imap(self.copyfile, copies))
+        else:
+            total = sum(self.copyfile(pair) for pair in copies)
+        self.logger.info('%s: copied %d files, %d bytes; removed %d',
+                         self.__class__.__name__, len(copies), total,
+                         len(removes))
+
+    def diff(self, srcdir, dstdir, excludes, compare):
+        """Walk both trees together, returning the (src, dst) pairs of
+files to copy, the directories to create and the entries to remove (with
+everything beneath them)."""
+        copies, mkdirs, removes = [], [], []
+        dirs = [(srcdir, dstdir)]
+        while dirs:
+            sdir, ddir = dirs.pop(0)
+            dtype = Path.stat_type(ddir.stat)
+            if dtype == Path.TYPE.DIR:
+                dentries = dict((entry.basename.value, entry)
+                                for entry in ddir)
+            else:
+                if dtype != Path.TYPE.NOENT:
+                    removes.append(ddir)
+                mkdirs.append(ddir)
+                dentries = {}
+            for sentry in sdir:
+                name = sentry.basename.value
+                dentry = dentries.pop(name, None) or ddir + name
+                if excludes.match(sentry):
+                    continue  # leave the destination alone
+                stype = Path.stat_type(sentry.stat)
+                dtype = Path.stat_type(dentry.stat)
+                if stype == Path.TYPE.DIR:
+                    dirs.append((sentry, dentry))
+                elif self.differs(sentry, dentry, stype, dtype, compare):
+                    if dtype == Path.TYPE.DIR:
+                        removes.append(dentry)
+                    copies.append((sentry, dentry))
+            for name in sorted(dentries):
+                if not excludes.match(dentries[name]):
+                    removes.append(dentries[name])
+        return copies, mkdirs, removes
+
+    def differs(self, src, dst, stype, dtype, compare):
+        """Return True if dst needs to be copied from src."""
+        if stype == Path.TYPE.LINK:
+            return dtype != Path.TYPE.LINK or \
+                os.readlink(src.value) != os.readlink(dst.value)
+        # pylint: disable=no-member
+        elif dtype == Path.TYPE.LINK and self.args.link == 'symlink':
+            # staged as a link to the source
+            return not self.linksto(dst, src)
+        elif dtype != Path.TYPE.FILE or \
+                src.stat.st_size != dst.stat.st_size:
+            return True
+        elif compare == 'checksum':
+            return self.checksum(src) != self.checksum(dst)
+        elif int(src.stat.st_mtime) == int(dst.stat.st_mtime):
+            return False
+        # pylint: disable=no-member
+        return not (self.args.if_changed and src.samecontent(dst))
+
+    @staticmethod
+    def linksto(link, fname):
+        """Return True if the symbolic link resolves to the file."""
+        try:
+            target = os.stat(link.value)
+        except OSError:  # dangling
+            return False
+        return (target.st_dev, target.st_ino) == \
+            (fname.stat.st_dev, fname.stat.st_ino)
+
+    @staticmethod
+    def checksum(fname, blocksize=1 << 20):
+        """Return the md5 digest of the file's contents."""
+        from hashlib import md5
+        digest = md5()
+        with fname.open('rb') as infile:
+            for block in iter(lambda: infile.read(blocksize), b''):
+                digest.update(block)
+        return digest.digest()
+
+    def copyfile(self, pair):
+        """Copy a file or symbolic link; return the bytes copied."""
+        src, dst = pair
+        self.logger.debug('copy(%s, %s)', src, dst)
+        if src.islink:
+            if dst.exists and not dst.islink:
+                dst.remove()
+            dst.makelink(os.readlink(src.value))
+            return 0
+        # pylint: disable=no-member
+        return src.copy(dst, link=self.args.link)
 
 CopyTree.register()
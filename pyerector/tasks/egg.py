@@ -29,29 +29,43 @@ Egg(*files, name=<eggfilename>, root=os.curdir, exclude=(defaults))"""
         self.do_file_top_level(eggdir, toadd, fname)
         self.do_file_sources(eggdir, toadd, root)
 
+    @staticmethod
+    def update(fname, text):
+        """Write the text to the file, unless it already has it, so an
+unchanged egg is not rebuilt."""
+        if fname.isfile:
+            with fname.open('rt') as infile:
+                if infile.read() == text:
+                    return
+        with fname.open('wt') as outfile:
+            outfile.write(text)
+
     @staticmethod
     def add_path(seq, path):
-        """Add a path if not in the sequence."""
-        if path not in seq:
+        """Add a path to the members; they are never added twice."""
+        # Members keeps the added paths in extra
+        if path not in getattr(seq, 'extra', seq):
             seq.append(path)
 
     def do_file_dummy(self, rootdir, toadd, fname):
         """Create an empty file."""
         fname = rootdir + fname
-        fname.open('wt').write(os.linesep)
+        self.update(fname, os.linesep)
         self.add_path(toadd, fname)
     def do_file_top_level(self, rootdir, toadd, name):
         """Generate top_level.txt file."""
         fname = rootdir + 'top_level.txt'
-        fname.open('wt').write(str(name) + os.linesep)
+        self.update(fname, str(name) + os.linesep)
         self.add_path(toadd, fname)
     def do_file_sources(self, rootdir, toadd, root):
         """Generate SOURCES.txt files."""
         fname = rootdir + 'SOURCES.txt'
-        with fname.open('wt') as fobj:
-            for sfname in sorted([s - root for s in toadd]):
-                if sfname.basename != 'EGG-INFO':
-                    fobj.write(str(sfname) + os.linesep)
+        # not the generated files, so the list is the same each time
+        self.update(fname, ''.join(
+            sfname + os.linesep
+            for sfname in (self.arcname(s, root) for s in toadd)
+            if sfname.split(os.sep)[0] != 'EGG-INFO'
+        ))
         self.add_path(toadd, fname)
     # pylint: disable=unused-argument
     def do_file_pkginfo(self, rootdir, toadd, root):
@@ -85,35 +99,9 @@ Description: %(long_description)s
 Platform: UNKNOWN
 %(classifiers)s
 ''' % pkg_data
-        eggdir = root + 'EGG-INFO'
-        try:
-            eggdir.mkdir()
-        except OSError:
-            pass
-        fname = eggdir + 'PKG-INFO'
-        fname.open('wt').write(pkg_info)
-        if fname not in toadd:
-            toadd.append(fname)
-        for fname in ('depenency_links.txt', 'zip-safe'):
-            fname = eggdir + fname
-            fname.open('wt').write(os.linesep)
-            if fname not in toadd:
-                toadd.append(fname)
-        fname = eggdir + 'top_level.txt'
-        fname.open('wt').write('pyerector' + os.linesep)
-        if fname not in toadd:
-            toadd.append(fname)
-        fname = eggdir + 'SOURCES.txt'
-        fname.open('wt').write(
-            os.linesep.join(sorted(
-                [str(s - root) for s in toadd
-                 if s.basename != 'EGG-INFO']
-            )) + os.linesep
-        )
-        if fname not in toadd:
-            toadd.append(fname)
-        # convert Path instances to a str
-        toadd[:] = [str(f) for f in toadd]
+        fname = rootdir + 'PKG-INFO'
+        self.update(fname, pkg_info)
+        self.add_path(toadd, fname)
 
     @staticmethod
     def get_setup_py(filename):
@@ -122,6 +110,7 @@ Platform: UNKNOWN
         import sys
         backups = {}
         script = '''
+myvalue = None
 def setup(**kwargs):
     global myvalue
     myvalue = dict(kwargs)
@@ -0,0 +1,187 @@
+#!/usr/bin/python
+# Copyright @ 2017 Michael P. Reilly. All rights reserved.
+"""Tasks plugin for Filter, and the filters it uses."""
+
+import codecs
+import os
+import sys
+
+from ..args import Arguments
+from ..path import Path
+from ._base import MapperTask
+from .tokenize import Replacer, Tokenize, gen_token_re, replacements
+
+__all__ = [
+    'Filter',
+    'LineEndingFilter',
+    'ShebangFilter',
+    'StreamFilter',
+    'TokenFilter',
+]
+
+
+class StreamFilter(object):
+    """The base class of the filters of Filter.  For each file, start()
+returns the filter of that file, which is given its text a block at a time
+by feed() and then flush(); each returns the text that is complete, holding
+back what the next block could change.  This one passes the text as it
+is."""
+    def start(self):
+        """Return a copy to filter one file with."""
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone.buffer = ''
+        return clone
+
+    # pylint: disable=no-self-use
+    def feed(self, text):
+        """Return the filtered text that is complete."""
+        return text
+
+    def flush(self):
+        """Return the rest of the filtered text."""
+        return ''
+
+
+class ShebangFilter(StreamFilter):
+    """Replace the program in the first line, if it starts with the token.
+ShebangFilter('/usr/bin/python3') changes "#!/usr/bin/python -u" to
+"#!/usr/bin/python3 -u"."""
+    def __init__(self, program, token='#!'):
+        self.program = str(program)
+        self.token = token
+        self.buffer = ''
+        self.done = False
+
+    def feed(self, text):
+        if self.done:
+            return text
+        self.buffer += text
+        if '\n' not in self.buffer and '\r' not in self.buffer:
+            return ''  # until the first line is all here
+        return self.flush()
+
+    def flush(self):
+        if self.done:
+            return ''
+        self.done = True
+        text, self.buffer = self.buffer, ''
+        if not text.startswith(self.token):
+            return text
+        rest = text[len(self.token):]
+        end = len(rest)
+        for char in ' \t\r\n':
+            if char in rest:
+                end = min(end, rest.index(char))
+        return self.token + self.program + rest[end:]
+
+
+class TokenFilter(StreamFilter):
+    """Replace tokens as Tokenize does, the longest at each place.
+TokenFilter(VariableSet(Variable('@VERSION@', '1.2')))"""
+    def __init__(self, tokenmap):
+        self.tokenmap = tokenmap
+
+    def start(self):
+        values = replacements(self.tokenmap)
+        return Replacer(values, gen_token_re(values))
+
+
+class LineEndingFilter(StreamFilter):
+    """Make every line end with ending ("\\r\\n", "\\r" or "\\n")."""
+    def __init__(self, ending='\n'):
+        if ending not in ('\n', '\r\n', '\r'):
+            raise ValueError('expecting a line ending', ending)
+        self.ending = ending
+        self.buffer = ''
+
+    def feed(self, text):
+        text = self.buffer + text
+        # a "\r" at the end may be the start of a "\r\n"
+        if text.endswith('\r'):
+            text, self.buffer = text[:-1], '\r'
+        else:
+            self.buffer = ''
+        return self.convert(text)
+
+    def flush(self):
+        text, self.buffer = self.buffer, ''
+        return self.convert(text)
+
+    def convert(self, text):
+        """Change the line endings of the text."""
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        if self.ending != '\n':
+            text = text.replace('\n', self.ending)
+        return text
+
+
+def filters(value):
+    """Cast a filter, or a sequence of them, to a tuple."""
+    if isinstance(value, StreamFilter):
+        return (value,)
+    return tuple(value)
+
+
+def filterfile(sname, dname, chain, encoding='utf-8', blocksize=1 << 16):
+    """Read sname once, a block at a time, through the filters (in order)
+into a new file that then replaces dname."""
+    chain = [item.start() for item in chain]
+    if sys.version_info[0] >= 3:
+        decode = codecs.getincrementaldecoder(encoding)().decode
+        encode = lambda text: text.encode(encoding)
+    else:  # str is bytes
+        decode = lambda data, final=False: data
+        encode = lambda text: text
+    tempname = os.path.join(dname.dirname.value, '.%s.%d' % (
+        dname.components[-1], os.getpid()))
+    try:
+        with sname.open('rb') as infile:
+            with open(tempname, 'wb') as outfile:
+                for block in iter(lambda: infile.read(blocksize), b''):
+                    text = decode(block)
+                    for item in chain:
+                        text = item.feed(text)
+                    outfile.write(encode(text))
+                text = decode(b'', True)
+                for item in chain:
+                    text = item.feed(text) + item.flush()
+                outfile.write(encode(text))
+        Tokenize.replace(tempname, sname, dname)
+    finally:
+        if os.path.exists(tempname):
+            os.remove(tempname)
+
+
+class Filter(MapperTask):
+    """Stream each file once through a chain of filters (StreamFilter
+instances, applied in order), writing the result to its destination; any
+number of changes cost one read and one write of each file.  The text is
+decoded with the encoding; line endings are left as they are unless a
+LineEndingFilter changes them.  The files may be the members of archives,
+from a ZipIterator or TarIterator.
+    Filter(FileSet('bin', pattern='*.py', recurse=True), dest='build',
+           filters=(ShebangFilter('/usr/bin/python3'), TokenFilter(tokens),
+                    LineEndingFilter()))
+constructor arguments:
+Filter(*files, dest=None, filters=(), encoding='utf-8')"""
+    arguments = Arguments(
+        Arguments.Keyword('filters', types=(StreamFilter, tuple, list),
+                          default=(), cast=filters),
+        Arguments.Keyword('encoding', types=str, default='utf-8'),
+    ) + MapperTask.arguments
+    blocksize = 1 << 16
+
+    def dojob(self, sname, dname, context):
+        """Filter sname into dname."""
+        source = sname if sname.virtual else self.join(sname)
+        dest = self.join(dname)
+        if Path.stat_type(source.stat) != Path.TYPE.FILE:
+            return
+        self.logger.debug('filter(%s, %s)', sname, dname)
+        dest.dirname.mkdir()
+        # pylint: disable=no-member
+        filterfile(source, dest, self.args.filters, self.args.encoding,
+                   self.blocksize)
+
+Filter.register()
@@ -2,9 +2,15 @@
 # Copyright @ 2017 Michael P. Reilly. All rights reserved.
 """Tasks plugin for HashGen."""
 
+import hashlib
+import os
+
 from ..args import Arguments
+from ..execute import WorkerPool
+from ..helper import newer
+from ..path import Path
 from ._base import MapperTask
-from ..iterators import FileIterator, FileMapper
+from ..iterators import FileMapper
 
 def cast(value):
     """Cast appropriately: a sequence to a tuple, otherwise as a str."""
@@ -14,45 +20,151 @@ def cast(value):
         return (str(value),)
 
 class HashGen(MapperTask):
-    """Generate file(s) containing md5 or sha1 hash string.
+    """Generate file(s) containing hash strings: md5, sha1, sha256, sha512
+or another that hashlib has (blake2b from Python 3.6).
 For example, generates foobar.txt.md5 and foobar.txt.sha1 for the
 contents of foobar.txt.  By default, generates for both md5 and sha1.
+Each file is read once, a block at a time, for all the hashes that are
+missing or older than it; with threads=<N>, N files are hashed at once.
+With manifest=<file>, a single file like SHA256SUMS is written instead,
+"<hash>  <name>" for one hash (after a "# <hash>" comment line, which
+sha256sum -c ignores), or "SHA256 (<name>) = <hash>" lines for several, the
+names relative to its directory; it is rewritten when a file is newer than
+it, or the files or the hashes have changed.
+The files may be the members of archives, from a ZipIterator or TarIterator;
+their hash files are written under dest.
 constructor arguments:
-HashGen(*files, hashs=('md5', 'sha1'))"""
+HashGen(*files, hashs=('md5', 'sha1'), dest=None, threads=1, manifest=None)"""
     arguments = Arguments(
-        Arguments.Keyword('hashs', types=(tuple, str), default=('md5', 'sha1'),
-                          cast=cast),
+        Arguments.Keyword('hashs', types=(tuple, list, str),
+                          default=('md5', 'sha1'), cast=cast),
+        Arguments.Keyword('threads', types=int, default=1),
+        Arguments.Keyword('manifest', types=(Path, str)),
     ) + MapperTask.arguments
+    blocksize = 1 << 20
 
-    def get_files(self, files=None, arg='files'):
-        """Split the iterator into up to two mappers based on the hashs."""
-        files = super(HashGen, self).get_files(files=files, arg=arg)
-        fmap = FileIterator()
+    def run(self):
+        """Hash the files that need it, on the threads if any."""
+        # pylint: disable=no-member
+        hashs = self.args.hashs
+        for name in hashs:
+            self.new(name)  # check they all exist before reading any
+        # pylint: disable=no-member
+        pairs = FileMapper(self.get_files(), destdir=self.args.dest)
         # pylint: disable=no-member
-        if 'md5' in self.args.hashs:
-            fmap.append(FileMapper(files, mapper=lambda x: x.addext('.md5')))
+        if self.args.manifest is not None:
+            self.write_manifest(self.join(self.args.manifest), pairs, hashs)
+            return
+        jobs = []
+        for sname, dname in pairs:
+            source = self.source(sname)
+            if Path.stat_type(source.stat) != Path.TYPE.FILE:
+                continue
+            outputs = [(name, self.join(dname.addext('.' + name)))
+                       for name in hashs]
+            outputs = [(name, output) for name, output in outputs
+                       if newer(output, source)]
+            if outputs:
+                jobs.append((source, outputs))
+        for source, outputs, values in self.hashall(jobs):
+            for (name, output), value in zip(outputs, values):
+                self.logger.debug('writing %s', output)
+                output.dirname.mkdir()
+                with output.open('wt') as outfile:
+                    outfile.write(value + '\n')
+
+    def source(self, sname):
+        """Return the Path to read: archive members are read as they are."""
+        return sname if sname.virtual else self.join(sname)
+
+    @staticmethod
+    def new(name):
+        """Return a new hash object of the algorithm."""
+        try:
+            return hashlib.new(name)
+        except ValueError:
+            raise ValueError('hash %s is not available' % name)
+
+    def hashall(self, jobs):
+        """Yield (source, outputs, hex digests) for each (source, outputs)
+job, in order, hashing the sources on the threads."""
         # pylint: disable=no-member
-        if 'sha1' in self.args.hashs:
-            fmap.append(FileMapper(files, mapper=lambda x: x.addext('.sha1')))
-        return fmap
-
-    def dojob(self, sname, dname, context):
-        """Generate the appropriate hash file."""
-        from hashlib import md5, sha1
-        from ..helper import newer
-        if dname.ext == '.md5':
-            hashval = md5()
-        elif dname.ext == '.sha1':
-            # pylint: disable=redefined-variable-type
-            hashval = sha1()
+        threads = self.args.threads
+        if threads > 1 and len(jobs) > 1:
+            with WorkerPool(threads) as pool:
+                for result in pool.imap(self.hashjob, jobs):
+                    yield result
         else:
-            self.logger.info('invalid extension on %s', dname)
+            for job in jobs:
+                yield self.hashjob(job)
+
+    def hashjob(self, job):
+        """Read the source once, updating each of the hashes."""
+        source, outputs = job
+        digests = [self.new(name) for name, _ in outputs]
+        with source.open('rb') as infile:
+            for block in iter(lambda: infile.read(self.blocksize), b''):
+                for digest in digests:
+                    digest.update(block)
+        return source, outputs, [digest.hexdigest() for digest in digests]
+
+    def write_manifest(self, manifest, pairs, hashs):
+        """Write the hashes of all the files into the manifest, unless it
+has them all and is newer than each."""
+        dirname = manifest.dirname.value
+        jobs = []
+        for sname, _ in pairs:
+            source = self.source(sname)
+            if Path.stat_type(source.stat) != Path.TYPE.FILE:
+                continue
+            if sname.virtual:
+                name = sname.value
+            else:
+                name = os.path.relpath(source.value, dirname)
+            jobs.append((source, [(algo, name) for algo in hashs]))
+        names = [outputs[0][1] for _, outputs in jobs]
+        if manifest.isfile and \
+                self.listed(manifest) == (list(hashs), names) and \
+                not any(newer(manifest, source) for source, _ in jobs):
+            self.logger.info('%s: %s is uptodate', self.__class__.__name__,
+                             manifest)
             return
-        if sname.isfile and newer(sname, dname):
-            hashval.update(sname.open('rb').read())
-            self.logger.debug('writing %s', dname)
-            dname.open('wt').write(
-                hashval.hexdigest() + '\n'
-            )
+        self.logger.debug('writing %s', manifest)
+        manifest.dirname.mkdir()
+        with manifest.open('wt') as outfile:
+            if len(hashs) == 1:
+                outfile.write('# %s\n' % hashs[0])
+            for _, outputs, values in self.hashall(jobs):
+                for (algo, name), value in zip(outputs, values):
+                    if len(hashs) == 1:
+                        outfile.write('%s  %s\n' % (value, name))
+                    else:
+                        outfile.write('%s (%s) = %s\n' %
+                                      (algo.upper(), name, value))
+
+    @staticmethod
+    def listed(manifest):
+        """Return the hashes in the manifest, in order, and the names in it,
+in order, once each."""
+        hashs = []
+        names = []
+        tagged = True
+        with manifest.open('rt') as infile:
+            for line in infile:
+                line = line.rstrip('\n')
+                if line.startswith('# '):  # the hash of "<hash>  <name>"
+                    hashs.append(line[2:])
+                    tagged = False
+                    continue
+                elif not tagged:
+                    name = line.partition('  ')[2]
+                else:
+                    algo, _, rest = line.partition(' (')
+                    name = rest.rpartition(') = ')[0]
+                    if not names or names[0] == name:
+                        hashs.append(algo.lower())  # those of the first
+                if not names or names[-1] != name:
+                    names.append(name)
+        return hashs, names
 
 HashGen.register()
@@ -0,0 +1,88 @@
+#!/usr/bin/python
+# Copyright @ 2017 Michael P. Reilly. All rights reserved.
+"""Tasks plugin for MultiArchive."""
+
+import os
+
+from ..args import Arguments
+from ..base import Initer
+from ..execute import WorkerPool
+from ..iterators import Iterator, FileIterator
+from ..path import Path
+from ._base import Task
+from ._container import Members, gather
+from ._streams import Channel
+
+
+class MultiArchive(Task):
+    """Build several archives (Tar, Zip, Egg) of the same files, reading
+each file once.  Each archive is called, on its own thread, with the files
+and the keywords it was created with (name, root, exclude, ...).  The files
+are walked once here and the data of each is passed to every archive; at
+most window files wait for the slowest one.  A file an archive needs that is
+not passed to it (excluded here, generated by it, or larger than maxsize)
+it reads itself.
+    MultiArchive('build/dist', archives=(Zip(name='dist.zip', root='build'),
+                                         Tar(name='dist.tgz', root='build')))
+constructor arguments:
+MultiArchive(*files, archives=(), exclude=(defaults), window=8,
+             maxsize=16777216)"""
+    arguments = Arguments(
+        Arguments.List('files', types=(Iterator, Path, str), cast=FileIterator),
+        Arguments.Keyword('archives', types=(tuple, list), default=()),
+        Arguments.Keyword('window', types=int, default=8),
+        Arguments.Keyword('maxsize', types=int, default=16 << 20),
+    ) + Initer.basearguments
+
+    def run(self):
+        """Read the files once, feeding the archives being built."""
+        files = self.get_files()
+        # pylint: disable=no-member
+        archives = self.args.archives
+        if not archives:
+            return
+        channels = [Channel(self.args.window) for _ in archives]
+
+        def build(pair):
+            """Build one archive, then let the reader go on without it."""
+            archive, channel = pair
+            try:
+                archive(files, source=channel)
+            finally:
+                channel.close()
+        with WorkerPool(len(archives)) as pool:
+            results = [pool.submit(build, pair)
+                       for pair in zip(archives, channels)]
+            try:
+                self.feed(files, channels)
+            finally:
+                for channel in channels:
+                    channel.put(None)
+            for result in results:
+                result()  # raise the first failure
+
+    def feed(self, files, channels):
+        """Walk the files, sending the data of each to the channels."""
+        # pylint: disable=no-member
+        maxsize = self.args.maxsize
+        count = total = 0
+        members = Members(gather(files, Path(os.curdir)), self.args.exclude)
+        for fname in members:
+            if all(channel.closed for channel in channels):
+                break  # every archive was uptodate, or failed
+            if Path.stat_type(fname.stat) != Path.TYPE.FILE:
+                continue  # archives treat links differently
+            if fname.stat.st_size > maxsize:
+                data = None
+            else:
+                with (fname.open('rb') if fname.virtual else
+                      open(str(self.join(fname)), 'rb')) as infile:
+                    data = infile.read()
+                count += 1
+                total += len(data)
+            for channel in channels:
+                channel.put((fname.value, data))
+        self.logger.info('%s: read %d files, %d bytes',
+                         self.__class__.__name__, count, total)
+
+MultiArchive.register()
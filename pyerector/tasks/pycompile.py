@@ -2,36 +2,57 @@
 # Copyright @ 2017 Michael P. Reilly. All rights reserved.
 """Tasks plugin for PyCompile."""
 
+import os
+import sys
+
 from ..args import Arguments
-from ..path import Path
+from ..path import Path, modified
 from ..exception import Error
 from ..base import Initer
+from ..execute import WorkerPool
 from ..iterators import Iterator, FileIterator
 from ..helper import Subcommand
 from ._base import Task
+from . import _pycworker
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+# run as a script by other interpreters; found before any chdir
+WORKER = os.path.abspath(os.path.splitext(_pycworker.__file__)[0] + '.py')
 
 class PyCompile(Task):
-    """Compile Python source files.
+    """Compile Python source files; directories are searched for "*.py"
+files.  Files whose compiled file is of the source as it is now (by the
+header's time and size, or hash, see PEP 552) are not compiled again.
+With the version of another Python, a python<version> interpreter compiles
+them, as one long-lived worker fed the pathnames over a pipe.  With
+workers=<N>, N interpreters (of this Python, or the other) compile at once.
+Errors are logged, and the other files still compiled.
 constructor arguments:
-PyCompile(*files, dest=<DIR>, version='2')"""
+PyCompile(*files, version='2', workers=1)"""
     arguments = Arguments(
         Arguments.List('files', types=(Iterator, Path, str), cast=FileIterator),
         Arguments.Keyword('version', default='2'),
+        Arguments.Keyword('workers', types=int, default=1),
     ) + Initer.basearguments
 
     def run(self):
         """Compile Python source files."""
-        import py_compile
-        import sys
-        fileset = self.get_files()
+        sources = list(self.sources(self.get_files()))
+        if not sources:
+            return
         # pylint: disable=no-member
         version = self.args.version
-        if version[:1] == sys.version[:1]:  # compile inline
-            for fname in fileset:
-                if fname.isdir:
-                    self.compile_dir(self.join(fname))
-                else:
-                    self.compile_file(self.join(fname))
+        workers = min(self.args.workers, len(sources))
+        if version[:1] == sys.version[:1]:
+            if workers > 1:
+                results = self.compile_ext(sources, sys.executable, workers)
+            else:  # compile inline
+                results = ((source,) + _pycworker.compile_source(source)
+                           for source in sources)
         else:
             if version[:1] == '2':
                 cmd = 'python2'
@@ -39,48 +60,87 @@ PyCompile(*files, dest=<DIR>, version='2')"""
                 cmd = 'python3'
             else:
                 cmd = 'python'
-            for item in fileset:
-                self.compile_file_ext(self.join(item), cmd)
+            results = self.compile_ext(sources, cmd, max(workers, 1))
+        counts = {'fresh': 0, 'compiled': 0, 'error': 0}
+        for source, status, message in results:
+            counts[status] += 1
+            if status == 'compiled':
+                modified(Path(source))
+            elif status == 'error':
+                self.logger.error('%s: cannot compile %s: %s',
+                                  self.__class__.__name__, source, message)
+        self.logger.info('%s: compiled %d, %d up to date, %d errors',
+                         self.__class__.__name__, counts['compiled'],
+                         counts['fresh'], counts['error'])
 
-    def compile_file_ext(self, fname, python):
-        """Compile a file or files in a directory."""
-        import sys
-        if fname.isdir:
-            files = tuple(fn for fn in fname if fn.isfile)
-            subdirs = tuple(fn for fn in fname if fn.isdir)
-        else:
-            files = (fname,)
-            subdirs = ()
-        cmd = (python, '-c', 'import sys; from py_compile import compile; ' +
-               '[compile(s) for s in sys.argv[1:]]'
-              ) + files
-        try:
-            proc = Subcommand(cmd)
-        except Error:
-            exc = sys.exc_info()[1]
-            if exc.args[0] == 'ENOENT':
-                self.logger.error('%s: Error with %s: %s',
-                                  self.__class__.__name__, cmd, exc.args[1])
-            else:
-                raise
-        else:
-            if proc.returncode != 0:
-                raise Error('count not compile files with %s', cmd)
-        for fname in subdirs:
-            self.compile_file_ext(fname, python)
+    def sources(self, fileset):
+        """Yield the pathnames of the files, and of the "*.py" files under
+the directories."""
+        for fname in fileset:
+            fname = self.join(fname)
+            if Path.stat_type(fname.stat) != Path.TYPE.DIR:
+                yield fname.value
+                continue
+            for dirpath, dirnames, filenames in os.walk(fname.value):
+                dirnames.sort()
+                for name in sorted(filenames):
+                    if name.endswith('.py'):
+                        yield os.path.join(dirpath, name)
 
-    def compile_file(self, fname):
-        """Compile (pyc) a file."""
-        self.logger.debug('py_compile.compile(%s)', fname)
-        import py_compile
-        py_compile.compile(fname.value)
+    def compile_ext(self, sources, python, workers):
+        """Yield (source, status, message) for each source, in order, as
+compiled by workers processes of the python, each fed over a pipe."""
+        idle = Queue()
+        procs = []
+        try:
+            for _ in range(workers):
+                try:
+                    proc = Subcommand((python, WORKER), wait=False,
+                                      stdin=Subcommand.PIPE,
+                                      stdout=Subcommand.PIPE)
+                except Error:
+                    exc = sys.exc_info()[1]
+                    if exc.args[0] == 'ENOENT':
+                        self.logger.error('%s: Error with %s: %s',
+                                          self.__class__.__name__, python,
+                                          exc.args[1])
+                        return
+                    raise
+                procs.append(proc)
+                idle.put(proc)
 
-    def compile_dir(self, dirname):
-        """Recurse through the directory tree."""
-        for fname in dirname:
-            if fname.isdir:
-                self.compile_dir(fname)
+            def request(source):
+                """Send the source to an idle worker; wait for its reply."""
+                proc = idle.get()
+                try:
+                    return self.request(proc, source)
+                finally:
+                    idle.put(proc)
+            if workers > 1:
+                with WorkerPool(workers) as pool:
+                    for result in pool.imap(request, sources):
+                        yield result
             else:
-                self.compile_file(fname)
+                for source in sources:
+                    yield request(source)
+        finally:
+            for proc in procs:
+                proc.wait()  # closes its input, so it exits
+
+    @staticmethod
+    def request(proc, source):
+        """Return (source, status, message) from the worker process."""
+        line = source + '\n'
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        proc.stdin.write(line)
+        proc.stdin.flush()
+        reply = proc.stdout.readline()
+        if not reply:
+            raise Error('PyCompile', 'worker %s exited' % (proc.cmd,))
+        if not isinstance(reply, str):
+            reply = reply.decode('utf-8')
+        status, _, message = reply.rstrip('\n').split('\t', 2)
+        return source, status, message
 
 PyCompile.register()
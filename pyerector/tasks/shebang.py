@@ -2,14 +2,10 @@
 # Copyright @ 2017 Michael P. Reilly. All rights reserved.
 """Tasks plugin for Shebang."""
 
-try:
-    from io import BytesIO as StringIO
-except ImportError:
-    from StringIO import StringIO
-
 from ..args import Arguments
 from ..path import Path
 from .copy import Copy
+from .filter import ShebangFilter, filterfile
 
 # is the Base unnecessary given that Copy is also a subclass?
 class Shebang(Copy):
@@ -19,31 +15,17 @@ Shebang(*files, dest=<DIR>, token='#!', program=<FILE>)"""
     token = '#!'
     arguments = Arguments(
         Arguments.Keyword('program', types=(Path, str), noNone=True),
+        # one destination only
+        Arguments.Keyword('dest', types=(Path, str), cast=Path),
     ) + Copy.arguments
 
     def dojob(self, sname, dname, context):
-        import os
-        import shutil
-        inf = sname.open()
-        outf = StringIO()
-        first = inf.readline()
-        if first.startswith(self.token):
-            if ' ' in first:
-                wsp = first.find(' ')
-            else:
-                wsp = first.find(os.linesep)
-            first = first.replace(
-                first[len(self.token):wsp],
-                # pylint: disable=no-member
-                self.args.program
-            )
-            outf.write(first)
-        else:
-            outf.write(first)
-        shutil.copyfileobj(inf, outf)
-        inf.close()
-        outf.seek(0)
-        inf = dname.open('w')
-        shutil.copyfileobj(outf, inf)
+        """Stream the file through a ShebangFilter; the bytes are kept as
+they are."""
+        dname.dirname.mkdir()
+        # pylint: disable=no-member
+        filterfile(sname, dname, (ShebangFilter(self.args.program,
+                                                self.token),),
+                   encoding='latin-1')
 
 Shebang.register()
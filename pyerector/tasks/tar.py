@@ -2,29 +2,158 @@
 # Copyright @ 2017 Michael P. Reilly. All rights reserved.
 """Tasks plugin for Tar."""
 
-from ..path import Path
+import os
+
+from ..args import Arguments
 from ._container import Container
+from ._streams import DigestWriter, ParallelGzipWriter, TarIndex
 
 
 class Tar(Container):
     """Generate a 'tar' archive file.
+The compression is one of 'gz', 'bz2', 'xz' (needs the lzma module) or
+'none', with the codec's level (default: the codec's own).  With threads=<N>
+greater than 1, gzip blocks are compressed on N threads, giving a standard
+multi-member gzip file.  The headers come from the stat data gathered when
+the files were collected.  With index=True, a gzipped archive gets an index
+of its members and seek points for Untar.
 Constructure arguments:
-Tar(*files, name=None, root=os.curdir, exclude=(defaults)."""
+Tar(*files, name=None, root=os.curdir, exclude=(defaults),
+    compression='gz', level=None, threads=1, digests=(), index=False)."""
+    arguments = Arguments(
+        Arguments.Keyword('compression', default='gz'),
+        Arguments.Keyword('level', types=int),
+        Arguments.Keyword('threads', types=int, default=1),
+        Arguments.Keyword('index', types=bool, default=False),
+    ) + Container.arguments
+    compressions = ('gz', 'bz2', 'xz', 'none')
+    options = ('compression', 'level', 'threads', 'digests', 'index')
+
     def contain(self, name, root, toadd):
         """Add a list of files to the container."""
-        import tarfile
+        # pylint: disable=no-member
+        compression = self.args.compression
+        if compression not in self.compressions:
+            raise ValueError('compression must be one of %s' %
+                             (self.compressions,))
+        # pylint: disable=no-member
+        if self.args.index and compression != 'gz':
+            raise ValueError('only gzipped archives can be indexed')
+        filename = str(self.join(name))
+        tfile, stream = self.open(filename, compression)
+        members = []
         try:
-            tfile = tarfile.open(str(self.join(name)), 'w:gz')
-        except IOError:
-            raise ValueError('no such file or directory: %s' % name)
-        else:
+            owners = {}
+            links = {}
             for fname in toadd:
-                if isinstance(fname, Path):
-                    path = fname - root
-                else:
-                    path = Path(fname) - root
+                path = self.arcname(fname, root)
                 self.logger.debug('tar.add(%s, %s)', fname, path)
-                tfile.add(str(self.join(fname)), str(path))
+                members.append((tfile.offset, path))
+                self.add(tfile, fname, path, owners, links)
+        finally:
             tfile.close()
+            stream.close()
+        # pylint: disable=no-member
+        if self.args.index:
+            TarIndex(filename, getattr(stream, 'points', [(0, 0)]),
+                     members).save()
+
+    def open(self, filename, compression):
+        """Return a TarFile writing the archive, and the file object
+under it that needs to be closed after it."""
+        import tarfile
+        # pylint: disable=no-member
+        level = self.args.level
+        threads = self.args.threads
+        outfile = None
+        try:
+            outfile = self.output(filename)
+            if compression == 'gz' and threads > 1:
+                stream = ParallelGzipWriter(
+                    outfile, 9 if level is None else level, threads
+                )
+                return tarfile.open(fileobj=stream, mode='w|'), stream
+            elif compression == 'none':
+                tfile = tarfile.open(filename, 'w', fileobj=outfile)
+            elif compression == 'xz':
+                # tarfile raises CompressionError if there is no lzma
+                tfile = tarfile.open(filename, 'w:xz', fileobj=outfile,
+                                     preset=level)
+            elif level is None:
+                tfile = tarfile.open(filename, 'w:' + compression,
+                                     fileobj=outfile)
+            else:
+                tfile = tarfile.open(filename, 'w:' + compression,
+                                     fileobj=outfile, compresslevel=level)
+            return tfile, outfile
+        except IOError:
+            self.discard(outfile, filename)
+            raise ValueError('no such file or directory: %s' % filename)
+        except tarfile.CompressionError:
+            self.discard(outfile, filename)
+            raise ValueError('compression %s is not available' % compression)
+
+    @staticmethod
+    def discard(outfile, filename):
+        """Close and remove the archive that could not be written."""
+        if outfile is None:
+            return
+        if isinstance(outfile, DigestWriter):
+            outfile.hashes = []  # no digest files of it either
+        outfile.close()
+        if os.path.exists(filename):
+            os.remove(filename)
+
+    def add(self, tfile, fname, arcname, owners, links):
+        """Write a member from the file's stat data, without another
+stat or owner lookup; later names of a hard linked file are links."""
+        import stat
+        import tarfile
+        fullname = str(self.join(fname))
+        sdata = fname.stat
+        if sdata is None:
+            sdata = os.lstat(fullname)
+        info = tarfile.TarInfo(arcname)
+        info.mode = stat.S_IMODE(sdata.st_mode)
+        info.uid, info.gid = sdata.st_uid, sdata.st_gid
+        info.mtime = int(sdata.st_mtime)
+        info.uname, info.gname = self.owner(sdata, owners)
+        inode = (sdata.st_dev, sdata.st_ino)
+        if stat.S_ISLNK(sdata.st_mode):
+            info.type = tarfile.SYMTYPE
+            info.linkname = os.readlink(fullname)
+        elif sdata.st_nlink > 1 and inode in links:
+            info.type = tarfile.LNKTYPE
+            info.linkname = links[inode]
+        else:
+            if sdata.st_nlink > 1:
+                links[inode] = arcname
+            info.size = sdata.st_size
+            with self.source(fname) as infile:
+                tfile.addfile(info, infile)
+            return
+        tfile.addfile(info)
+
+    @staticmethod
+    def owner(sdata, owners):
+        """Return the (user, group) names of the stat data's owners."""
+        key = (sdata.st_uid, sdata.st_gid)
+        if key not in owners:
+            try:
+                import grp
+                import pwd
+            except ImportError:
+                owners[key] = ('', '')
+                return owners[key]
+            try:
+                uname = pwd.getpwuid(sdata.st_uid).pw_name
+            except KeyError:
+                uname = ''
+            try:
+                gname = grp.getgrgid(sdata.st_gid).gr_name
+            except KeyError:
+                gname = ''
+            owners[key] = (uname, gname)
+        return owners[key]
 
 Tar.register()
@@ -2,70 +2,187 @@
 # Copyright @ 2017 Michael P. Reilly. All rights reserved.
 """Tasks plugin for Copy."""
 
+import os
 import re
 import sys
 
 from ..args import Arguments
 from ..exception import Error
-from ..variables import VariableSet
+from ..path import modified
+from ..variables import Variable, VariableSet
 from ._base import MapperTask
 
 class Tokenize(MapperTask):
     """Replace tokens found in tokenmap with their associated values in
-each file.
+each file.  The files may be the members of archives, from a ZipIterator
+or TarIterator, written out under dest.
+Files are read a block at a time, into a new file that replaces the
+destination only if a token was replaced; where tokens overlap, the
+longest is replaced.
 constructor arguments:
 Tokenize(*files, dest=None, tokenmap=VariableSet())"""
     arguments = Arguments(
         Arguments.Keyword('tokenmap', types=VariableSet, default=VariableSet()),
     ) + MapperTask.arguments
+    blocksize = 1 << 16
 
     def update_tokenmap(self, tokenmap):
         """To be overridden."""
 
     def setup(self):
-        """Update tokens and create regexp."""
+        """Update tokens and get the matcher."""
         # pylint: disable=no-member
         tokenmap = self.args.tokenmap
         self.update_tokenmap(tokenmap)
-        # we need the closure to properly pass the tokenmap
-        def repltoken(match):
-            """Replace."""
-            self.logger.debug('repltoken found %s', match.group(0))
-            result = tokenmap.get(match.group(0))
-            return result is not None and str(result) or ''
-        tokens = gen_token_re(tokenmap)
+        values = replacements(tokenmap)
+        tokens = gen_token_re(values)
         self.logger.debug('Tokenize.patt = %s', str(tokens.pattern))
         return {
-            'repltoken': repltoken,
             'tokenmap': tokenmap,
             'tokens': tokens,
+            'values': values,
         }
 
     def dojob(self, sname, dname, context):
         """Perform the task against the src/dst files."""
+        replacer = Replacer(context['values'], context['tokens'])
+        if sname.virtual:
+            dname.dirname.mkdir()
+        tempname = os.path.join(dname.dirname.value, '.%s.%d' % (
+            dname.components[-1], os.getpid()))
         try:
-            realcontents = sname.open('rt').read()
-        except TypeError:
-            raise Error('%s: %s' % (sname, sys.exc_info()[1]))
-        alteredcontents = context['tokens'].sub(
-            context['repltoken'], realcontents
-        )
-        if alteredcontents != realcontents:
-            dname.open('wt').write(alteredcontents)
-        else:
-            self.logger.info("Tokenize: no change to %s", dname)
+            try:
+                with sname.open('rt') as infile:
+                    with open(tempname, 'wt') as outfile:
+                        for block in iter(
+                                lambda: infile.read(self.blocksize), ''):
+                            outfile.write(replacer.feed(block))
+                        outfile.write(replacer.flush())
+            except TypeError:
+                raise Error('%s: %s' % (sname, sys.exc_info()[1]))
+            # there is no file to leave as it is for a member
+            if replacer.changed or sname.virtual:
+                self.replace(tempname, sname, dname)
+            else:
+                self.logger.info("Tokenize: no change to %s", dname)
+        finally:
+            if os.path.exists(tempname):
+                os.remove(tempname)
+
+    @staticmethod
+    def replace(tempname, sname, dname):
+        """Put the new file in place of the destination, with its mode; a
+link or a staged original is replaced rather than changed."""
+        try:
+            mode = os.stat(dname.value).st_mode
+        except OSError:
+            stat = sname.stat
+            mode = stat.st_mode if stat is not None else None
+        if mode is not None:
+            os.chmod(tempname, os.path.stat.S_IMODE(mode))
+        os.rename(tempname, dname.value)
+        dname.refresh()
+        modified(dname)
+
+
+class Replacer(object):
+    """Replace tokens in text that is given a block at a time; tokens that
+span blocks are held back until the next block, or flush().  changed is
+set when a token is replaced by something else.
+    replacer = Replacer({'@VERSION@': '1.2'})
+    text = replacer.feed(block1) + replacer.feed(block2) + replacer.flush()
+"""
+    def __init__(self, values, pattern=None):
+        self.values = values
+        self.pattern = gen_token_re(values) if pattern is None else pattern
+        # a match starting this far from the end is complete
+        self.longest = max([len(token) for token in values] or [1])
+        self.buffer = ''
+        self.changed = False
+
+    def feed(self, text):
+        """Return the text, with tokens replaced, that is complete."""
+        self.buffer += text
+        return self.scan(len(self.buffer) - self.longest + 1)
+
+    def flush(self):
+        """Return the rest of the text."""
+        return self.scan(len(self.buffer))
+
+    def scan(self, safe):
+        """Replace the tokens starting before safe, and return the text
+up to the end of the last, or to safe."""
+        buf = self.buffer
+        out = []
+        pos = 0
+        if self.values:
+            for match in self.pattern.finditer(buf):
+                if match.start() >= safe:
+                    break
+                token = match.group(0)
+                value = self.values[token]
+                if value != token:
+                    self.changed = True
+                out.append(buf[pos:match.start()])
+                out.append(value)
+                pos = match.end()
+        keep = max(pos, safe)
+        out.append(buf[pos:keep])
+        self.buffer = buf[keep:]
+        return ''.join(out)
+
+
+def replacements(tokenmap):
+    """Return a dict of the tokens' names to their values, as str."""
+    values = {}
+    for key in tokenmap:
+        name = key.name if isinstance(key, Variable) else str(key)
+        if name:
+            result = tokenmap.get(key)
+            values[name] = result is not None and str(result) or ''
+    return values
 
 def quote(string):
     """Quote the regexp special characters."""
-    return string.replace('\\', r'\\').replace('.', r'\.')\
-                 .replace('$', r'\$').replace('(', r'\(')\
-                 .replace(')', r'\)').replace('|', r'\|')
+    return re.escape(string)
+
+# compiled matchers, by the tokens
+_patterns = {}
 
 def gen_token_re(tokenmap):
-    """Generate a regular expression for the tokenmap keys."""
-    return re.compile(
-        r'(%s)' % '|'.join(quote(k) for k in tokenmap),
-        re.MULTILINE
-    )
+    """Return a regular expression matching the longest of the tokens (the
+keys of the tokenmap) at each place, from a trie of them; it is kept for
+other tokenmaps of the same tokens."""
+    tokens = tuple(sorted(set(
+        key.name if isinstance(key, Variable) else str(key)
+        for key in tokenmap
+    ) - set([''])))
+    pattern = _patterns.get(tokens)
+    if pattern is None:
+        trie = {}
+        for token in tokens:
+            node = trie
+            for char in token:
+                node = node.setdefault(char, {})
+            node[None] = True  # a token ends here
+        pattern = _patterns[tokens] = re.compile(
+            '(%s)' % trie_pattern(trie), re.MULTILINE
+        )
+    return pattern
+
+def trie_pattern(node):
+    """Return the regexp of the branches of the trie node; the longer
+branches are tried before the token ending at the node."""
+    branches = [quote(char) + trie_pattern(child)
+                for char, child in sorted(node.items(),
+                                          key=lambda item: str(item[0]))
+                if char is not None]
+    if not branches:
+        return ''
+    elif None in node:
+        return '(?:%s)?' % '|'.join(branches)
+    elif len(branches) == 1:
+        return branches[0]
+    return '(?:%s)' % '|'.join(branches)
 
 Tokenize.register()
@@ -2,35 +2,57 @@
 # Copyright @ 2017 Michael P. Reilly. All rights reserved.
 """Tasks plugin for Untar."""
 
+import os
 import tarfile
 
+from ..args import Arguments
 from ._container import Uncontainer
+from ._streams import TarIndex
 
 class Untar(Uncontainer):
     """Extract a 'tar' archive file.
-Untar(*files, name=<tarfilename>, root=None)"""
+If the archive has a current index (see Tar), the members are listed from
+it and the selected ones extracted by seeking to them; index=True builds
+the index when there is none.  With stream=True, the archive is read once
+from start to end, as 'r|gz', for files that cannot seek.
+Untar(*files, name=<tarfilename>, root=None, index=False, stream=False)"""
+    arguments = Arguments(
+        Arguments.Keyword('index', types=bool, default=False),
+        Arguments.Keyword('stream', types=bool, default=False),
+    ) + Uncontainer.arguments
+
     def get_file(self, fname):
-        """Open the container."""
-        return tarfile.open(str(self.join(fname)), 'r:gz')
+        """Open the container, or its index."""
+        filename = str(self.join(fname))
+        # pylint: disable=no-member
+        if self.args.stream:
+            return tarfile.open(filename, 'r|gz')
+        index = TarIndex.load(filename)
+        # pylint: disable=no-member
+        if index is None and self.args.index:
+            index = TarIndex.build(filename)
+        if index is not None:
+            return index
+        return tarfile.open(filename, 'r:gz')
 
-    @staticmethod
-    def retrieve_members(contfile, files):
-        """Retrieve the members from the container."""
-        import os
-        fileset = []
-        files = tuple(files)  # needed for contents test
-        for member in contfile.getmembers():
-            if (member.name.startswith(os.sep) or
-                    member.name.startswith(os.pardir)):
-                pass
-            elif not files or member.name in files:
-                fileset.append(member)
-        return fileset
+    @classmethod
+    def retrieve_members(cls, contfile, files):
+        """Retrieve the members from the container, the names from an
+index, else the TarInfos as they are read."""
+        match = cls.matcher(files)
+        if isinstance(contfile, TarIndex):
+            return [name for _, name in contfile.members if match(name)]
+        return (member for member in contfile if match(member.name))
 
     def extract_members(self, contfile, fileset, root):
         """Extract members from the container."""
+        path = str(self.join(os.curdir if root is None else root))
+        if isinstance(contfile, TarIndex):
+            self.logger.debug('tar.extract(%s)', fileset)
+            contfile.extract(fileset, path=path)
+            return
         for fileinfo in fileset:
             self.logger.debug('tar.extract(%s)', fileinfo.name)
-            contfile.extract(fileinfo, path=(str(root) or ""))
+            contfile.extract(fileinfo, path=path)
 
 Untar.register()
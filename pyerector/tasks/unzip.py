@@ -2,38 +2,106 @@
 # Copyright @ 2017 Michael P. Reilly. All rights reserved.
 """Tasks plugin for Unzip."""
 
-from zipfile import ZipFile
+import os
+import shutil
+import threading
+from zipfile import ZipFile, BadZipfile
 
+from ..args import Arguments
+from ..exception import Error
+from ..execute import WorkerPool
 from ._container import Uncontainer
 
 class Unzip(Uncontainer):
     """Extract a 'zip' archive file.
-Unzip(*files, name=<tarfilename>, root=None)"""
+Members are copied in blocks, threads=<N> at a time, each thread reading
+through its own handle on the archive.  With verify=True, the CRCs of the members are
+checked and nothing is extracted.
+Unzip(*files, name=<zipfilename>, root=None, threads=1, verify=False)"""
+    arguments = Arguments(
+        Arguments.Keyword('threads', types=int, default=1),
+        Arguments.Keyword('verify', types=bool, default=False),
+    ) + Uncontainer.arguments
+    blocksize = 1 << 16
+
     def get_file(self, fname):
         """Open the container."""
         return ZipFile(str(self.join(fname)), 'r')
 
-    @staticmethod
-    def retrieve_members(contfile, files):
-        """Retrieve the members from the container."""
-        import os
-        fileset = []
-        files = tuple(files)  # needed for contents test
-        for member in contfile.namelist():
-            if member.startswith(os.sep) or member.startswith(os.pardir):
-                pass
-            elif not files or member in files:
-                fileset.append(member)
-        return fileset
+    @classmethod
+    def retrieve_members(cls, contfile, files):
+        """Retrieve the members (ZipInfo) from the container."""
+        match = cls.matcher(files)
+        return [info for info in contfile.infolist() if match(info.filename)]
 
     def extract_members(self, contfile, fileset, root):
         """Extract members from the container."""
-        for member in fileset:
-            dname = root + member
-            if not dname.dirname.isdir:
-                dname.dirname.mkdir()
-            self.logger.debug('zip.extract(%s)', member)
-            dfile = dname.open('wb')
-            dfile.write(contfile.read(member))
+        # pylint: disable=no-member
+        threads = self.args.threads
+        if self.args.verify:
+            work = self.verify_member
+        else:
+            work = self.extract_member
+            root = self.join(os.curdir if root is None else root)
+            dirs = set()
+            for info in fileset:
+                dirs.add(os.path.dirname(info.filename.rstrip('/')))
+                if info.filename.endswith('/'):
+                    dirs.add(info.filename.rstrip('/'))
+            for dirname in sorted(dirs):
+                (root + dirname).mkdir()
+        handles = []
+        local = threading.local()
+        lock = threading.Lock()
+
+        def handle():
+            """Return this thread's own handle on the archive."""
+            if threading.current_thread() is main:
+                return contfile
+            zfile = getattr(local, 'zfile', None)
+            if zfile is None:
+                zfile = local.zfile = ZipFile(contfile.filename, 'r')
+                with lock:
+                    handles.append(zfile)
+            return zfile
+
+        def job(info):
+            """Extract or check a member, returning its name if it is bad."""
+            try:
+                work(handle(), info, root)
+            except BadZipfile:
+                return info.filename
+        main = threading.current_thread()
+        try:
+            if threads > 1 and len(fileset) > 1:
+                with WorkerPool(threads) as pool:
+                    bad = [name for name in pool.imap(job, fileset) if name]
+            else:
+                bad = [name for name in map(job, fileset) if name]
+        finally:
+            for zfile in handles:
+                zfile.close()
+        if bad:
+            raise Error(self.__class__.__name__,
+                        'bad members in %s: %s' %
+                        (contfile.filename, ', '.join(bad)))
+
+    def extract_member(self, zfile, info, root):
+        """Copy a member to a file under root."""
+        if info.filename.endswith('/'):
+            return  # directory, already made
+        self.logger.debug('zip.extract(%s)', info.filename)
+        dname = root + info.filename
+        with zfile.open(info) as infile:
+            with dname.open('wb') as outfile:
+                shutil.copyfileobj(infile, outfile, self.blocksize)
+
+    def verify_member(self, zfile, info, root):
+        """Read a member, so its CRC is checked."""
+        # pylint: disable=unused-argument
+        self.logger.debug('zip.verify(%s)', info.filename)
+        with zfile.open(info) as infile:
+            while infile.read(self.blocksize):
+                pass
 
 Unzip.register()
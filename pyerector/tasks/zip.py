@@ -2,26 +2,158 @@
 # Copyright @ 2017 Michael P. Reilly. All rights reserved.
 """Tasks plugin for Zip."""
 
-from zipfile import ZipFile
+import os
+import sys
+import zipfile
 
+from ..args import Arguments
+from ..execute import WorkerPool
+from ..path import Path
 from ._container import Container
+from ._streams import ZipMember, ZipWriter
 
 class Zip(Container):
     """Generate a 'zip' archive file.
-Zip(*files, name=(containername), root=os.curdir, exclude=(defaults)."""
+The compression is 'stored', 'deflated', or 'bzip2' and 'lzma' where the
+zipfile module has them, with the codec's level (default: the codec's own);
+a level for 'bzip2' or 'lzma' needs Python 3.7 or later.
+With threads=<N> greater than 1, files are compressed on N threads, a few at
+a time, and written in order.  With zip64=False, an archive needing zip64
+records is an error.  When a stored or deflated archive is rebuilt, the
+members that have not changed are copied from it without recompressing.
+Zip(*files, name=(containername), root=os.curdir, exclude=(defaults),
+    compression='stored', level=None, threads=1, zip64=True, digests=())."""
+    arguments = Arguments(
+        Arguments.Keyword('compression', default='stored'),
+        Arguments.Keyword('level', types=int),
+        Arguments.Keyword('threads', types=int, default=1),
+        Arguments.Keyword('zip64', types=bool, default=True),
+    ) + Container.arguments
+    compressions = ('stored', 'deflated', 'bzip2', 'lzma')
+    options = ('compression', 'level', 'zip64', 'digests')
+
     def contain(self, name, root, toadd):
         """Add the files to the container."""
+        self.logger.debug('Zip.contain(name=%s, root=%s, toadd=%s)',
+                          repr(name), repr(root), repr(toadd))
+        # pylint: disable=no-member
+        compression = self.args.compression
+        if compression not in self.compressions:
+            raise ValueError('compression must be one of %s' %
+                             (self.compressions,))
         try:
-            self.logger.debug('Zip.contain(name=%s, root=%s, toadd=%s)',
-                              repr(name), repr(root), repr(toadd))
-            zfile = ZipFile(str(self.join(name)), 'w')
+            if compression in ('stored', 'deflated'):
+                self.write(name, root, toadd, compression)
+            else:
+                self.zipfile(name, root, toadd, compression)
         except IOError:
             raise ValueError('no such file or directory: %s' % name)
-        else:
-            for fname in toadd:
-                path = str(fname - root)
+
+    def write(self, name, root, toadd, compression):
+        """Compress the members, on the worker threads if any, and write
+them in order to a new file that then replaces the archive.  Members that
+have not changed are copied from the old archive."""
+        # pylint: disable=no-member
+        level = self.args.level
+        threads = self.args.threads
+        method = getattr(zipfile, 'ZIP_' + compression.upper())
+        filename = str(self.join(name))
+        previous = self.previous(filename)
+        counts = {'members': 0, 'reused': 0}
+
+        def members():
+            """Yield (filename, arcname, stat, old ZipInfo or None, open
+file or None), in order."""
+            for fname, path, unchanged in self.unchanged(name, root, toadd):
                 self.logger.debug('zip.add(%s, %s)', fname, path)
-                zfile.write(str(fname), path)
+                info = previous.get(path) if unchanged else None
+                counts['members'] += 1
+                counts['reused'] += info is not None
+                yield (str(self.join(fname)), path, fname.stat, info,
+                       self.source(fname) if info is None else None)
+
+        def compress(member):
+            """Read and compress the file; links are followed."""
+            fullname, path, stat, info, infile = member
+            if info is not None:
+                return ZipMember.fromzip(filename, info)
+            if stat is None or Path.stat_type(stat) != Path.TYPE.FILE:
+                stat = os.stat(fullname)
+            return ZipMember(infile, path, stat, method,
+                             -1 if level is None else level)
+        dirname, basename = os.path.split(filename)
+        tempname = os.path.join(dirname, '.%s.%d' % (basename, os.getpid()))
+        try:
+            with ZipWriter(self.output(tempname, filename),
+                           self.args.zip64) as zfile:
+                if threads > 1:
+                    with WorkerPool(threads) as pool:
+                        for member in pool.imap(compress, members()):
+                            zfile.add(member)
+                else:
+                    for member in members():
+                        zfile.add(compress(member))
+            os.rename(tempname, filename)
+        finally:
+            if os.path.exists(tempname):
+                os.remove(tempname)
+        if counts['reused']:
+            self.logger.info('%s: reused %d of %d members',
+                             self.__class__.__name__, counts['reused'],
+                             counts['members'])
+
+    @staticmethod
+    def previous(filename):
+        """Return a dict of the member names in the existing archive to
+their ZipInfo."""
+        try:
+            zfile = zipfile.ZipFile(filename)
+        except (IOError, zipfile.BadZipfile):
+            return {}
+        try:
+            return dict((info.filename, info) for info in zfile.infolist())
+        finally:
             zfile.close()
 
+    @staticmethod
+    def zipinfo(path, stat, method):
+        """Return the ZipInfo of a member from its stat data."""
+        import time
+        info = zipfile.ZipInfo(path, time.localtime(stat.st_mtime)[:6])
+        info.external_attr = (stat.st_mode & 0xFFFF) << 16
+        info.compress_type = method
+        return info
+
+    def zipfile(self, name, root, toadd, compression):
+        """Write the members with the zipfile module."""
+        method = getattr(zipfile, 'ZIP_' + compression.upper(), None)
+        if method is None:
+            raise ValueError('compression %s is not available' % compression)
+        kwargs = {}
+        # pylint: disable=no-member
+        if self.args.level is not None:
+            if sys.version_info < (3, 7):  # no compresslevel before
+                raise ValueError('level with %s compression needs Python 3.7'
+                                 % compression)
+            kwargs['compresslevel'] = self.args.level
+        outfile = self.output(str(self.join(name)))
+        try:
+            zfile = zipfile.ZipFile(outfile, 'w', method,
+                                    allowZip64=self.args.zip64, **kwargs)
+            try:
+                for fname in toadd:
+                    path = self.arcname(fname, root)
+                    self.logger.debug('zip.add(%s, %s)', fname, path)
+                    if fname.virtual:  # a member of another archive
+                        with fname.open('rb') as infile:
+                            zfile.writestr(self.zipinfo(path, fname.stat,
+                                                        method),
+                                           infile.read())
+                    else:
+                        zfile.write(str(self.join(fname)), path)
+            finally:
+                zfile.close()
+        finally:
+            outfile.close()
+
 Zip.register()
@@ -73,6 +73,11 @@ class TestArguments(TestCase):
         h = Arguments(al1) + Arguments(ak1)
         self.assertEqual(h.list, al1)
         self.assertEqual(h.map, {al1.name: al1, ak1.name: ak1})
+        # left has list, right has another list of the same name
+        al3 = Arguments.List('xyzzy', types=int)
+        h = Arguments(al3) + Arguments(al1)
+        self.assertEqual(h.list, al3)
+        self.assertEqual(h.map, {al3.name: al3})
         # left has list, right has different list
         h = Arguments(al1) + Arguments(al2)
         self.assertEqual(h.list, al1)
@@ -23,10 +23,10 @@ from pyerector.path import Path
 from pyerector.config import noop
 from pyerector.helper import normjoin
 from pyerector.exception import Error
-from pyerector.base import Initer, Sequential
+from pyerector.base import Initer, Sequential, Parallel
 from pyerector.targets import Target
 from pyerector.tasks import Task
-from pyerector.iterators import Uptodate
+from pyerector.iterators import Uptodate, Shard
 from pyerector.variables import V
 
 
@@ -155,3 +155,31 @@ class TestSequential(TestCase):
         s = Sequential(1, 2, 3, 4)
         self.assertSequenceEqual(tuple(s), (1, 2, 3, 4))
 
+
+
+class TestParallel(TestCase):
+    def test_shards(self):
+        from pyerector.execute import get_current_stack
+        for name in ('a.py', 'b.py', 'c.py', 'd.py', 'e.py'):
+            (self.dir + name).open('w').close()
+        seen = []
+
+        class Collect(Task):
+            def run(self):
+                seen.extend(self.args)
+        obj = Collect()
+        p = Parallel(obj, files=('*.py',), shards=3)
+        calls = p.get_calls()
+        self.assertEqual([c[0] for c in calls],
+                         ['Collect[0/3]', 'Collect[1/3]', 'Collect[2/3]'])
+        for _, called, args in calls:
+            self.assertIs(called, obj)
+            self.assertIsInstance(args[0], Shard)
+        stack = get_current_stack()
+        stack.push(self)
+        try:
+            p()
+        finally:
+            stack.pop()
+        self.assertEqual(sorted(seen), [Path('a.py'), Path('b.py'),
+            Path('c.py'), Path('d.py'), Path('e.py')])
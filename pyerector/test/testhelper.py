@@ -23,6 +23,7 @@ PyVersionCheck()
 from pyerector.exception import Error
 from pyerector.path import Path
 from pyerector.helper import normjoin, Exclusions, Subcommand, newer, Timer
+from pyerector.helper import SpawnedProcess
 
 try:
     from io import StringIO
@@ -55,6 +56,16 @@ except IOError:
     raise SystemExit('unable to create file')'''
     wc = '''import sys
 sys.stdout.write('%d\\n' % len(sys.stdin.read()))'''
+    env = '''import os, sys
+sys.stdout.write(os.environ.get(sys.argv[1], ''))'''
+    spew = '''import sys
+for stream in (sys.stdout, sys.stderr):
+    stream = getattr(stream, 'buffer', stream)
+    for i in range(int(sys.argv[1])):
+        stream.write(('%05d' % i).encode('ascii') * 20 + b'\\n')'''
+    spawnsleep = '''import subprocess, sys, time
+subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(10)'])
+time.sleep(10)'''
 
 
 class Testnormjoin(TestCase):
@@ -336,9 +347,75 @@ class TestSubcommand(TestCase):
             proc.close()
         proc = Subcommand(
             (sys.executable, '-c', Commands.succeed),
-            stderr=Subcommand.PIPE)
+            stderr=Subcommand.PIPE, wait=False)
         try:
             self.assertEqual(proc.stderr, proc.proc.stderr)
+            proc.wait()  # read by then
+            self.assertEqual(proc.stderr.read(), b'')
+        finally:
+            proc.close()
+
+    def test_drain(self):
+        # much more than a pipe holds, on both pipes
+        proc = Subcommand(
+            (sys.executable, '-c', Commands.spew, '10000'),
+            stdout=Subcommand.PIPE, stderr=Subcommand.PIPE,
+        )
+        try:
+            self.assertEqual(proc.returncode, 0)
+            for stream in (proc.stdout, proc.stderr):
+                lines = stream.read().splitlines()
+                self.assertEqual(len(lines), 10000)
+                self.assertEqual(lines[-1], b'09999' * 20)
+        finally:
+            proc.close()
+
+    def test_limit(self):
+        proc = Subcommand(
+            (sys.executable, '-c', Commands.spew, '10000'),
+            stdout=Subcommand.PIPE, stderr=Subcommand.PIPE, limit=1010,
+        )
+        try:
+            self.assertEqual(proc.returncode, 0)
+            data = proc.stderr.read()
+            self.assertEqual(len(data), 1010)
+            self.assertEqual(data.splitlines()[-1], b'09999' * 20)
+        finally:
+            proc.close()
+
+    def test_callback(self):
+        lines = []
+        errors = []
+        proc = Subcommand(
+            (sys.executable, '-c', Commands.spew, '3'),
+            stdout=lines.append, stderr=errors.append,
+        )
+        try:
+            self.assertEqual(proc.returncode, 0)
+            self.assertIsNone(proc.stdout)
+            self.assertEqual(lines, ['00000' * 20, '00001' * 20, '00002' * 20])
+            self.assertEqual(errors, lines)
+        finally:
+            proc.close()
+
+    def test_timeout(self):
+        if self.platform == 'win':
+            raise SkipTest('Broken OS')
+        from time import time
+        start = time()
+        with self.assertRaises(Error) as context:
+            # the grandchild holds the pipe open too
+            Subcommand(
+                (sys.executable, '-c', Commands.spawnsleep),
+                stdout=Subcommand.PIPE, timeout=0.5,
+            )
+        self.assertEqual(context.exception.args[0], 'ETIMEDOUT')
+        self.assertLess(time() - start, 5)
+        proc = Subcommand(
+            (sys.executable, '-c', Commands.succeed), timeout=5,
+        )
+        try:
+            self.assertEqual(proc.returncode, 0)
         finally:
             proc.close()
 
@@ -361,8 +438,103 @@ class TestSubcommand(TestCase):
     def _test_PIPE(self):
         pass
 
-    def _test_env(self):
-        pass
+    def test_env(self):
+        self.assertIsNone(Subcommand.environment({}))
+        env = Subcommand.environment({'PYERECTOR_SPAM': 1})
+        self.assertEqual(env['PYERECTOR_SPAM'], '1')
+        self.assertIs(Subcommand.environment({'PYERECTOR_SPAM': '1'}), env)
+        os.environ['PYERECTOR_EGGS'] = 'eggs'
+        try:
+            newenv = Subcommand.environment({'PYERECTOR_SPAM': 1})
+            self.assertIsNot(newenv, env)
+            self.assertEqual(newenv['PYERECTOR_EGGS'], 'eggs')
+        finally:
+            del os.environ['PYERECTOR_EGGS']
+        proc = Subcommand(
+            (sys.executable, '-c', Commands.env, 'PYERECTOR_SPAM'),
+            env={'PYERECTOR_SPAM': 'spam'}, stdout=Subcommand.PIPE
+        )
+        try:
+            self.assertEqual(proc.stdout.read().decode('UTF-8'), 'spam')
+        finally:
+            proc.close()
+
+    def test_which(self):
+        if self.platform == 'win':
+            raise SkipTest('Broken OS')
+        dirname, name = os.path.split(os.path.realpath(sys.executable))
+        path = os.pathsep.join(('/programdoesnotexist', dirname))
+        self.assertEqual(Subcommand.which(name, path),
+                         os.path.join(dirname, name))
+        self.assertEqual(Subcommand.programs[(name, path)],
+                         os.path.join(dirname, name))
+        self.assertEqual(Subcommand.which(sys.executable, path),
+                         sys.executable)
+        self.assertEqual(Subcommand.which('programdoesnotexist', path),
+                         'programdoesnotexist')
+
+    def test_relativepath(self):
+        if self.platform == 'win':
+            raise SkipTest('Broken OS')
+        dirname, name = os.path.split(os.path.realpath(sys.executable))
+        # PATH is searched, past its relative directory
+        proc = Subcommand(
+            (name, '-c', Commands.succeed),
+            env={'PATH': os.pathsep.join((os.curdir, dirname))}
+        )
+        try:
+            self.assertNotIsInstance(proc.proc, SpawnedProcess)
+            self.assertEqual(proc.returncode, 0)
+        finally:
+            proc.close()
+        # a program in the current directory but not on PATH is not run
+        tool = self.dir + 'pyerector-tool'
+        tool.open('w').write('#!/bin/sh\nexit 0\n')
+        os.chmod(str(tool), 0o755)
+        savedir = Path.cwd()
+        self.dir.chdir()
+        try:
+            self.assertRaises(Error, Subcommand, ('pyerector-tool',),
+                              env={'PATH': dirname})
+        finally:
+            savedir.chdir()
+            tool.remove()
+
+    def test_spawn(self):
+        proc = Subcommand(
+            (sys.executable, '-c', Commands.succeed),
+        )
+        try:
+            if hasattr(os, 'posix_spawn'):
+                self.assertIsInstance(proc.proc, SpawnedProcess)
+            self.assertEqual(proc.returncode, 0)
+        finally:
+            proc.close()
+        proc = Subcommand(  # a wdir needs Popen
+            (sys.executable, '-c', Commands.fail),
+            wdir=str(self.dir)
+        )
+        try:
+            self.assertNotIsInstance(proc.proc, SpawnedProcess)
+            self.assertEqual(proc.returncode, 1)
+        finally:
+            proc.close()
+
+    def test_rusage(self):
+        if not hasattr(os, 'wait4'):
+            raise SkipTest('no os.wait4')
+        proc = Subcommand(
+            (sys.executable, '-c', Commands.sleep, '0.1'),
+            wait=False
+        )
+        try:
+            self.assertIsNone(proc.rusage)
+            proc.wait()
+            self.assertGreaterEqual(proc.rusage.ru_utime, 0)
+            self.assertGreaterEqual(proc.rusage.ru_stime, 0)
+            self.assertGreater(proc.rusage.ru_maxrss, 0)
+        finally:
+            proc.close()
 
     def test_nowait(self):
         from time import sleep
@@ -17,9 +17,12 @@ except ValueError:
 
 PyVersionCheck()
 
+import os
+import sys
+
 from pyerector.helper import Exclusions
-from pyerector.path import Path
-from pyerector.iterators import Iterator
+from pyerector.path import Path, modified
+from pyerector.iterators import Iterator, walkcache
 from pyerector.iterators import *
 
 class TestIterator(TestCase):
@@ -98,8 +101,10 @@ class TestIterator(TestCase):
     def test_prepend(self):
         obj = Iterator()
         self.assertIsNone(obj.pool)
-        iter(obj)
-        self.assertIsNotNone(obj.pool)
+        cursor = iter(obj)
+        self.assertIsNone(obj.pool)
+        self.assertIsNotNone(cursor.pool)
+        obj = cursor
         obj._prepend('foo')
         self.assertEqual(len(obj.pool), 1)
         self.assertIsInstance(obj.pool[0], Path)
@@ -120,24 +125,33 @@ class TestIterator(TestCase):
 
     def test_iter_(self):
         obj = Iterator('src', 'lib', 'bin')
-        self.assertEqual(iter(obj), obj)
-        self.assertIsInstance(obj.curset, type(iter([])))
-        self.assertEqual(obj.pool, ['src', 'lib', 'bin'])
+        cursor = iter(obj)
+        self.assertIsNot(cursor, obj)
+        self.assertIs(iter(cursor), cursor)
+        self.assertIsInstance(cursor.curset, type(iter([])))
+        self.assertEqual(cursor.pool, ['src', 'lib', 'bin'])
+        self.assertIsNone(obj.pool)
 
     def test_next_(self):
-        obj = Iterator('src', 'lib')
-        iter(obj)
+        obj = iter(Iterator('src', 'lib'))
         self.assertEqual(next(obj), 'src')
         self.assertEqual(next(obj), 'lib')
         self.assertRaises(StopIteration, obj.next)
 
     def testgetnextset(self):
-        obj = Iterator('src', 'lib', 'bin')
-        iter(obj)
+        obj = iter(Iterator('src', 'lib', 'bin'))
         initialset = obj.curset
         self.assertIsNone(obj.getnextset())
         self.assertNotEqual(initialset, obj.curset)
 
+    def testreentrant(self):
+        obj = Iterator('src', 'lib')
+        first, second = iter(obj), iter(obj)
+        self.assertEqual(next(first), 'src')
+        self.assertEqual(tuple(second), ('src', 'lib'))
+        self.assertEqual(tuple(first), ('lib',))
+        self.assertEqual(tuple(obj), ('src', 'lib'))
+
     def testpost_process_candidate(self):
         obj = Iterator()
         self.assertEqual(obj.post_process_candidate(None), None)
@@ -212,7 +226,12 @@ class TestIterator(TestCase):
         self.assertRaises(AttributeError, obj.check_candidate, ('hello.py',))
 
 class TestMapper(TestCase):
-    pass
+    def testmapitem(self):
+        obj = FileMapper(destdir='build', mapper='%(name)sc')
+        self.assertEqual(obj.mapitem(Path('src/foo.py')),
+                         Path('build/src/foo.pyc'))
+        obj = BasenameMapper(destdir='b')
+        self.assertEqual(obj.mapitem(Path('src/foo.py')), Path('b/src/foo'))
 
 
 class TestStaticIterator(TestCase):
@@ -220,7 +239,261 @@ class TestStaticIterator(TestCase):
 
 
 class TestFileIterator(TestCase):
-    pass
+    @classmethod
+    def setUpClass(cls):
+        super(TestFileIterator, cls).setUpClass()
+        for name, size in (('src/foo.py', 10), ('src/bar.c', 100),
+                           ('src/sub/mod.py', 5),
+                           ('src/sub/deep/big.py', 1000)):
+            fname = cls.dir + name
+            fname.dirname.mkdir()
+            fname.open('w').write('x' * size)
+        (cls.dir + 'src' + 'foo.py').utime(1000, 1000)
+        (cls.dir + 'src' + 'link').makelink('foo.py')
+
+    def testsize(self):
+        obj = FileIterator('src', recurse=True, min_size=50)
+        self.assertEqual(tuple(obj),
+                (Path('src/bar.c'), Path('src/sub/deep/big.py')))
+        obj = FileIterator('src', recurse=True, max_size=10, pattern='*.py')
+        self.assertEqual(tuple(obj),
+                (Path('src/foo.py'), Path('src/sub/mod.py')))
+
+    def testnewer_than(self):
+        obj = FileIterator('src', recurse=True, newer_than=2000,
+                           types=('file',))
+        self.assertEqual(tuple(obj),
+                (Path('src/bar.c'), Path('src/sub/deep/big.py'),
+                 Path('src/sub/mod.py')))
+        obj = FileIterator('src', recurse=True, newer_than='src/foo.py',
+                           pattern='*.py')
+        self.assertEqual(tuple(obj),
+                (Path('src/sub/deep/big.py'), Path('src/sub/mod.py')))
+
+    def testtypes(self):
+        obj = FileIterator('src', recurse=True, types=('link',))
+        self.assertEqual(tuple(obj), (Path('src/link'),))
+
+    def testlimit(self):
+        obj = FileIterator('src', recurse=True, limit=2)
+        self.assertEqual(tuple(obj), (Path('src/bar.c'), Path('src/foo.py')))
+        obj = FileMapper(FileIterator('src', recurse=True, limit=1),
+                         destdir='build')
+        self.assertEqual(tuple(obj),
+                ((Path('src/bar.c'), Path('build/src/bar.c')),))
+
+
+class TestWalkCache(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestWalkCache, cls).setUpClass()
+        for name in ('src/foo.py', 'src/sub/mod.py', 'other/bar.py'):
+            fname = cls.dir + name
+            fname.dirname.mkdir()
+            fname.open('w').close()
+
+    def testinactive(self):
+        self.assertIsNone(walkcache.get(FileSet('src', recurse=True)))
+
+    def testshared(self):
+        with walkcache:
+            first = FileSet('src', recurse=True)
+            second = FileSet('src', recurse=True)
+            other = FileSet('src', recurse=True, pattern='*.c')
+            self.assertIs(walkcache.get(first), walkcache.get(second))
+            self.assertIsNot(walkcache.get(first), walkcache.get(other))
+            # interleaved consumers read the same walk
+            iter1, iter2 = iter(first), iter(second)
+            self.assertEqual(next(iter1), Path('src/foo.py'))
+            self.assertEqual(tuple(iter2),
+                    (Path('src/foo.py'), Path('src/sub/mod.py')))
+            self.assertEqual(next(iter1), Path('src/sub/mod.py'))
+            self.assertRaises(StopIteration, next, iter1)
+        self.assertEqual(walkcache.entries, {})
+
+    def testuncacheable(self):
+        with walkcache:
+            obj = FileMapper(FileSet('src'), destdir='build')
+            self.assertIsNone(walkcache.get(obj))
+
+    def testinvalidate(self):
+        with walkcache:
+            obj = FileSet('src', recurse=True)
+            walk = walkcache.get(obj)
+            modified(self.dir + 'other' + 'bar.py')
+            self.assertIs(walkcache.get(obj), walk)
+            fname = self.dir + 'src' + 'sub' + 'new.py'
+            fname.open('w').close()  # Path operations are reported
+            try:
+                self.assertIsNot(walkcache.get(obj), walk)
+                self.assertIn(Path('src/sub/new.py'), tuple(obj))
+                walk = walkcache.get(obj)
+                modified()
+                self.assertIsNot(walkcache.get(obj), walk)
+            finally:
+                fname.remove()
+
+    def testtask(self):
+        from pyerector.tasks import Task
+        fname = self.dir + 'src' + 'written.py'
+        class Writer(Task):
+            def run(self):
+                open(str(fname), 'w').close()  # not through Path
+        with walkcache:
+            obj = FileSet('src', recurse=True)
+            self.assertNotIn(Path('src/written.py'), tuple(obj))
+            try:
+                Writer()()
+                self.assertIn(Path('src/written.py'), tuple(obj))
+            finally:
+                fname.remove()
+
+
+class TestShard(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestShard, cls).setUpClass()
+        for name, size in (('src/a.py', 50), ('src/b.py', 40),
+                           ('src/c.py', 30), ('src/d.py', 20),
+                           ('src/e.py', 10)):
+            fname = cls.dir + name
+            fname.dirname.mkdir()
+            fname.open('w').write('x' * size)
+
+    def testhash(self):
+        files = FileSet('src', recurse=True)
+        shards = [tuple(Shard(files, i, 3)) for i in range(3)]
+        self.assertEqual(sorted(sum(shards, ())), list(files))
+        self.assertEqual([tuple(Shard(files, i, 3)) for i in range(3)],
+                         shards)
+        # a file always lands in the same shard
+        for index, shard in enumerate(shards):
+            for item in shard:
+                self.assertEqual(Shard.hashkey(item) % 3, index)
+
+    def testsize(self):
+        files = FileSet('src', recurse=True)
+        shards = [tuple(Shard(files, i, 2, strategy='size'))
+                  for i in range(2)]
+        self.assertEqual(shards,
+                [(Path('src/a.py'), Path('src/d.py'), Path('src/e.py')),
+                 (Path('src/b.py'), Path('src/c.py'))])
+
+    def testexclude(self):
+        files = FileSet('src', recurse=True)
+        shards = [tuple(Shard(files, i, 2, exclude='a.py')) for i in range(2)]
+        self.assertEqual(sorted(sum(shards, ())),
+                         [Path('src', name)
+                          for name in ('b.py', 'c.py', 'd.py', 'e.py')])
+        shards = [tuple(Shard(files, i, 2, strategy='size', pattern='[bc]*'))
+                  for i in range(2)]
+        self.assertEqual(shards, [(Path('src/b.py'),), (Path('src/c.py'),)])
+        if sys.version_info[0] < 3:
+            # pylint: disable=undefined-variable
+            self.assertEqual(tuple(Shard(files, long(0), long(1))),
+                             tuple(files))
+
+    def testinvalid(self):
+        files = FileSet('src')
+        self.assertRaises(ValueError, Shard, files, 2, 2)
+        self.assertRaises(ValueError, Shard, files, 0, 2, strategy='x')
+
+
+class TestArchiveIterator(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import tarfile
+        import zipfile
+        super(TestArchiveIterator, cls).setUpClass()
+        zfile = zipfile.ZipFile(str(cls.dir + 'a.zip'), 'w')
+        zfile.writestr('pkg/', '')
+        zfile.writestr(zipfile.ZipInfo('pkg/mod.py', (2017, 6, 1, 12, 0, 0)),
+                       'print(1)\n')
+        zfile.writestr('pkg/data.txt', 'data\n')
+        zfile.close()
+        (cls.dir + 'b.txt').open('w').write('tarred\n')
+        tfile = tarfile.open(str(cls.dir + 'a.tgz'), 'w:gz')
+        tfile.add(str(cls.dir + 'b.txt'), 'top/b.txt')
+        tfile.add(str(cls.dir + 'a.zip'), 'top/a.zip')
+        tfile.close()
+
+    def testzip(self):
+        import time
+        members = list(ZipIterator('a.zip'))
+        self.assertEqual(members, [Path('pkg/mod.py'), Path('pkg/data.txt')])
+        self.assertTrue(all(isinstance(m, ArchiveMember) for m in members))
+        self.assertTrue(members[0].isfile)
+        self.assertFalse((self.dir + 'pkg/mod.py').exists)
+        self.assertEqual(len(members[0]), 9)
+        self.assertEqual(members[0].mtime,
+                         time.mktime((2017, 6, 1, 12, 0, 0, 0, 0, -1)))
+        with members[0].open() as infile:
+            self.assertEqual(infile.read(), 'print(1)\n')
+        with members[1].open('rb') as infile:
+            self.assertEqual(infile.read(), b'data\n')
+        self.assertRaises(TypeError, members[1].open, 'w')
+        self.assertEqual(list(ZipIterator('a.zip', pattern='*.py')),
+                         [Path('pkg/mod.py')])
+        self.assertEqual(list(ZipIterator('a.zip', exclude='*.txt')),
+                         [Path('pkg/mod.py')])
+
+    def testtar(self):
+        members = list(TarIterator('a.tgz'))
+        self.assertEqual(members, [Path('top/b.txt'), Path('top/a.zip')])
+        self.assertEqual(members[0].stat.st_size, 7)
+        # read out of order
+        with members[1].open('rb') as infile:
+            self.assertEqual(infile.read(),
+                             (self.dir + 'a.zip').open('rb').read())
+        with members[0].open('rb') as infile:
+            self.assertEqual(infile.read(), b'tarred\n')
+
+    def testhardlink(self):
+        import tarfile
+        name = self.dir + 'h.tgz'
+        tfile = tarfile.open(str(name), 'w:gz')
+        tfile.add(str(self.dir + 'b.txt'), 'top/b.txt')
+        info = tarfile.TarInfo('top/c.txt')
+        info.type = tarfile.LNKTYPE
+        info.linkname = 'top/b.txt'
+        tfile.addfile(info)
+        tfile.close()
+        opened = []
+        def counting(*args, **kwargs):
+            opened.append(args)
+            return topen(*args, **kwargs)
+        topen, tarfile.open = tarfile.open, counting
+        try:
+            members = []
+            for member in TarIterator('h.tgz'):
+                members.append(member)
+                with member.open('rb') as infile:
+                    self.assertEqual(infile.read(), b'tarred\n')
+        finally:
+            tarfile.open = topen
+            name.remove()
+        self.assertEqual(members, [Path('top/b.txt'), Path('top/c.txt')])
+        self.assertEqual(members[1].stat.st_size, 7)
+        # the headers and data were read through one handle
+        self.assertEqual(len(opened), 1)
+
+    def testclosed(self):
+        fddir = '/proc/self/fd'
+        if not os.path.isdir(fddir):
+            raise SkipTest('no %s' % fddir)
+        count = len(os.listdir(fddir))
+        for _ in range(5):
+            self.assertEqual(len(list(ZipIterator('a.zip'))), 2)
+            self.assertEqual(len(list(TarIterator('a.tgz'))), 2)
+        self.assertEqual(len(os.listdir(fddir)), count)
+        # read in turn, the archive is open until the last is closed
+        for members in (list(ZipIterator('a.zip')),
+                        list(TarIterator('a.tgz'))):
+            for member in members:
+                with member.open('rb') as infile:
+                    infile.read()
+                    self.assertGreater(len(os.listdir(fddir)), count)
+            self.assertEqual(len(os.listdir(fddir)), count)
 
 
 class TestFileList(TestCase):
@@ -228,7 +501,21 @@ class TestFileList(TestCase):
 
 
 class TestDirList(TestCase):
-    pass
+    @classmethod
+    def setUpClass(cls):
+        super(TestDirList, cls).setUpClass()
+        for name in ('src/foo.py', 'src/sub/mod.py', 'src/sub/deep/big.py'):
+            fname = cls.dir + name
+            fname.dirname.mkdir()
+            fname.open('w').close()
+
+    def testmax_depth(self):
+        obj = DirList('src', max_depth=1)
+        self.assertEqual(tuple(obj),
+                (Path('src'), Path('src/foo.py'), Path('src/sub')))
+        obj = DirList('src', max_depth=2, types='dir')
+        self.assertEqual(tuple(obj),
+                (Path('src'), Path('src/sub'), Path('src/sub/deep')))
 
 
 class TestFileSet(TestCase):
@@ -250,3 +537,65 @@ class TestMergeMapper(TestCase):
 class TestUptodate(TestCase):
     pass
 
+
+class TestSetIterator(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(TestSetIterator, cls).setUpClass()
+        for name in ('src/foo.py', 'src/bar.c', 'src/vendor/lib.py',
+                     'src/vendor/sub/mod.py', 'test/testfoo.py'):
+            fname = cls.dir + name
+            fname.dirname.mkdir()
+            fname.open('w').close()
+
+    def testunion(self):
+        obj = FileSet('src', recurse=True) | FileSet('test', 'src',
+                                                    recurse=True)
+        self.assertIsInstance(obj, Union)
+        self.assertEqual(tuple(obj),
+                (Path('src/bar.c'), Path('src/foo.py'),
+                 Path('src/vendor/lib.py'), Path('src/vendor/sub/mod.py'),
+                 Path('test/testfoo.py')))
+
+    def testintersection(self):
+        obj = FileSet('src', 'test', recurse=True) & FileSet('src/vendor')
+        self.assertIsInstance(obj, Intersection)
+        self.assertEqual(tuple(obj),
+                (Path('src/vendor/lib.py'), Path('src/vendor/sub/mod.py')))
+
+    def testdifference(self):
+        obj = FileSet('src', recurse=True) - FileSet('src/vendor')
+        self.assertIsInstance(obj, Difference)
+        self.assertEqual(tuple(obj), (Path('src/bar.c'), Path('src/foo.py')))
+        obj = FileSet('src', recurse=True) - \
+              FileSet('src/vendor', recurse=True, pattern='lib*')
+        self.assertEqual(tuple(obj),
+                (Path('src/bar.c'), Path('src/foo.py'),
+                 Path('src/vendor/sub/mod.py')))
+
+    def testprune(self):
+        left = FileSet('src', recurse=True)
+        obj = left - FileSet('src/vendor')
+        walked = []
+        def prune(candidate):
+            walked.append(candidate.value)
+            return False
+        left.prune = prune
+        try:
+            tuple(obj)
+        finally:
+            del left.prune
+        self.assertNotIn('src/vendor/lib.py', walked)
+        self.assertIsNone(left.prune)
+
+    def testexclude(self):
+        obj = Union(FileSet('src', recurse=True), exclude='vendor')
+        self.assertEqual(tuple(obj), (Path('src/bar.c'), Path('src/foo.py')))
+
+    def testlazyappend(self):
+        inner = FileSet('test', recurse=True)
+        obj = FileIterator()
+        obj.append(inner)
+        self.assertIs(obj.path[0], inner)
+        self.assertEqual(tuple(obj), (Path('test/testfoo.py'),))
+
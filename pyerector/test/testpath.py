@@ -306,11 +306,71 @@ class TestPath(TestCase):
         o = Path(self.tpath, 'copy.2')
         f.open().write(data)
         self.assertEqual(len(f), 256)
-        f.copy(o)
+        self.assertEqual(f.copy(o), 256)
         self.assertTrue(o.isfile)
         self.assertEqual(len(o), 256)
         self.assertEqual(o.open().read(), data)
+        self.assertEqual(o.mtime, f.mtime)
         self.assertRaises(IOError, n.copy, o)
+        # sparse files keep their size and contents
+        s = Path(self.tpath, 'copy.3')
+        with s.open('wb') as sfile:
+            sfile.seek(1 << 20)
+            sfile.write(data.encode('ascii'))
+            sfile.truncate(2 << 20)
+        self.assertLessEqual(s.copy(o), 2 << 20)
+        self.assertEqual(len(o), 2 << 20)
+        self.assertEqual(o.open('rb').read(), s.open('rb').read())
+
+    def test_copy_link(self):
+        f = Path(self.tpath, 'link.0')
+        f.open('w').write('data')
+        for link in ('hard', 'symlink', 'reflink', 'auto', 'copy'):
+            o = Path(self.tpath, 'link.%s' % link)
+            # a reflink falls back to copying on most file systems
+            self.assertIn(f.copy(o, link=link),
+                          {'copy': (4,), 'reflink': (0, 4)}.get(link, (0,)))
+            self.assertEqual(open(o.value).read(), 'data')
+        f.refresh()
+        self.assertEqual(Path(self.tpath, 'link.hard').stat.st_nlink,
+                         f.stat.st_nlink)
+        self.assertGreaterEqual(f.stat.st_nlink, 2)
+        self.assertTrue(Path(self.tpath, 'link.symlink').islink)
+        self.assertRaises(ValueError, f.copy, o, link='bogus')
+        # copying onto a link does not write through it
+        nlink = f.stat.st_nlink
+        f.copy(Path(self.tpath, 'link.hard'))
+        f.refresh()
+        self.assertEqual(f.stat.st_nlink, nlink - 1)
+
+    def test_samecontent(self):
+        a = Path(self.tpath, 'same.0')
+        b = Path(self.tpath, 'same.1')
+        c = Path(self.tpath, 'same.2')
+        a.open('w').write('x' * 100000)
+        b.open('w').write('x' * 100000)
+        c.open('w').write('x' * 99999 + 'y')
+        self.assertTrue(a.samecontent(b))
+        self.assertFalse(a.samecontent(c))
+        self.assertFalse(a.samecontent(Path(self.tpath, 'same.none')))
+
+    def test_breaklink(self):
+        f = Path(self.tpath, 'break.0')
+        f.open('w').write('data')
+        h = Path(self.tpath, 'break.1')
+        s = Path(self.tpath, 'break.2')
+        f.copy(h, link='hard')
+        f.copy(s, link='symlink')
+        self.assertTrue(h.breaklink())
+        self.assertTrue(s.breaklink())
+        self.assertFalse(h.breaklink())
+        for fname in (h, s):
+            self.assertTrue(fname.isfile)
+            self.assertEqual(fname.open().read(), 'data')
+            fname.open('w').write('changed')
+        self.assertEqual(f.open().read(), 'data')
+        f.refresh()
+        self.assertEqual(f.stat.st_nlink, 1)
 
     def test_cwd(self):
         scd = os.path.abspath(os.curdir)
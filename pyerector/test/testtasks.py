@@ -20,10 +20,15 @@ except ValueError:
 PyVersionCheck()
 
 from pyerector.path import Path
-from pyerector.exception import Error
-from pyerector.variables import V
+from pyerector.exception import Abort, Error
+from pyerector.variables import V, Variable, VariableSet
+from pyerector.iterators import FileIterator, FileMapper, TarIterator, \
+    ZipIterator
 from pyerector.tasks import *
 from pyerector.tasks import Task, IteratorTask, MapperTask
+from pyerector.tasks._streams import ParallelGzipWriter, TarIndex
+from pyerector.tasks.filter import LineEndingFilter, ShebangFilter, \
+    TokenFilter
 
 
 class TestTask(TestCase):
@@ -35,6 +40,32 @@ class TestTask(TestCase):
         self.assertEqual(obj.args, ('foobar', 'xyzzy'))
         self.assertEqual(obj.kwargs, {'widget': True})
 
+    def test_reentrant(self):
+        import threading
+        from pyerector.execute import PyThread
+        running = threading.Event()
+        seen = []
+
+        class WaitingTask(Task):
+            def run(self):
+                seen.append(None)
+                if len(seen) == 2:
+                    running.set()
+                running.wait(5)  # both calls are running now
+                seen.append(self.args)
+        obj = WaitingTask()
+        threads = [PyThread(target=obj, args=(name,))
+                   for name in ('left', 'right')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertTrue(running.is_set())
+        self.assertEqual(sorted(s for s in seen if s),
+                         [('left',), ('right',)])
+        obj('main')
+        self.assertEqual(obj.args, ('main',))
+
     def test_failure(self):
 
         class SuccessTask(Task):
@@ -129,7 +160,27 @@ class TestChmod(TestCase):
 
 
 class TestContainer(TestCase):
-    pass
+    def testmembers(self):
+        from pyerector.tasks._container import Members
+        from pyerector.helper import Exclusions
+        top = self.dir + 'members'
+        for name in ('a/b', 'a-c', 'a/d/e', 'f', 'x/y.pyc', 'a/skip'):
+            fname = top + name
+            fname.dirname.mkdir()
+            fname.open('w').write(name)
+        top.refresh()
+        try:
+            members = Members(
+                [top, top + 'a/b', top + 'f'], Exclusions(['x'], False),
+                lambda fname: fname.components[-1] == 'skip'
+            )
+            members.append(self.dir + 'extra')
+            expected = [top + name for name in ('a-c', 'a/b', 'a/d/e', 'f')]
+            self.assertEqual(list(members),
+                             [self.dir + 'extra'] + expected)
+            self.assertEqual(list(members), list(members))
+        finally:
+            top.remove()
 
 
 class TestCopy(TestCase):
@@ -165,6 +216,70 @@ class TestCopy(TestCase):
         self.assertEqual('bye\n', open(os.path.join(self.dest, 'b')).read())
         self.assertEqual('xyzzy\n', open(os.path.join(self.dest, 'c')).read())
 
+    def testnested(self):
+        for name in ('x/y/z/a', 'x/y/b', 'x/c'):
+            fname = self.fullsrc + name
+            fname.dirname.mkdir()
+            fname.open('w').write(name)
+        Copy(self.src, dest=self.dest, recurse=True)()
+        for name in ('x/y/z/a', 'x/y/b', 'x/c'):
+            fname = self.fulldest + self.src + name
+            self.assertEqual(fname.open().read(), name)
+        # nothing is copied when up to date
+        dname = self.fulldest + self.src + 'x/c'
+        dname.open('w').write('newer')
+        Copy(self.src, dest=self.dest, recurse=True)()
+        self.assertEqual(dname.open().read(), 'newer')
+
+    def testfanout(self):
+        Copy('a', 'b', dest=(self.dest, 'dest2', 'dest3'))()
+        try:
+            for dest in (self.dest, 'dest2', 'dest3'):
+                self.assertEqual(open(os.path.join(dest, 'a')).read(),
+                                 'hi\n')
+                self.assertEqual(open(os.path.join(dest, 'b')).read(),
+                                 'bye\n')
+            # only the destination that is not up to date is written
+            (self.dir + 'dest2' + 'a').open('w').write('newer')
+            (self.dir + 'dest3' + 'a').remove()
+            Copy('a', dest=(self.dest, 'dest2', 'dest3'))()
+            self.assertEqual((self.dir + 'dest2' + 'a').open().read(),
+                             'newer')
+            self.assertEqual((self.dir + 'dest3' + 'a').open().read(),
+                             'hi\n')
+        finally:
+            (self.dir + 'dest2').remove()
+            (self.dir + 'dest3').remove()
+
+    def testmapperclass(self):
+        class BackupMapper(FileMapper):
+            def map(self, item):
+                return item.addext('.bak')
+        class BackupCopy(Copy):
+            mapperclass = BackupMapper
+        BackupCopy('a', dest=self.dest)()
+        self.assertEqual((self.fulldest + 'a.bak').open().read(), 'hi\n')
+        BackupCopy('b', dest=(self.dest, 'dest2'))()
+        try:
+            for dest in (self.dest, 'dest2'):
+                self.assertEqual((self.dir + dest + 'b.bak').open().read(),
+                                 'bye\n')
+                self.assertFalse((self.dir + dest + 'b').exists)
+        finally:
+            (self.dir + 'dest2').remove()
+
+    def testif_changed(self):
+        Copy('a', dest=self.dest)()
+        dname = self.fulldest + 'a'
+        dname.utime(1000, 1000)
+        (self.dir + 'a').open('w').write('hi\n')  # same bytes, newer
+        Copy('a', dest=self.dest, if_changed=True)()
+        self.assertEqual(dname.mtime, 1000)
+        (self.dir + 'a').open('w').write('ho\n')
+        Copy('a', dest=self.dest, if_changed=True)()
+        self.assertEqual(dname.open().read(), 'ho\n')
+        self.assertNotEqual(dname.mtime, 1000)
+
     def _testexclusion(self):
         src = os.path.join(self.dir, 'src')
         dest = os.path.join(self.dir, 'dest')
@@ -181,7 +296,46 @@ class TestCopy(TestCase):
         self.assertEqual('xyzzy\n', open(os.path.join(dest, 'c').read()))
 
 class TestCopyTree(TestCase):
-    pass
+    def testmirror(self):
+        src = self.dir + 'mirror'
+        dest = self.dir + 'mirrored'
+        for name in ('a', 'sub/b', 'gone/c'):
+            fname = src + name
+            fname.dirname.mkdir()
+            fname.open('w').write(name)
+        CopyTree(srcdir='mirror', dstdir='mirrored', mirror=True)()
+        self.assertEqual((dest + 'mirror/sub/b').open().read(), 'sub/b')
+        (src + 'gone').remove()
+        (src + 'a').open('w').write('changed')
+        (dest + 'mirror/stale').open('w').write('stale')
+        (dest + 'mirror/stale.keep').open('w').write('excluded')
+        CopyTree(srcdir='mirror', dstdir='mirrored', mirror=True,
+                 compare='checksum', parallel=2, exclude='*.keep')()
+        self.assertEqual((dest + 'mirror/a').open().read(), 'changed')
+        self.assertFalse((dest + 'mirror/stale').exists)
+        self.assertFalse((dest + 'mirror/gone').exists)
+        self.assertTrue((dest + 'mirror/stale.keep').exists)
+        self.assertRaises(ValueError,
+                          CopyTree(srcdir='mirror', dstdir='mirrored',
+                                   mirror=True, compare='bogus'))
+
+    def testsymlink(self):
+        if self.platform == 'win':
+            raise SkipTest('Broken OS')
+        src = self.dir + 'linksrc'
+        dest = self.dir + 'linked'
+        (src + 'a').dirname.mkdir()
+        (src + 'a').open('w').write('a')
+        CopyTree(srcdir='linksrc', dstdir='linked', mirror=True,
+                 link='symlink')()
+        self.assertTrue((dest + 'linksrc/a').islink)
+        # the links are up to date: nothing is copied again
+        task = CopyTree(srcdir='linksrc', dstdir='linked', mirror=True,
+                        link='symlink')
+        copied = []
+        task.copyfile = lambda pair: copied.append(pair) or 0
+        task()
+        self.assertEqual(copied, [])
 
 
 class TestDownload(TestCase):
@@ -193,11 +347,157 @@ class TestEcho(TestCase):
 
 
 class TestEgg(TestCase):
-    pass
+    def setUp(self):
+        self.savedir = Path.cwd()
+        self.dir.chdir()
+        self.src = self.dir + 'eggsrc'
+        (self.src + 'pkg').mkdir()
+        (self.src + 'pkg' + '__init__.py').open('w').write('# pkg\n')
+        (self.src + 'setup.py').open('w').write('''\
+from distutils import setup
+setup(name='foo', version='1.0', description='Foo', url='', author='',
+      author_email='', license='', download_url='', long_description='')
+''')
+    def tearDown(self):
+        self.savedir.chdir()
+        self.src.remove()
+
+    def testuptodate(self):
+        import zipfile
+        name = self.src + 'foo-1.0.egg'
+        Egg('eggsrc/pkg', name='eggsrc/foo-1.0.egg', root='eggsrc')()
+        zfile = zipfile.ZipFile(str(name))
+        try:
+            names = zfile.namelist()
+            self.assertEqual(sorted(names), [
+                'EGG-INFO/PKG-INFO', 'EGG-INFO/SOURCES.txt',
+                'EGG-INFO/dependency_links.txt', 'EGG-INFO/top_level.txt',
+                'EGG-INFO/zip-safe', 'pkg/__init__.py',
+            ])
+            self.assertEqual(zfile.read('EGG-INFO/top_level.txt'),
+                             ('foo' + os.linesep).encode('ascii'))
+            self.assertEqual(zfile.read('EGG-INFO/SOURCES.txt'),
+                             ('pkg/__init__.py' + os.linesep).encode('ascii'))
+        finally:
+            zfile.close()
+        # nothing changed: the egg is left alone
+        inode = os.stat(str(name)).st_ino
+        Egg('eggsrc/pkg', name='eggsrc/foo-1.0.egg', root='eggsrc')()
+        self.assertEqual(os.stat(str(name)).st_ino, inode)
+
+
+class TestFilter(TestCase):
+    def setUp(self):
+        self.savedir = Path.cwd()
+        self.dir.chdir()
+        (self.dir + 'fsrc').mkdir()
+    def tearDown(self):
+        self.savedir.chdir()
+        (self.dir + 'fsrc').remove()
+        (self.dir + 'fout').remove()
+
+    def testchain(self):
+        script = self.dir + 'fsrc/run.py'
+        script.open('wb').write(
+            b'#!/usr/bin/python -u\r\nprint("@VERSION@")\r\n' +
+            b'# @VERSION@\r\n' * 5000
+        )
+        script.chmod(int('755', 8))
+        tokens = VariableSet(Variable('@VERSION@', '1.2'))
+        task = Filter('fsrc/run.py', dest='fout', filters=(
+            ShebangFilter('/usr/bin/python3'), TokenFilter(tokens),
+            LineEndingFilter(),
+        ))
+        task.blocksize = 10  # a "\r\n" and the tokens span the blocks
+        task()
+        output = self.dir + 'fout/fsrc/run.py'
+        self.assertEqual(output.open('rb').read(),
+                         b'#!/usr/bin/python3 -u\nprint("1.2")\n' +
+                         b'# 1.2\n' * 5000)
+        self.assertEqual(output.mode, int('755', 8))
+
+    def testfilters(self):
+        def run(item, *blocks):
+            item = item.start()
+            return ''.join(item.feed(block) for block in blocks) + \
+                item.flush()
+        self.assertEqual(run(ShebangFilter('/bin/sh'), '#!/bin/', 'bash'),
+                         '#!/bin/sh')
+        self.assertEqual(run(ShebangFilter('/bin/sh'), 'echo', ' hi\n'),
+                         'echo hi\n')
+        self.assertEqual(run(LineEndingFilter('\r\n'), 'a\r', '\nb\rc\n'),
+                         'a\r\nb\r\nc\r\n')
+        self.assertRaises(ValueError, LineEndingFilter, 'x')
 
 
 class TestHashGen(TestCase):
-    pass
+    def setUp(self):
+        import zipfile
+        self.savedir = Path.cwd()
+        self.dir.chdir()
+        zfile = zipfile.ZipFile(str(self.dir + 'h.zip'), 'w')
+        zfile.writestr('pkg/a.txt', 'hashed\n')
+        zfile.close()
+    def tearDown(self):
+        self.savedir.chdir()
+        (self.dir + 'h.zip').remove()
+        (self.dir + 'sums').remove()
+
+    def testhashes(self):
+        import hashlib
+        (self.dir + 'sums').mkdir()
+        for i in range(4):
+            (self.dir + 'sums' + ('f%d' % i)).open('w').write('%d\n' % i)
+        files = FileIterator('sums', pattern='f*', recurse=True)
+        HashGen(files, hashs=('sha256', 'sha512', 'md5'), threads=3)()
+        for i in range(4):
+            data = ('%d\n' % i).encode()
+            for name in ('sha256', 'sha512', 'md5'):
+                self.assertEqual(
+                    (self.dir + ('sums/f%d.%s' % (i, name))).open().read(),
+                    hashlib.new(name, data).hexdigest() + '\n'
+                )
+        self.assertRaises(ValueError, HashGen(files, hashs='bogus'))
+
+    def testmanifest(self):
+        import hashlib
+        (self.dir + 'sums').mkdir()
+        for i in range(3):
+            (self.dir + 'sums' + ('f%d' % i)).open('w').write('%d\n' % i)
+        files = FileIterator('sums', pattern='f*', recurse=True)
+        HashGen(files, hashs='sha256', manifest='sums/SHA256SUMS')()
+        self.assertEqual(
+            (self.dir + 'sums/SHA256SUMS').open().read(),
+            '# sha256\n' + ''.join('%s  f%d\n' % (
+                hashlib.sha256(('%d\n' % i).encode()).hexdigest(), i)
+                for i in range(3))
+        )
+        self.assertFalse((self.dir + 'sums/f0.sha256').exists)
+        # another hash: rewritten, though no file is newer
+        HashGen(files, hashs='sha512', manifest='sums/SHA256SUMS')()
+        self.assertEqual(
+            (self.dir + 'sums/SHA256SUMS').open().read().splitlines()[1],
+            '%s  f0' % hashlib.sha512(b'0\n').hexdigest()
+        )
+        HashGen(files, hashs=('md5', 'sha1'), manifest='SUMS')()
+        lines = (self.dir + 'SUMS').open().read().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1], 'SHA1 (sums/f0) = %s' %
+                         hashlib.sha1(b'0\n').hexdigest())
+        self.assertEqual(HashGen.listed(self.dir + 'SUMS'),
+                         (['md5', 'sha1'], ['sums/f0', 'sums/f1', 'sums/f2']))
+        HashGen(files, hashs=('sha1', 'sha256'), manifest='SUMS')()
+        lines = (self.dir + 'SUMS').open().read().splitlines()
+        self.assertEqual(lines[1], 'SHA256 (sums/f0) = %s' %
+                         hashlib.sha256(b'0\n').hexdigest())
+        (self.dir + 'SUMS').remove()
+
+    def testmembers(self):
+        from hashlib import md5
+        HashGen(ZipIterator('h.zip'), dest='sums', hashs='md5')()
+        self.assertEqual((self.dir + 'sums/pkg/a.txt.md5').open().read(),
+                         md5(b'hashed\n').hexdigest() + '\n')
+        self.assertFalse((self.dir + 'pkg').exists)
 
 
 class TestJava(TestCase):
@@ -208,8 +508,98 @@ class TestMkdir(TestCase):
     pass
 
 
+class TestMultiArchive(TestCase):
+    def setUp(self):
+        self.savedir = Path.cwd()
+        self.dir.chdir()
+        self.src = self.dir + 'multisrc'
+        (self.src + 'sub').mkdir()
+        (self.src + 'a').open('w').write('a' * 10000)
+        (self.src + 'sub' + 'b').open('w').write('bye\n')
+        (self.src + 'sub' + 'c.skip').open('w').write('excluded\n')
+    def tearDown(self):
+        self.savedir.chdir()
+        self.src.remove()
+        for name in ('m.zip', 'm.tgz', '.m.zip.manifest', '.m.tgz.manifest'):
+            (self.dir + name).remove()
+
+    def testarchives(self):
+        import tarfile
+        import zipfile
+        MultiArchive('multisrc', exclude='*.skip', maxsize=100, archives=(
+            Zip(name='m.zip', compression='deflated', exclude='*.skip'),
+            Tar(name='m.tgz', root='multisrc', exclude='*.pyc'),
+        ))()
+        zfile = zipfile.ZipFile(str(self.dir + 'm.zip'))
+        try:
+            self.assertEqual(zfile.namelist(),
+                             ['multisrc/a', 'multisrc/sub/b'])
+            self.assertEqual(zfile.read('multisrc/a'), b'a' * 10000)
+        finally:
+            zfile.close()
+        tfile = tarfile.open(str(self.dir + 'm.tgz'))
+        try:
+            self.assertEqual(tfile.getnames(), ['a', 'sub/b', 'sub/c.skip'])
+            self.assertEqual(tfile.extractfile('sub/c.skip').read(),
+                             b'excluded\n')
+        finally:
+            tfile.close()
+
+    def testchannel(self):
+        from pyerector.tasks._streams import Channel
+        channel = Channel(4)
+        for item in (('a', b'1'), ('b', None), ('d', b'4'), None):
+            channel.put(item)
+        self.assertIsNone(channel.get(Path('0')))
+        self.assertEqual(channel.get(Path('a')).read(), b'1')
+        self.assertIsNone(channel.get(Path('b')))  # too large
+        self.assertIsNone(channel.get(Path('c')))
+        self.assertEqual(channel.get(Path('d')).read(), b'4')
+        self.assertIsNone(channel.get(Path('e')))
+        channel.close()
+        channel.put(('f', b''))  # does not wait once closed
+
+
 class TestPyCompile(TestCase):
-    pass
+    def setUp(self):
+        self.savedir = Path.cwd()
+        self.dir.chdir()
+        self.src = self.dir + 'pysrc'
+        (self.src + 'sub').mkdir()
+        for name in ('a.py', 'sub/b.py', 'sub/c.py'):
+            (self.src + name).open('w').write('x = %r\n' % name)
+        (self.src + 'sub/bad.py').open('w').write('def (:\n')
+        (self.src + 'notes.txt').open('w').write('not python\n')
+    def tearDown(self):
+        self.savedir.chdir()
+        self.src.remove()
+
+    def compiled(self):
+        from pyerector.tasks._pycworker import cachefile
+        return dict((name, os.stat(cachefile(str(self.src + name))).st_mtime)
+                    for name in ('a.py', 'sub/b.py', 'sub/c.py'))
+
+    def testinline(self):
+        import sys
+        from pyerector.tasks._pycworker import cachefile, fresh
+        PyCompile('pysrc', version=sys.version[:1])()
+        first = self.compiled()
+        self.assertFalse(os.path.exists(cachefile(str(self.src + 'notes.txt'))))
+        self.assertFalse(fresh(str(self.src + 'sub/bad.py')))
+        self.assertTrue(fresh(str(self.src + 'a.py')))
+        for name in first:  # so a recompile would show
+            os.utime(cachefile(str(self.src + name)), (1, 1))
+        PyCompile('pysrc', version=sys.version[:1])()
+        self.assertEqual(set(self.compiled().values()), set([1]))
+        os.utime(str(self.src + 'a.py'), (1, 1))
+        self.assertFalse(fresh(str(self.src + 'a.py')))
+
+    def testworkers(self):
+        import sys
+        from pyerector.tasks._pycworker import fresh
+        PyCompile('pysrc', version=sys.version[:1], workers=2)()
+        for name in ('a.py', 'sub/b.py', 'sub/c.py'):
+            self.assertTrue(fresh(str(self.src + name)))
 
 
 class TestRemove(TestCase):
@@ -221,7 +611,20 @@ class TestScp(TestCase):
 
 
 class TestShebang(TestCase):
-    pass
+    def setUp(self):
+        self.savedir = Path.cwd()
+        self.dir.chdir()
+    def tearDown(self):
+        self.savedir.chdir()
+        (self.dir + 'sb.py').remove()
+        (self.dir + 'sbout').remove()
+
+    def testprogram(self):
+        (self.dir + 'sb.py').open('wb').write(
+            b'#!/usr/bin/env python\n\xe9\n')
+        Shebang('sb.py', dest='sbout', program='/opt/python')()
+        self.assertEqual((self.dir + 'sbout/sb.py').open('rb').read(),
+                         b'#!/opt/python python\n\xe9\n')
 
 
 class TestSpawn(TestCase):
@@ -241,11 +644,191 @@ class TestSymlink(TestCase):
 
 
 class TestTar(TestCase):
-    pass
+    def setUp(self):
+        self.savedir = Path.cwd()
+        self.dir.chdir()
+        self.src = self.dir + 'tarsrc'
+        (self.src + 'sub').mkdir()
+        (self.src + 'a').open('w').write('a' * 1000)
+        (self.src + 'sub' + 'b').open('w').write('bye\n')
+        (self.src + 'c').makelink('a')
+    def tearDown(self):
+        self.savedir.chdir()
+        self.src.remove()
+
+    def check(self, name, mode='r:*'):
+        import tarfile
+        tfile = tarfile.open(str(self.dir + name), mode)
+        try:
+            self.assertEqual(sorted(tfile.getnames()),
+                             ['tarsrc/a', 'tarsrc/c', 'tarsrc/sub/b'])
+            self.assertEqual(tfile.extractfile('tarsrc/sub/b').read(),
+                             b'bye\n')
+            self.assertEqual(tfile.getmember('tarsrc/c').linkname, 'a')
+        finally:
+            tfile.close()
+            (self.dir + name).remove()
+            (self.dir + ('.%s.manifest' % name)).remove()
+
+    def testownfiles(self):
+        import tarfile
+        name = self.src + 't.tgz'
+        for _ in range(2):  # the second run sees the first's files
+            Tar('tarsrc', name=str(name), exclude='*.pyc')()
+            tfile = tarfile.open(str(name), 'r:*')
+            try:
+                self.assertEqual(sorted(tfile.getnames()),
+                                 ['tarsrc/a', 'tarsrc/c', 'tarsrc/sub/b'])
+            finally:
+                tfile.close()
+        for fname in (self.dir.abs + 'tarsrc', '.'):
+            Tar(str(fname), name='o.tgz', exclude='*.pyc')()
+            tfile = tarfile.open(str(self.dir + 'o.tgz'), 'r:*')
+            try:
+                names = [os.path.basename(member)
+                         for member in tfile.getnames()]
+                self.assertNotIn('o.tgz', names)
+                self.assertNotIn('.o.tgz.manifest', names)
+                self.assertNotIn('.o.tgz.manifest.new', names)
+            finally:
+                tfile.close()
+            (self.dir + 'o.tgz').remove()
+            (self.dir + '.o.tgz.manifest').remove()
+
+    def testarchivemembers(self):
+        import tarfile
+        import zipfile
+        Zip('tarsrc', name='t.zip', compression='deflated')()
+        Tar(ZipIterator('t.zip'), name='t.tgz', threads=2)()
+        tfile = tarfile.open(str(self.dir + 't.tgz'))
+        try:
+            self.assertEqual(tfile.getnames(),
+                             ['tarsrc/a', 'tarsrc/c', 'tarsrc/sub/b'])
+            self.assertEqual(tfile.extractfile('tarsrc/c').read(),
+                             b'a' * 1000)  # the link was followed
+        finally:
+            tfile.close()
+        self.assertFalse((self.dir + 'tarsrc.zip').exists)
+        # the zipfile module writes bzip2
+        Zip(TarIterator('t.tgz'), name='t2.zip',
+            compression='bzip2' if hasattr(zipfile, 'ZIP_BZIP2') else
+            'deflated')()
+        zfile = zipfile.ZipFile(str(self.dir + 't2.zip'))
+        try:
+            self.assertEqual(zfile.read('tarsrc/sub/b'), b'bye\n')
+        finally:
+            zfile.close()
+        for name in ('t.zip', 't.tgz', 't2.zip'):
+            (self.dir + name).remove()
+            (self.dir + ('.%s.manifest' % name)).remove()
+
+    def testcompression(self):
+        import tarfile
+        for compression in ('gz', 'bz2', 'xz', 'none'):
+            if compression == 'xz' and 'xz' not in tarfile.TarFile.OPEN_METH:
+                self.assertRaises(ValueError,
+                                  Tar('tarsrc', name='t.tar.xz',
+                                      compression='xz', exclude='*.pyc',
+                                      digests='sha256'))
+                # nothing is left behind
+                self.assertFalse((self.dir + 't.tar.xz').exists)
+                self.assertFalse((self.dir + 't.tar.xz.sha256').exists)
+                continue
+            Tar('tarsrc', name='t.tar', compression=compression, level=1,
+                exclude='*.pyc')()
+            self.check('t.tar')
+        self.assertRaises(ValueError,
+                          Tar('tarsrc', name='t.tar', compression='bogus'))
+
+    def testthreads(self):
+        Tar('tarsrc', name='t.tgz', threads=2, exclude='*.pyc')()
+        self.check('t.tgz', 'r:gz')
+
+    def testdigests(self):
+        import hashlib
+        name = self.dir + 't.tgz'
+        for threads in (1, 2):
+            Tar('tarsrc', name='t.tgz', threads=threads, exclude='*.pyc',
+                digests=('sha256', 'md5'))()
+            data = name.open('rb').read()
+            for digest in ('sha256', 'md5'):
+                dname = self.dir + ('t.tgz.%s' % digest)
+                self.assertEqual(dname.open().read(),
+                                 hashlib.new(digest, data).hexdigest() + '\n')
+                dname.remove()
+            self.check('t.tgz')
+
+    def testdigestfiles(self):
+        import hashlib
+        import tarfile
+        name = self.src + 't.tgz'
+        digest = self.src + 't.tgz.sha256'
+        Tar('tarsrc', name=str(name), digests='sha256', exclude='*.pyc')()
+        expected = digest.open().read()
+        Tar('tarsrc', name=str(name), digests='sha256', exclude='*.pyc')()
+        tfile = tarfile.open(str(name), 'r:*')
+        try:
+            self.assertEqual(sorted(tfile.getnames()),
+                             ['tarsrc/a', 'tarsrc/c', 'tarsrc/sub/b'])
+        finally:
+            tfile.close()
+        # uptodate, but the digest file is written again
+        digest.remove()
+        Tar('tarsrc', name=str(name), digests='sha256', exclude='*.pyc')()
+        self.assertEqual(digest.open().read(), expected)
+        self.assertEqual(expected, hashlib.sha256(
+            name.open('rb').read()).hexdigest() + '\n')
+
+    def testparallelgzip(self):
+        import gzip
+        data = os.urandom(5000) + b'x' * 5000
+        name = str(self.dir + 'p.gz')
+        with ParallelGzipWriter(open(name, 'wb'), 6, 3, 1024) as out:
+            for start in range(0, len(data), 700):
+                out.write(data[start:start+700])
+        infile = gzip.open(name, 'rb')
+        try:
+            self.assertEqual(infile.read(), data)
+        finally:
+            infile.close()
+            os.remove(name)
 
 
 class TestTokenize(TestCase):
-    pass
+    def setUp(self):
+        import tarfile
+        self.savedir = Path.cwd()
+        self.dir.chdir()
+        (self.dir + 'tok.in').open('w').write('version @VERSION@\n')
+        tfile = tarfile.open(str(self.dir + 'tok.tgz'), 'w:gz')
+        tfile.add('tok.in', 'conf/tok.in')
+        tfile.close()
+    def tearDown(self):
+        self.savedir.chdir()
+        for name in ('tok.in', 'tok.tgz', 'out'):
+            (self.dir + name).remove()
+
+    def teststream(self):
+        tokens = VariableSet(Variable('@V@', 'short'),
+                             Variable('@V@.x', 'long'),
+                             Variable('a|b(c)', 'odd'))
+        text = ('@V@ @V@.x a|b(c) ' * 200).encode()
+        (self.dir + 'tok.in').open('wb').write(text)
+        task = Tokenize('tok.in', tokenmap=tokens)
+        task.blocksize = 7  # tokens span the blocks
+        task()
+        self.assertEqual((self.dir + 'tok.in').open().read(),
+                         'short long odd ' * 200)
+        mtime = (self.dir + 'tok.in').mtime
+        os.utime(str(self.dir + 'tok.in'), (mtime - 10, mtime - 10))
+        Tokenize('tok.in', tokenmap=tokens)()
+        self.assertEqual((self.dir + 'tok.in').mtime, mtime - 10)
+
+    def testmembers(self):
+        tokens = VariableSet(Variable('@VERSION@', '1.2'))
+        Tokenize(TarIterator('tok.tgz'), dest='out', tokenmap=tokens)()
+        self.assertEqual((self.dir + 'out/conf/tok.in').open().read(),
+                         'version 1.2\n')
 
 
 class TestTouch(TestCase):
@@ -261,13 +844,222 @@ class TestUnittest(TestCase):
 
 
 class TestUntar(TestCase):
-    pass
+    def setUp(self):
+        self.savedir = Path.cwd()
+        self.dir.chdir()
+        self.src = self.dir + 'src'
+        self.src.mkdir()
+        for i in range(40):
+            (self.src + ('f%02d.txt' % i)).open('w').write(
+                ''.join('%d %d\n' % (i, j) for j in range(8000))
+            )
+        (self.src + 'odd.dat').open('w').write('odd\n')
+        self.name = self.dir + 'u.tgz'
+        self.dest = self.dir + 'untarred'
+    def tearDown(self):
+        self.savedir.chdir()
+        for path in (self.src, self.name, self.dest,
+                     self.dir + '.u.tgz.index',
+                     self.dir + '.u.tgz.manifest'):
+            path.remove()
+
+    def check(self, *names):
+        for name in names:
+            self.assertEqual(
+                (self.dest + 'src' + name).open().read(),
+                (self.src + name).open().read()
+            )
+
+    def testindex(self):
+        Tar('src', name='u.tgz', threads=3, index=True)()
+        index = TarIndex.load('u.tgz')
+        self.assertEqual(len(index.members), 41)
+        self.assertTrue(len(index.points) > 1)
+        Untar('src/f3?.txt', 'src/odd.dat', name='u.tgz', root='untarred')()
+        self.check('f31.txt', 'f39.txt', 'odd.dat')
+        self.assertFalse((self.dest + 'src/f29.txt').exists)
+
+    def testbuild(self):
+        Tar('src', name='u.tgz', threads=3)()
+        self.assertIsNone(TarIndex.load('u.tgz'))
+        Untar('src/f01.txt', name='u.tgz', root='untarred', index=True)()
+        self.check('f01.txt')
+        built = TarIndex.load('u.tgz')
+        Tar('src', name='u.tgz', threads=3, index=True)()
+        self.assertEqual(built.members, TarIndex.load('u.tgz').members)
+        self.assertEqual(built.points, TarIndex.load('u.tgz').points)
+
+    def testhardlink(self):
+        if self.platform == 'win':
+            raise SkipTest('Broken OS')
+        os.link(str(self.src + 'f05.txt'), str(self.src + 'hard.txt'))
+        Tar('src', name='u.tgz', threads=3, index=True)()
+        Untar('src/hard.txt', name='u.tgz', root='untarred')()
+        self.check('hard.txt')
+        self.assertFalse((self.dest + 'src/f05.txt').exists)
+
+    def testemptyroot(self):
+        # an empty directory is a false Path, but still the destination
+        Tar('src', name='u.tgz', index=True)()
+        for index in (True, False):
+            self.dest.mkdir()
+            if not index:
+                (self.dir + '.u.tgz.index').remove()
+            Untar('src/odd.dat', name='u.tgz', root=Path('untarred'))()
+            self.check('odd.dat')
+            self.dest.remove()
+
+    def teststream(self):
+        Tar('src', name='u.tgz')()
+        Untar('src/f0*', name='u.tgz', root='untarred', stream=True)()
+        self.check('f00.txt', 'f09.txt')
+        self.assertFalse((self.dest + 'src/f10.txt').exists)
 
 
 class TestUnzip(TestCase):
-    pass
+    def setUp(self):
+        import zipfile
+        self.savedir = Path.cwd()
+        self.dir.chdir()
+        self.name = self.dir + 'u.zip'
+        self.dest = self.dir + 'unzipped'
+        zfile = zipfile.ZipFile(str(self.name), 'w')
+        zfile.writestr('top/a.txt', 'a' * 100000)
+        zfile.writestr('top/sub/b.txt', 'bye\n')
+        zfile.writestr('top/sub/c.dat', 'data\n')
+        zfile.writestr('../evil', 'outside\n')
+        zfile.close()
+    def tearDown(self):
+        self.savedir.chdir()
+        self.name.remove()
+        self.dest.remove()
+
+    def testextract(self):
+        Unzip('*.txt', name='u.zip', root='unzipped', threads=3)()
+        self.assertEqual((self.dest + 'top/a.txt').open().read(),
+                         'a' * 100000)
+        self.assertEqual((self.dest + 'top/sub/b.txt').open().read(),
+                         'bye\n')
+        self.assertFalse((self.dest + 'top/sub/c.dat').exists)
+        self.assertFalse((self.dir + 'evil').exists)
+        Unzip('top/sub/c.dat', name='u.zip', root='unzipped')()
+        self.assertTrue((self.dest + 'top/sub/c.dat').exists)
+
+    def testemptyroot(self):
+        # an empty directory is a false Path, but still the destination
+        self.dest.mkdir()
+        Unzip('top/sub/b.txt', name='u.zip', root=Path('unzipped'))()
+        self.assertTrue((self.dest + 'top/sub/b.txt').exists)
+        self.assertFalse((self.dir + 'top').exists)
+
+    def testverify(self):
+        Unzip(name='u.zip', root='unzipped', verify=True, threads=2)()
+        self.assertFalse(self.dest.exists)
+        data = self.name.open('rb').read()
+        pos = data.index(b'bye')
+        with open(str(self.name), 'wb') as outfile:
+            outfile.write(data[:pos] + b'BYE' + data[pos + 3:])
+        self.assertRaises(Abort,
+                          Unzip(name='u.zip', root='unzipped', verify=True))
 
 
 class TestZip(TestCase):
-    pass
+    def setUp(self):
+        self.savedir = Path.cwd()
+        self.dir.chdir()
+        self.src = self.dir + 'zipsrc'
+        (self.src + 'sub').mkdir()
+        (self.src + 'a').open('w').write('a' * 10000)
+        (self.src + 'sub' + 'b').open('w').write('bye\n')
+    def tearDown(self):
+        self.savedir.chdir()
+        self.src.remove()
+
+    def testcompression(self):
+        import zipfile
+        for compression, threads in (('stored', 1), ('deflated', 1),
+                                     ('deflated', 3)):
+            name = self.dir + 'z.zip'
+            Zip('zipsrc', name='z.zip', compression=compression, level=1,
+                threads=threads, zip64=False, exclude='*.pyc')()
+            zfile = zipfile.ZipFile(str(name))
+            try:
+                self.assertIsNone(zfile.testzip())
+                self.assertEqual(zfile.namelist(),
+                                 ['zipsrc/a', 'zipsrc/sub/b'])
+                self.assertEqual(zfile.read('zipsrc/sub/b'), b'bye\n')
+                info = zfile.getinfo('zipsrc/a')
+                self.assertEqual(info.compress_type,
+                                 getattr(zipfile,
+                                         'ZIP_' + compression.upper()))
+                self.assertEqual(info.file_size, 10000)
+            finally:
+                zfile.close()
+                name.remove()
+        self.assertRaises(ValueError,
+                          Zip('zipsrc', name='z.zip', compression='bogus'))
+
+    def testlevel(self):
+        import zipfile
+        if not hasattr(zipfile, 'ZIP_BZIP2'):
+            raise SkipTest('no bzip2 in zipfile')
+        name = self.dir + 'z.zip'
+        task = Zip('zipsrc', name='z.zip', compression='bzip2', level=1,
+                   exclude='*.pyc')
+        if sys.version_info < (3, 7):
+            self.assertRaises(ValueError, task)
+            self.assertFalse(name.exists)
+            return
+        task()
+        zfile = zipfile.ZipFile(str(name))
+        try:
+            self.assertIsNone(zfile.testzip())
+            self.assertEqual(zfile.getinfo('zipsrc/a').compress_type,
+                             zipfile.ZIP_BZIP2)
+        finally:
+            zfile.close()
+            name.remove()
+
+    def testdigests(self):
+        import hashlib
+        name = self.dir + 'z.zip'
+        Zip('zipsrc', name='z.zip', compression='deflated', threads=2,
+            exclude='*.pyc', digests='sha1')()
+        try:
+            self.assertEqual((self.dir + 'z.zip.sha1').open().read(),
+                             hashlib.sha1(name.open('rb').read()).hexdigest()
+                             + '\n')
+        finally:
+            name.remove()
+            (self.dir + 'z.zip.sha1').remove()
+            (self.dir + '.z.zip.manifest').remove()
+
+    def testincremental(self):
+        import zipfile
+        name = self.dir + 'z.zip'
+        sidecar = self.dir + '.z.zip.manifest'
+        try:
+            Zip('zipsrc', name='z.zip', compression='deflated',
+                exclude='*.pyc')()
+            self.assertTrue(sidecar.isfile)
+            # nothing changed: the archive is left alone
+            inode = os.stat(str(name)).st_ino
+            Zip('zipsrc', name='z.zip', compression='deflated',
+                exclude='*.pyc')()
+            self.assertEqual(os.stat(str(name)).st_ino, inode)
+            # one member changed: the other is copied from the archive
+            (self.src + 'sub' + 'b').open('w').write('changed\n')
+            Zip('zipsrc', name='z.zip', compression='deflated',
+                exclude='*.pyc')()
+            zfile = zipfile.ZipFile(str(name))
+            try:
+                self.assertIsNone(zfile.testzip())
+                self.assertEqual(zfile.read('zipsrc/sub/b'), b'changed\n')
+                self.assertEqual(zfile.read('zipsrc/a'), b'a' * 10000)
+            finally:
+                zfile.close()
+            self.assertNotEqual(os.stat(str(name)).st_ino, inode)
+        finally:
+            name.remove()
+            sidecar.remove()
 
@@ -80,10 +80,9 @@ class VCSBase(Base):
                     (destdir and str(destdir) or str(self.rootdir),),
             wait=True,
             stderr=Subcommand.PIPE,
+            limit=Subcommand.ERRLIMIT,
         )
-        proc.wait()
         if proc.returncode < 0:
-            proc.stderr.read().rstrip()
             raise Error(self, 'signal received %d' % abs(proc.returncode))
         elif proc.returncode > 0:
             errput = proc.stderr.read().rstrip()
@@ -117,8 +116,8 @@ class DVCSBase(Base):
             wait=True,
             wdir=str(self.rootdir),
             stderr=Subcommand.PIPE,
+            limit=Subcommand.ERRLIMIT,
         )
-        proc.wait()
         if proc.returncode < 0:
             raise Error(self, 'signal received %d' % abs(proc.returncode))
         elif proc.returncode > 0: